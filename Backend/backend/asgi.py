@@ -9,9 +9,11 @@ django_asgi_app = get_asgi_application()
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import device.routing
+from backend.lifespan import lifespan
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app, 
+    "lifespan": lifespan,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             device.routing.websocket_urlpatterns
@@ -0,0 +1,18 @@
+"""
+Gunicorn worker serving ``backend.asgi`` with Uvicorn (HTTP and WebSocket).
+
+Adds to the stock worker:
+- lifespan events, to warm up and shut down cleanly (backend/lifespan.py)
+- gunicorn's ``worker_connections`` as the most connections, HTTP and
+  WebSocket together, one worker serves at a time; beyond that Uvicorn
+  answers 503 instead of slowing every connection down
+"""
+from uvicorn_worker import UvicornWorker
+
+
+class Worker(UvicornWorker):
+    CONFIG_KWARGS = {'loop': 'auto', 'http': 'auto', 'lifespan': 'on'}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.limit_concurrency = self.cfg.worker_connections
@@ -0,0 +1,30 @@
+"""
+Database connections of work run off the event loop.
+
+Under ASGI the ORM runs on the request's own thread (``sync_to_async`` is
+thread sensitive by default) and Django gives that thread's connection back
+when the request finishes. Work that must not wait for the request, like
+AppLog writes, runs on the loop's executor threads instead
+(``thread_sensitive=False``), and nothing closes their connections: every
+such thread would keep one checked out of the pool for good.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def db_sync_to_async(func):
+    """
+    ``sync_to_async(func, thread_sensitive=False)`` for code using the ORM.
+    The thread's connections go back to the pool (or are closed, unless
+    persistent) when the call returns.
+    """
+    @wraps(func)
+    def inner(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(inner, thread_sensitive=False)
@@ -0,0 +1,83 @@
+"""
+ASGI lifespan hooks of the production server (see gunicorn.conf.py).
+
+Uvicorn sends ``lifespan.startup`` before a worker accepts connections and
+``lifespan.shutdown`` after it stopped accepting them. Startup warms what
+the first requests would otherwise pay for: importing every view, the
+device registry (whose query opens the database pool) and the Redis backed
+clients. Shutdown writes pending AppLog summaries and closes the database
+pool and the channel layer's connections. Warming is best effort: on
+failure the worker starts cold, as it did before.
+
+Daphne (``manage.py runserver``) sends no lifespan events; everything is
+then set up on first use.
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    from device.event_stream import get_event_stream
+    from device.rate_limit import get_rate_limiter
+    from device.registry import get_device_registry
+    from users.log_policy import get_log_aggregator
+
+    # Resolving the URL patterns imports every view module
+    get_resolver().url_patterns
+    get_log_aggregator()
+    get_rate_limiter()
+    get_event_stream()
+    try:
+        return get_device_registry().warm()
+    finally:
+        # Requests never run on this thread, its connection would only idle
+        connections.close_all()
+
+
+def shut_down():
+    from users.log_policy import get_log_aggregator
+
+    try:
+        get_log_aggregator().flush()
+    finally:
+        # Disconnect the worker's pooled connections now rather than when the process dies
+        for connection in connections.all():
+            close_pool = getattr(connection, 'close_pool', None)
+            if close_pool is not None:
+                close_pool()
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            threads = getattr(settings, 'ASGI_THREADS', 0)
+            if threads:
+                # Runs sync_to_async(thread_sensitive=False) calls, e.g. push notifications
+                asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=threads))
+            try:
+                devices = await sync_to_async(warm_up, thread_sensitive=False)()
+                logger.info(f"Worker warmed up, {devices} devices cached")
+            except Exception as e:
+                logger.error(f"Warm-up failed, starting cold: {e}")
+            await send({'type': 'lifespan.startup.complete'})
+
+        elif message['type'] == 'lifespan.shutdown':
+            try:
+                await sync_to_async(shut_down, thread_sensitive=False)()
+                close_pools = getattr(get_channel_layer(), 'close_pools', None)
+                if close_pools is not None:
+                    await close_pools()
+            except Exception as e:
+                logger.error(f"Shutdown hook failed: {e}")
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
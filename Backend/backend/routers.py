@@ -0,0 +1,154 @@
+"""
+Database router sending heavy reads to a read replica.
+
+Analytics, report downloads and the admin log views read a lot and write
+almost nothing; on the primary they compete with device ingest. Views
+decorated with ``@reads_from_replica`` read from ``DB_REPLICA_ALIAS``;
+every other view, and every write, uses the primary.
+
+The replica is only used while it keeps up: its lag is checked at most every
+``DB_REPLICA_LAG_CHECK_SECONDS``, and reads stay on the primary while it is
+more than ``DB_REPLICA_MAX_LAG_SECONDS`` behind, cannot be reached or has no
+streaming WAL receiver (replication broke). Without a replica in
+``DATABASES`` the decorator changes nothing.
+"""
+import contextvars
+import logging
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+# Alias reads of the current view go to, None for the primary
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+# Whether the replica streams from the primary, and the seconds it is behind: none
+# when it has replayed everything it received, however long ago the primary last
+# wrote. Without a streaming WAL receiver both LSNs stop together, so a replica
+# whose replication broke would look caught up; it is reported as not streaming.
+# A role that cannot read pg_stat_wal_receiver (see pg_read_all_stats) sees no
+# status, and reads then stay on the primary.
+_LAG_QUERY = """
+    SELECT
+        NOT pg_is_in_recovery()
+            OR EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming'),
+        CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END
+"""
+
+
+class ReplicaMonitor:
+    def __init__(self, alias, max_lag, check_interval):
+        self.alias = alias
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._usable = False
+        self._checked_until = 0
+        self._lock = threading.Lock()
+
+    def lag(self):
+        """Seconds the replica is behind the primary, None when it cannot be reached or does not replicate"""
+        connection = connections[self.alias]
+        try:
+            if connection.vendor != 'postgresql':
+                # A local stand-in, e.g. a second SQLite file, does not replicate
+                connection.ensure_connection()
+                return 0.0
+            with connection.cursor() as cursor:
+                cursor.execute(_LAG_QUERY)
+                streaming, lag = cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Read replica '{self.alias}' unavailable: {e}")
+            return None
+        if not streaming:
+            logger.error(f"Read replica '{self.alias}' is not streaming from the primary, its data may be stale")
+            return None
+        # No transaction replayed yet, the lag is unknown
+        return None if lag is None else float(lag)
+
+    def usable(self):
+        """Whether reads may go to the replica, checked at most every ``check_interval`` seconds"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._checked_until:
+                return self._usable
+            # Other requests keep the last answer while this one checks
+            self._checked_until = now + self.check_interval
+        lag = self.lag()
+        usable = lag is not None and lag <= self.max_lag
+        if usable != self._usable:
+            if usable:
+                logger.info(f"Reading from replica '{self.alias}' ({lag:.1f}s behind)")
+            elif lag is not None:
+                logger.warning(f"Replica '{self.alias}' is {lag:.1f}s behind, reading from the primary")
+        self._usable = usable
+        return usable
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_replica_monitor():
+    """Return the monitor of the configured replica, or None when there is none"""
+    global _monitor
+    alias = getattr(settings, 'DB_REPLICA_ALIAS', 'replica')
+    if alias not in settings.DATABASES:
+        return None
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                _monitor = ReplicaMonitor(
+                    alias,
+                    max_lag=getattr(settings, 'DB_REPLICA_MAX_LAG_SECONDS', 30),
+                    check_interval=getattr(settings, 'DB_REPLICA_LAG_CHECK_SECONDS', 5),
+                )
+    return _monitor
+
+
+def reads_from_replica(view):
+    """
+    Run the reads of ``view`` against the replica while it is usable.
+    Decorate outside ``@api_view``, or ``dispatch`` of a class based view.
+    Querysets read after the view returned (streamed responses) must be
+    pinned with ``.using(router.db_for_read(Model))`` inside it.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        monitor = get_replica_monitor()
+        token = _read_alias.set(monitor.alias if monitor is not None and monitor.usable() else None)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+
+    return wrapped
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Also for objects that were read from the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        aliases = {DEFAULT_DB_ALIAS, getattr(settings, 'DB_REPLICA_ALIAS', 'replica')}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema by replication
+        if db == getattr(settings, 'DB_REPLICA_ALIAS', 'replica'):
+            return False
+        return None
@@ -55,6 +55,8 @@ MIDDLEWARE = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+# Continuation cursor of capped PDF log exports
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor']
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -69,6 +71,8 @@ SIMPLE_JWT = {
 
 ROOT_URLCONF = 'backend.urls'
 ASGI_APPLICATION = 'backend.asgi.application'
+# Threads per server worker for blocking work run off the event loop (0: Python's default)
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", "0"))
 
 TEMPLATES = [
     {
@@ -85,6 +89,21 @@ TEMPLATES = [
     },
 ]
 
+# Database connections. With DB_POOL every worker process keeps a psycopg pool
+# (Django's pool support, needs psycopg 3) of DB_POOL_MIN_SIZE to DB_POOL_MAX_SIZE
+# connections, so a request does not pay a TCP and TLS handshake. Keep workers x
+# DB_POOL_MAX_SIZE below the server's max_connections. Without the pool,
+# DB_CONN_MAX_AGE keeps each thread's connection open that many seconds; leave it
+# at 0 under ASGI, where every request runs in a new thread.
+DB_POOL = os.getenv("DB_POOL", "True") == "True"
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Seconds after which a pooled connection is replaced
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "0"))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -93,12 +112,40 @@ DATABASES = {
         'PASSWORD': os.getenv("DB_PASSWORD"),
         'HOST': os.getenv("DB_HOST"),
         'PORT': os.getenv("DB_PORT"),
+        # The pool manages connection lifetimes itself
+        'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+        # Check a reused connection before handing it out, so a dropped one is replaced
+        'CONN_HEALTH_CHECKS': os.getenv("DB_CONN_HEALTH_CHECKS", "True") == "True",
         'OPTIONS': {
-            'sslmode': 'require'
+            'sslmode': 'require',
+            **({'pool': {
+                'min_size': DB_POOL_MIN_SIZE,
+                'max_size': DB_POOL_MAX_SIZE,
+                'timeout': DB_POOL_TIMEOUT,
+                'max_lifetime': DB_POOL_MAX_LIFETIME,
+            }} if DB_POOL else {}),
         }
     }
 }
 
+# Read replica for analytics, report downloads and the admin logs (backend/routers.py),
+# added when DB_REPLICA_HOST is set. Those reads stay on the primary while the replica
+# is more than DB_REPLICA_MAX_LAG_SECONDS behind or unreachable.
+DB_REPLICA_ALIAS = os.getenv("DB_REPLICA_ALIAS", "replica")
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "30"))
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.getenv("DB_REPLICA_LAG_CHECK_SECONDS", "5"))
+if os.getenv("DB_REPLICA_HOST"):
+    DATABASES[DB_REPLICA_ALIAS] = {
+        **DATABASES['default'],
+        'HOST': os.getenv("DB_REPLICA_HOST"),
+        'PORT': os.getenv("DB_REPLICA_PORT", os.getenv("DB_PORT")),
+        'USER': os.getenv("DB_REPLICA_USER", os.getenv("DB_USER")),
+        'PASSWORD': os.getenv("DB_REPLICA_PASSWORD", os.getenv("DB_PASSWORD")),
+        # Tests read the primary through this alias
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['backend.routers.ReplicaRouter']
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
@@ -134,6 +181,90 @@ CHANNEL_LAYERS = {
     },
 }
 
+# WebSocket outbound coalescing: events are buffered per connection for this
+# window and flushed as one array frame, capped in size and event count
+WS_BATCH_WINDOW_MS = int(os.getenv("WS_BATCH_WINDOW_MS", "150"))
+WS_MAX_FRAME_BYTES = int(os.getenv("WS_MAX_FRAME_BYTES", str(64 * 1024)))
+WS_MAX_FRAME_EVENTS = int(os.getenv("WS_MAX_FRAME_EVENTS", "100"))
+# Backpressure: bound on queued events per connection, and how far behind a
+# client may fall before it is disconnected as a slow consumer
+WS_MAX_PENDING_EVENTS = int(os.getenv("WS_MAX_PENDING_EVENTS", "500"))
+WS_SLOW_CONSUMER_SECONDS = int(os.getenv("WS_SLOW_CONSUMER_SECONDS", "30"))
+
+# Replayable realtime event stream: a capped Redis stream shared by all
+# workers, or a per-process in-memory stand-in when Redis is not configured
+EVENT_STREAM_BACKEND = os.getenv("EVENT_STREAM_BACKEND", "redis" if os.getenv("REDIS_URL") else "memory")
+EVENT_STREAM_REDIS_URL = os.getenv("REDIS_URL")
+EVENT_STREAM_KEY = os.getenv("EVENT_STREAM_KEY", "realtime:events")
+EVENT_STREAM_MAXLEN = int(os.getenv("EVENT_STREAM_MAXLEN", "10000"))
+EVENT_STREAM_REPLAY_LIMIT = int(os.getenv("EVENT_STREAM_REPLAY_LIMIT", "500"))
+
+# AppLog rows are queued in memory and written in batches by a background
+# thread; set APPLOG_ASYNC=False to write them inline instead
+APPLOG_ASYNC = os.getenv("APPLOG_ASYNC", "True") == "True"
+APPLOG_BATCH_SIZE = int(os.getenv("APPLOG_BATCH_SIZE", "100"))
+APPLOG_FLUSH_INTERVAL_MS = int(os.getenv("APPLOG_FLUSH_INTERVAL_MS", "1000"))
+APPLOG_MAX_QUEUE = int(os.getenv("APPLOG_MAX_QUEUE", "10000"))
+APPLOG_SAMPLE_RATE = int(os.getenv("APPLOG_SAMPLE_RATE", "10"))
+# Days each log level is kept for by the prune_app_logs command,
+# e.g. APPLOG_RETENTION_DAYS="DEBUG:7,INFO:30,SUCCESS:30,WARNING:90,ERROR:180"
+APPLOG_RETENTION_DAYS = {
+    level.strip().upper(): int(days)
+    for level, days in (
+        item.split(":") for item in os.getenv(
+            "APPLOG_RETENTION_DAYS", "DEBUG:7,INFO:30,SUCCESS:30,WARNING:90,ERROR:180"
+        ).split(",") if item.strip()
+    )
+}
+# Row cap of one PDF log export, larger exports continue via X-Next-Cursor
+LOG_EXPORT_PDF_MAX_ROWS = int(os.getenv("LOG_EXPORT_PDF_MAX_ROWS", "5000"))
+# Repetitive events (device readings) are logged in full only when their
+# state changes, otherwise as one summary per device per interval; 0 logs
+# every event
+APPLOG_AGGREGATE_INTERVAL_SECONDS = int(os.getenv("APPLOG_AGGREGATE_INTERVAL_SECONDS", "60"))
+APPLOG_AGGREGATE_MAX_KEYS = int(os.getenv("APPLOG_AGGREGATE_MAX_KEYS", "50000"))
+
+# Fleet status counters (device/fleet_status.py): a Redis hash shared by all
+# workers, or the FleetCounter table when Redis is not configured
+FLEET_STATUS_BACKEND = os.getenv("FLEET_STATUS_BACKEND", "redis" if os.getenv("REDIS_URL") else "database")
+FLEET_STATUS_REDIS_URL = os.getenv("REDIS_URL")
+FLEET_STATUS_REDIS_KEY = os.getenv("FLEET_STATUS_REDIS_KEY", "fleet:status")
+# A device is offline once it has not reported for this long
+DEVICE_OFFLINE_AFTER_SECONDS = int(os.getenv("DEVICE_OFFLINE_AFTER_SECONDS", "300"))
+# How often the sweeper looks for offline devices, and recounts all buckets
+FLEET_SWEEP_INTERVAL_SECONDS = int(os.getenv("FLEET_SWEEP_INTERVAL_SECONDS", "30"))
+FLEET_RECONCILE_SECONDS = int(os.getenv("FLEET_RECONCILE_SECONDS", "3600"))
+
+# In-process device registry (device/registry.py) used by ingest and heartbeats.
+# Invalidations are shared through Redis pub/sub; the TTL bounds staleness
+# when Redis is unavailable
+DEVICE_REGISTRY_MAX_ENTRIES = int(os.getenv("DEVICE_REGISTRY_MAX_ENTRIES", "10000"))
+DEVICE_REGISTRY_TTL_SECONDS = int(os.getenv("DEVICE_REGISTRY_TTL_SECONDS", "300"))
+DEVICE_REGISTRY_REDIS_URL = os.getenv("REDIS_URL")
+DEVICE_REGISTRY_CHANNEL = os.getenv("DEVICE_REGISTRY_CHANNEL", "device:registry:invalidate")
+
+# Shared secret devices pass as ?token= on the ws/device/<id>/ ingest connection,
+# no check when unset (same as the HTTP ingest endpoint)
+DEVICE_INGEST_TOKEN = os.getenv("DEVICE_INGEST_TOKEN")
+
+# Compressed device uploads are rejected with 413 past this many decompressed bytes
+DEVICE_UPLOAD_MAX_DECOMPRESSED_BYTES = int(os.getenv("DEVICE_UPLOAD_MAX_DECOMPRESSED_BYTES", str(10 * 1024 * 1024)))
+# Readings accepted per device-data/batch/ request
+DEVICE_BATCH_MAX_READINGS = int(os.getenv("DEVICE_BATCH_MAX_READINGS", "5000"))
+
+# Firmware retries are recognised by their idempotency key for this long without a query
+INGEST_IDEMPOTENCY_TTL_SECONDS = int(os.getenv("INGEST_IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# Without an explicit key the device timestamp TS identifies a reading; turn off for devices without NTP
+INGEST_DEDUPE_ON_TIMESTAMP = os.getenv("INGEST_DEDUPE_ON_TIMESTAMP", "True") == "True"
+
+# Token buckets admitting device readings, per device and fleet-wide (a rate of 0 turns a limit off)
+INGEST_RATE_LIMIT_BACKEND = os.getenv("INGEST_RATE_LIMIT_BACKEND", "redis" if os.getenv("REDIS_URL") else "memory")
+INGEST_RATE_LIMIT_REDIS_URL = os.getenv("REDIS_URL")
+DEVICE_INGEST_RATE = float(os.getenv("DEVICE_INGEST_RATE", "1"))
+DEVICE_INGEST_BURST = int(os.getenv("DEVICE_INGEST_BURST", "10"))
+INGEST_GLOBAL_RATE = float(os.getenv("INGEST_GLOBAL_RATE", "500"))
+INGEST_GLOBAL_BURST = int(os.getenv("INGEST_GLOBAL_BURST", "1000"))
+
 CACHES = {
     'default': {
         "BACKEND": "django_redis.cache.RedisCache",
@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from device.models import Device
+
+from .routers import ReplicaMonitor, ReplicaRouter, reads_from_replica
+
+REPLICA = 'test_replica'
+
+# A second SQLite database standing in for the replica, holding rows the primary
+# does not. Declared on import so the test runner creates and migrates it.
+settings.DATABASES.setdefault(REPLICA, {'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'test_replica.sqlite3'})
+connections.configure_settings(settings.DATABASES)
+
+
+@reads_from_replica
+def device_names(request):
+    names = list(Device.objects.order_by('name').values_list('name', flat=True))
+    Device.objects.create(name='Written by the view', floor_number=1, room_number='101')
+    return JsonResponse({'names': names})
+
+
+@override_settings(DB_REPLICA_ALIAS=REPLICA, DB_REPLICA_MAX_LAG_SECONDS=30, DB_REPLICA_LAG_CHECK_SECONDS=0)
+class ReplicaRoutingTests(TestCase):
+    databases = {DEFAULT_DB_ALIAS, REPLICA}
+
+    @classmethod
+    def setUpTestData(cls):
+        Device.objects.using(REPLICA).bulk_create([Device(name='On the replica', floor_number=1, room_number='101')])
+
+    def setUp(self):
+        Device.objects.create(name='On the primary', floor_number=1, room_number='101')
+        # A monitor of the test replica, not one left by another test
+        patcher = mock.patch('backend.routers._monitor', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def names(self):
+        return device_names(RequestFactory().get('/')).content.decode()
+
+    def test_reads_go_to_the_replica_and_writes_to_the_primary(self):
+        self.assertEqual(self.names(), '{"names": ["On the replica"]}')
+        self.assertTrue(Device.objects.using(DEFAULT_DB_ALIAS).filter(name='Written by the view').exists())
+        self.assertFalse(Device.objects.using(REPLICA).filter(name='Written by the view').exists())
+
+    def test_reads_stay_on_the_primary_while_the_replica_is_unusable(self):
+        with mock.patch.object(ReplicaMonitor, 'lag', return_value=None):
+            self.assertEqual(self.names(), '{"names": ["On the primary"]}')
+
+    def test_reads_after_the_view_use_the_primary(self):
+        self.names()
+        names = list(Device.objects.order_by('name').values_list('name', flat=True))
+        self.assertEqual(names, ['On the primary', 'Written by the view'])
+
+
+class ReplicaMonitorTests(SimpleTestCase):
+    def usable(self, lag, max_lag=30):
+        monitor = ReplicaMonitor(REPLICA, max_lag=max_lag, check_interval=0)
+        with mock.patch.object(monitor, 'lag', return_value=lag):
+            return monitor.usable()
+
+    def test_usable_while_within_the_max_lag(self):
+        self.assertTrue(self.usable(0.0))
+        self.assertTrue(self.usable(30.0))
+
+    def test_falls_back_when_too_far_behind(self):
+        self.assertFalse(self.usable(30.5))
+
+    def test_falls_back_when_the_lag_is_unknown(self):
+        # Unreachable, not streaming, or nothing replayed yet
+        self.assertFalse(self.usable(None))
+
+    def test_lag_is_checked_once_per_interval(self):
+        monitor = ReplicaMonitor(REPLICA, max_lag=30, check_interval=60)
+        with mock.patch.object(monitor, 'lag', return_value=0.0) as lag:
+            self.assertTrue(monitor.usable())
+            lag.return_value = None
+            self.assertTrue(monitor.usable())
+        self.assertEqual(lag.call_count, 1)
+
+
+@override_settings(DB_REPLICA_ALIAS=REPLICA)
+class ReplicaRouterTests(SimpleTestCase):
+    def test_no_migrations_on_the_replica(self):
+        router = ReplicaRouter()
+        self.assertIs(router.allow_migrate(REPLICA, 'device', 'device'), False)
+        self.assertIsNone(router.allow_migrate(DEFAULT_DB_ALIAS, 'device', 'device'))
+
+    def test_writes_go_to_the_primary(self):
+        self.assertEqual(ReplicaRouter().db_for_write(Device), DEFAULT_DB_ALIAS)
@@ -0,0 +1,100 @@
+"""
+Benchmark of database connection handling: latency of a request's database
+work with a new connection per request, with persistent connections and with
+the psycopg pool (see DATABASES in backend/settings.py).
+
+    python benchmark_db_connections.py [--requests 500] [--modes fresh,persistent,pool]
+
+Runs against the PostgreSQL database configured through DB_*, the pool needs
+psycopg 3. Each mode runs in its own process, its settings set through the
+environment. Requests run as under ASGI: each in its own thread sensitive
+context, between request_started and request_finished, with one query. Also
+counts the server connections (backends) that answered, so connections
+opened and never reused show up.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = {
+    'fresh': {'DB_POOL': 'False', 'DB_CONN_MAX_AGE': '0'},
+    'persistent': {'DB_POOL': 'False', 'DB_CONN_MAX_AGE': '600'},
+    'pool': {'DB_POOL': 'True'},
+}
+
+
+def run_mode(count):
+    """Serve ``count`` requests in this process, print their timings as JSON"""
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    from asgiref.sync import ThreadSensitiveContext, sync_to_async
+    from django.core.handlers.asgi import ASGIHandler
+    from django.core.signals import request_finished, request_started
+    from django.db import connection
+
+    def handle():
+        request_started.send(sender=ASGIHandler)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                return cursor.fetchone()[0]
+        finally:
+            request_finished.send(sender=ASGIHandler)
+
+    async def serve():
+        latencies, backends = [], set()
+        for _ in range(count):
+            started = time.perf_counter()
+            async with ThreadSensitiveContext():
+                backends.add(await sync_to_async(handle)())
+            latencies.append(time.perf_counter() - started)
+        return latencies, backends
+
+    latencies, backends = asyncio.run(serve())
+    print(json.dumps({'latencies': latencies, 'backends': len(backends)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--modes', default=','.join(MODES), help=f"Comma separated, of {', '.join(MODES)}")
+    parser.add_argument('--run', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(args.requests)
+        return
+
+    results = {}
+    for mode in args.modes.split(','):
+        completed = subprocess.run(
+            [sys.executable, __file__, '--run', mode, '--requests', str(args.requests)],
+            env={**os.environ, **MODES[mode]}, capture_output=True, text=True,
+        )
+        if completed.returncode:
+            print(f"❌ {mode} failed:\n{completed.stderr[-2000:]}")
+            continue
+        results[mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    print(f"📊 {args.requests} requests per mode")
+    for mode, result in results.items():
+        latencies = sorted(result['latencies'])
+        print(f"   - {mode:10} mean {statistics.mean(latencies) * 1000:7.2f} ms, "
+              f"p50 {latencies[len(latencies) // 2] * 1000:7.2f} ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.2f} ms, "
+              f"{result['backends']} server connections")
+    if 'fresh' in results and 'pool' in results:
+        fresh, pool = (statistics.median(results[mode]['latencies']) for mode in ('fresh', 'pool'))
+        print(f"   - the pool takes {pool / fresh:.0%} of a new connection's time per request")
+
+
+if __name__ == '__main__':
+    main()
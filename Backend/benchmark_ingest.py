@@ -0,0 +1,138 @@
+"""
+Microbenchmark of the single-reading ingest endpoint (device-data/submit/):
+CPU time per request of the fast path (device/fast_ingest.py, an async view)
+against the DRF view it falls back to.
+
+    python benchmark_ingest.py [--requests 2000] [--rounds 5] [--device PK] [--handler-only]
+
+Everything runs in a transaction that is rolled back, so no readings or
+notifications are left behind. Rate limits are turned off for the run.
+``--handler-only`` replaces ``ingest_reading`` with a constant result to time
+the request handling alone, without the database writes both paths share.
+The async view runs in one event loop per round, as under an ASGI server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from unittest import mock
+
+import django
+
+# Setup Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+
+from device.models import Device
+from device.views.data_views import receive_device_data
+
+
+class Rollback(Exception):
+    pass
+
+
+def make_requests(device_pk, count, start):
+    factory = RequestFactory()
+    requests = []
+    for i in range(count):
+        body = {
+            'DID': device_pk,
+            'ALERT': 'MEDIUM',
+            'count': 5,
+            'REFER_Val': 10,
+            'TAMPER': 'false',
+            'TOTAL_USAGE': 100 + i,
+            'BATTERY_PERCENTAGE': 80,
+            'PWR_STATUS': 'ON',
+            # Unique, or every reading after the first is a duplicate
+            'SEQ': f'bench-{start}-{i}',
+        }
+        requests.append(factory.post('/api/device/device-data/submit/', json.dumps(body),
+                                     content_type='application/json'))
+    return requests
+
+
+def check(response):
+    if hasattr(response, 'render'):
+        response.render()
+    if response.status_code != 201:
+        raise SystemExit(f"Unexpected {response.status_code}: {response.content[:200]}")
+
+
+async def run_async(view, requests):
+    for request in requests:
+        check(await view(request))
+
+
+def run(view, requests):
+    """CPU seconds per request of ``view``"""
+    started = time.process_time()
+    if asyncio.iscoroutinefunction(view):
+        # Thread sensitive ORM calls come back to this thread, inside the benchmark's transaction
+        async_to_sync(run_async)(view, requests)
+    else:
+        for request in requests:
+            check(view(request))
+    return (time.process_time() - started) / len(requests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--device', type=int, help="Device primary key (default: the first device)")
+    parser.add_argument('--handler-only', action='store_true')
+    args = parser.parse_args()
+
+    device = Device.objects.get(pk=args.device) if args.device else Device.objects.order_by('pk').first()
+    if device is None:
+        raise SystemExit("No device to send readings for")
+
+    views = {
+        'drf': receive_device_data.__wrapped__,
+        'fast': receive_device_data,
+    }
+    patches = []
+    if args.handler_only:
+        result = {"message": "Data recorded successfully", "notifications_sent": 0, "notification_types": []}
+        patches = [
+            mock.patch('device.fast_ingest.aingest_reading', new=mock.AsyncMock(return_value=result)),
+            mock.patch('device.views.data_views.ingest_reading', return_value=result),
+        ]
+
+    timings = {name: [] for name in views}
+    try:
+        with override_settings(DEVICE_INGEST_RATE=0, INGEST_GLOBAL_RATE=0), transaction.atomic():
+            for patch in patches:
+                patch.start()
+            start = int(time.time() * 1000)
+            for round_ in range(args.rounds + 1):
+                for name, view in views.items():
+                    requests = make_requests(device.pk, args.requests, f'{start}-{round_}-{name}')
+                    seconds = run(view, requests)
+                    # The first round warms up caches and the device registry
+                    if round_:
+                        timings[name].append(seconds)
+            raise Rollback()
+    except Rollback:
+        pass
+    finally:
+        for patch in patches:
+            patch.stop()
+
+    print(f"📊 {args.requests} requests x {args.rounds} rounds, device {device.pk}"
+          f"{' (handler only)' if args.handler_only else ''}")
+    medians = {name: statistics.median(values) for name, values in timings.items()}
+    for name, seconds in medians.items():
+        print(f"   - {name:5} {seconds * 1e6:9.1f} µs CPU per request")
+    print(f"   - fast path uses {medians['fast'] / medians['drf']:.0%} of the DRF view's CPU time")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Compressed request bodies for device uploads.
+
+Devices that were offline upload their buffered readings in one request, and
+those bodies compress very well. Views decorated with
+``@accepts_compressed_body`` accept ``Content-Encoding: gzip`` or
+``deflate``, and ``zstd`` when the ``zstandard`` package is installed.
+
+The body is decompressed as it is read, never as a whole: parsers and the
+batch endpoint pull decompressed bytes in small chunks, and reading more
+than ``DEVICE_UPLOAD_MAX_DECOMPRESSED_BYTES`` fails with 413, so a small
+compressed body cannot expand into gigabytes (a zip bomb).
+"""
+import zlib
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 64 * 1024
+
+_ZLIB_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'x-gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+class RequestBodyTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Decompressed request body is too large.'
+    default_code = 'request_body_too_large'
+
+
+def supported_encodings():
+    return list(_ZLIB_WBITS) + (['zstd'] if zstandard is not None else [])
+
+
+class _ZlibReader:
+    """Incremental zlib/gzip decoder; one read never returns more than asked for"""
+
+    def __init__(self, raw, wbits):
+        self.raw = raw
+        self.decompressor = zlib.decompressobj(wbits)
+        self.pending = b''
+        self.finished = False
+
+    def read(self, size):
+        while not self.finished:
+            if not self.pending:
+                self.pending = self.raw.read(CHUNK_SIZE)
+                if not self.pending:
+                    if not self.decompressor.eof:
+                        raise ParseError('Compressed request body is truncated.')
+                    self.finished = True
+                    break
+            try:
+                data = self.decompressor.decompress(self.pending, size)
+            except zlib.error as exc:
+                raise ParseError(f'Invalid compressed request body - {exc}')
+            self.pending = self.decompressor.unconsumed_tail
+            if self.decompressor.eof:
+                # Ignore anything after the end of the compressed stream
+                self.pending = b''
+                self.finished = True
+            if data:
+                return data
+        return b''
+
+
+class _ZstdReader:
+    def __init__(self, raw):
+        self.reader = zstandard.ZstdDecompressor().stream_reader(raw, read_size=CHUNK_SIZE)
+
+    def read(self, size):
+        try:
+            return self.reader.read(size)
+        except zstandard.ZstdError as exc:
+            raise ParseError(f'Invalid compressed request body - {exc}')
+
+
+class DecompressedBody:
+    """File-like view of a decompressed request body, capped at ``limit`` bytes"""
+
+    def __init__(self, raw, encoding, limit):
+        self.raw = raw
+        if encoding == 'zstd':
+            self.reader = _ZstdReader(raw)
+        else:
+            self.reader = _ZlibReader(raw, _ZLIB_WBITS[encoding])
+        self.limit = limit
+        self.total = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                chunk = self.read(CHUNK_SIZE)
+                if not chunk:
+                    return b''.join(chunks)
+                chunks.append(chunk)
+        data = self.reader.read(min(size, CHUNK_SIZE)) if size else b''
+        self.total += len(data)
+        if self.total > self.limit:
+            raise RequestBodyTooLarge()
+        return data
+
+    def readable(self):
+        return True
+
+    def close(self):
+        close = getattr(self.raw, 'close', None)
+        if close is not None:
+            close()
+
+
+def accepts_compressed_body(view):
+    """
+    Let a view receive compressed bodies. Decorate outside ``@api_view`` so
+    the request stream is wrapped before DRF reads it.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding and encoding != 'identity':
+            if encoding not in supported_encodings():
+                return JsonResponse(
+                    {'error': f'Unsupported Content-Encoding: {encoding}', 'supported': supported_encodings()},
+                    status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                )
+            request._stream = DecompressedBody(
+                request._stream,
+                encoding,
+                getattr(settings, 'DEVICE_UPLOAD_MAX_DECOMPRESSED_BYTES', 10 * 1024 * 1024),
+            )
+        return view(request, *args, **kwargs)
+
+    return wrapped
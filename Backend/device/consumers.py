@@ -1,20 +1,59 @@
 import json
 import asyncio
+import hmac
+import msgpack
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from urllib.parse import parse_qs
 from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from .models import Device, Notification
+from .realtime import ALL_TOPIC, normalize_topic, topic_group, topics_for_content
+from .event_stream import get_event_stream
+from .outbound import OutboundBuffer
+from .heartbeats import store_heartbeat
+from .ingest import InvalidReading, ingest_reading
+from .rate_limit import RateLimited, admit_reading
+from .registry import get_device_registry
 from users.models import AppLog
+from collections import deque
 import logging
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+# Upper bound on topics a single connection may subscribe to
+MAX_TOPICS_PER_CONNECTION = 50
+# Close code sent to clients that fall too far behind
+SLOW_CONSUMER_CLOSE_CODE = 4008
+# How many recent event ids are remembered to drop duplicate deliveries when a
+# client is subscribed to overlapping topics (e.g. a device and its floor)
+RECENT_EVENT_IDS = 256
+# Close codes of the device ingest connection
+DEVICE_UNKNOWN_CLOSE_CODE = 4404
+DEVICE_UNAUTHORIZED_CLOSE_CODE = 4401
+# Sequence numbers remembered per device connection to acknowledge retransmits
+RECENT_SEQUENCE_NUMBERS = 256
+# Upper bound on messages in one frame
+MAX_MESSAGES_PER_FRAME = 100
+
+
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        self.topics = set()
+        self.recent_event_ids = deque(maxlen=RECENT_EVENT_IDS)
+        self.outbound = OutboundBuffer(
+            self._send_frame,
+            window_ms=getattr(settings, 'WS_BATCH_WINDOW_MS', 150),
+            max_frame_bytes=getattr(settings, 'WS_MAX_FRAME_BYTES', 64 * 1024),
+            max_frame_events=getattr(settings, 'WS_MAX_FRAME_EVENTS', 100),
+            max_pending=getattr(settings, 'WS_MAX_PENDING_EVENTS', 500),
+            slow_consumer_seconds=getattr(settings, 'WS_SLOW_CONSUMER_SECONDS', 30),
+            label=self.channel_name,
+        )
         try:
             # Get token from query string
             query_string = self.scope['query_string'].decode()
@@ -48,12 +87,24 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                         # Log WebSocket connection
                         await self.log_websocket_event("WebSocket connected", "success")
                         
+                        # Subscribe to the requested topics, e.g. ?topics=floor:2,alert:tamper
+                        # Clients that do not ask for anything get the whole feed.
+                        requested = ','.join(query_params.get('topics', [])).split(',')
+                        requested = [t for t in requested if t.strip()] or [ALL_TOPIC]
+                        await self.subscribe(requested)
+                        
                         # Send initial connection status
                         await self.send(text_data=json.dumps({
                             'type': 'connection',
                             'status': 'connected',
-                            'user': self.user.username
+                            'user': self.user.username,
+                            'topics': sorted(self.topics),
                         }))
+
+                        # Resume: replay what the client missed while it was away
+                        last_event_id = query_params.get('last_event_id', [None])[0]
+                        if last_event_id:
+                            await self.replay(last_event_id)
                     else:
                         logger.warning("WebSocket: Invalid user or anonymous user")
                         await self.log_websocket_event("WebSocket connection failed - invalid user", "error")
@@ -78,12 +129,15 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             await self.close()
 
     async def disconnect(self, close_code):
+        # The socket is gone, anything still buffered cannot be delivered
+        await self.outbound.close(flush=False)
         try:
             if hasattr(self, 'group_name'):
                 await self.channel_layer.group_discard(
                     self.group_name,
                     self.channel_name
                 )
+                await self.unsubscribe(list(self.topics))
                 logger.info(f"WebSocket disconnected for group: {self.group_name}")
                 await self.log_websocket_event("WebSocket disconnected", "info")
         except Exception as e:
@@ -100,20 +154,118 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                     'type': 'pong',
                     'timestamp': asyncio.get_event_loop().time()
                 }))
+            elif message_type == 'stats':
+                await self.send(text_data=json.dumps({
+                    'type': 'stats',
+                    'stats': self.outbound.stats(),
+                }))
+            elif message_type in ('subscribe', 'unsubscribe'):
+                topics = data.get('topics') or []
+                if isinstance(topics, str):
+                    topics = [topics]
+                if message_type == 'subscribe':
+                    rejected = await self.subscribe(topics)
+                else:
+                    rejected = await self.unsubscribe(topics)
+                await self.send(text_data=json.dumps({
+                    'type': 'subscriptions',
+                    'topics': sorted(self.topics),
+                    'rejected': rejected,
+                }))
         except json.JSONDecodeError:
             logger.warning("WebSocket: Received invalid JSON data")
         except Exception as e:
             logger.error(f"WebSocket receive error: {e}")
 
-    async def notification_message(self, event):
-        # Send notification to WebSocket
+    async def subscribe(self, topics):
+        """Join the groups for the given topics, returns the rejected ones"""
+        rejected = []
+        for raw in topics:
+            topic = normalize_topic(raw)
+            if topic is None or (topic not in self.topics and len(self.topics) >= MAX_TOPICS_PER_CONNECTION):
+                rejected.append(raw)
+                continue
+            if topic not in self.topics:
+                await self.channel_layer.group_add(topic_group(topic), self.channel_name)
+                self.topics.add(topic)
+        return rejected
+
+    async def unsubscribe(self, topics):
+        """Leave the groups for the given topics, returns the rejected ones"""
+        rejected = []
+        for raw in topics:
+            topic = normalize_topic(raw)
+            if topic is None:
+                rejected.append(raw)
+                continue
+            if topic in self.topics:
+                await self.channel_layer.group_discard(topic_group(topic), self.channel_name)
+                self.topics.discard(topic)
+        return rejected
+
+    async def replay(self, last_event_id):
+        """
+        Queue the events published after ``last_event_id`` on the client's topics.
+        Live events are only dispatched once connect() returns, so they always
+        follow the replay; ones already replayed are dropped as duplicates.
+        """
+        limit = getattr(settings, 'EVENT_STREAM_REPLAY_LIMIT', 500)
         try:
-            await self.send(text_data=json.dumps({
-                'type': 'notification',
-                'content': event['content']
-            }))
+            events, complete = await sync_to_async(
+                get_event_stream().read_after, thread_sensitive=False
+            )(last_event_id, limit)
         except Exception as e:
-            logger.error(f"Error sending notification via WebSocket: {e}")
+            logger.error(f"WebSocket replay error: {e}")
+            events, complete = [], False
+
+        replayed = 0
+        for event_id, content in events:
+            content['event_id'] = event_id
+            if self.topics.isdisjoint(topics_for_content(content)):
+                continue
+            self.recent_event_ids.append(event_id)
+            self.outbound.push({
+                'type': 'notification',
+                'content': content
+            })
+            replayed += 1
+        await self.outbound.flush()
+
+        # An incomplete replay tells the client to fall back to a full reload
+        await self.send(text_data=json.dumps({
+            'type': 'replay',
+            'status': 'complete' if complete else 'truncated',
+            'count': replayed,
+            'last_event_id': events[-1][0] if events else last_event_id,
+        }))
+
+    async def notification_message(self, event):
+        # Overlapping subscriptions deliver the same event once per group
+        content = event['content']
+        event_id = content.get('event_id', content.get('id'))
+        if event_id is not None:
+            if event_id in self.recent_event_ids:
+                return
+            self.recent_event_ids.append(event_id)
+
+        # Buffer the notification, it is flushed with the rest of the window
+        self.outbound.push({
+            'type': 'notification',
+            'content': event['content']
+        })
+
+        if self.outbound.is_slow:
+            stats = self.outbound.stats()
+            logger.warning(
+                f"WebSocket: disconnecting slow consumer {self.channel_name} "
+                f"(lag {stats['lag_ms']}ms, pending {stats['pending']}, dropped {stats['dropped']})"
+            )
+            await self.log_websocket_event("WebSocket disconnected - slow consumer", "warning")
+            await self.outbound.close(flush=False)
+            await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+
+    async def _send_frame(self, frame):
+        await self.send(text_data=frame)
 
     @database_sync_to_async
     def get_user(self, user_id):
@@ -186,4 +338,145 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                         details="Anonymous connection"
                     )
         except Exception as e:
-            logger.error(f"Failed to log WebSocket event: {e}")
\ No newline at end of file
+            logger.error(f"Failed to log WebSocket event: {e}")
+
+
+class DeviceIngestConsumer(AsyncWebsocketConsumer):
+    """
+    Persistent ingest connection of a single dispenser, ``ws/device/<id>/``
+    where ``<id>`` is the device's primary key (the ``DID`` of HTTP ingest) or
+    its MAC ``device_id``.
+
+    The device is resolved (and, when ``DEVICE_INGEST_TOKEN`` is set,
+    authenticated with ``?token=``) once on connect. Each message then carries
+    a sequence number and is acknowledged with it:
+
+        -> {"type": "reading", "seq": 7, "ALERT": "LOW", "count": 12, ...}
+        <- {"type": "ack", "seq": 7, "status": 201, "notifications_sent": 1, ...}
+        -> {"type": "heartbeat", "seq": 8, "signal_strength": -61}
+        <- {"type": "ack", "seq": 8, "status": 200}
+
+    A frame may also hold a JSON array of messages, answered by one frame with
+    an array of acks. Binary frames are MessagePack and are answered in
+    MessagePack. A sequence number seen recently on this connection is
+    acknowledged again without being stored twice, so a device can safely
+    resend after a lost ack. Readings go through the same ``ingest_reading``
+    as HTTP ingest.
+    """
+
+    async def connect(self):
+        self.recent_seqs = deque(maxlen=RECENT_SEQUENCE_NUMBERS)
+        self.device_pk = None
+        await self.accept()
+
+        expected = getattr(settings, 'DEVICE_INGEST_TOKEN', None)
+        if expected:
+            token = parse_qs(self.scope['query_string'].decode()).get('token', [''])[0]
+            if not hmac.compare_digest(token.encode(), expected.encode()):
+                await self.close(code=DEVICE_UNAUTHORIZED_CLOSE_CODE)
+                return
+
+        identifier = self.scope['url_route']['kwargs']['device_id']
+        try:
+            device = await self.resolve_device(identifier)
+        except Device.DoesNotExist:
+            await self.close(code=DEVICE_UNKNOWN_CLOSE_CODE)
+            return
+        self.device_pk = device.pk
+        logger.info(f"Device {device.pk} connected for ingest")
+        await self.send(text_data=json.dumps({
+            'type': 'connection',
+            'status': 'connected',
+            'device_id': device.pk,
+        }))
+
+    async def disconnect(self, close_code):
+        if self.device_pk is not None:
+            logger.info(f"Device {self.device_pk} ingest connection closed ({close_code})")
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if self.device_pk is None:
+            return
+        binary = text_data is None
+        try:
+            if binary:
+                frame = msgpack.unpackb(bytes_data, raw=False, strict_map_key=False)
+            else:
+                frame = json.loads(text_data)
+        except Exception:
+            await self.reply({'type': 'error', 'error': 'Invalid MessagePack' if binary else 'Invalid JSON'}, binary)
+            return
+
+        if isinstance(frame, list):
+            acks = [await self.handle_message(message) for message in frame[:MAX_MESSAGES_PER_FRAME]]
+            await self.reply(acks, binary)
+        else:
+            await self.reply(await self.handle_message(frame), binary)
+
+    async def reply(self, content, binary):
+        if binary:
+            await self.send(bytes_data=msgpack.packb(content, default=str))
+        else:
+            await self.send(text_data=json.dumps(content, default=str))
+
+    async def handle_message(self, message):
+        if not isinstance(message, dict):
+            return {'type': 'ack', 'seq': None, 'status': 400, 'error': 'Message must be an object'}
+        seq = message.get('seq')
+        message_type = message.get('type', 'reading')
+        if message_type == 'ping':
+            return {'type': 'pong', 'seq': seq}
+        if message_type not in ('reading', 'heartbeat'):
+            return {'type': 'ack', 'seq': seq, 'status': 400, 'error': f"Unknown message type: {message_type}"}
+        if seq is not None and seq in self.recent_seqs:
+            return {'type': 'ack', 'seq': seq, 'status': 200, 'duplicate': True}
+
+        try:
+            if message_type == 'heartbeat':
+                await self.store_heartbeat(message)
+                ack = {'type': 'ack', 'seq': seq, 'status': 200}
+            else:
+                result = await self.ingest(message)
+                ack = {
+                    'type': 'ack',
+                    'seq': seq,
+                    'status': 200 if result.get('duplicate') else 201,
+                    'notifications_sent': result['notifications_sent'],
+                    'notification_types': result['notification_types'],
+                }
+                if result.get('duplicate'):
+                    ack['duplicate'] = True
+        except InvalidReading as e:
+            return {'type': 'ack', 'seq': seq, 'status': 400, 'error': str(e)}
+        except RateLimited as e:
+            return {'type': 'ack', 'seq': seq, 'status': 429, 'retry_after': round(e.retry_after, 1)}
+        except Device.DoesNotExist:
+            # Deleted while connected
+            await self.close(code=DEVICE_UNKNOWN_CLOSE_CODE)
+            return {'type': 'ack', 'seq': seq, 'status': 404, 'error': 'Device not found'}
+        except Exception as e:
+            logger.error(f"Device {self.device_pk} ingest error: {e}")
+            return {'type': 'ack', 'seq': seq, 'status': 500, 'error': str(e)}
+
+        if seq is not None:
+            self.recent_seqs.append(seq)
+        return ack
+
+    @database_sync_to_async
+    def resolve_device(self, identifier):
+        registry = get_device_registry()
+        if identifier.isdigit():
+            return registry.get(identifier)
+        return registry.get_by_device_id(identifier)
+
+    @database_sync_to_async
+    def ingest(self, payload):
+        retry_after = admit_reading(self.device_pk)
+        if retry_after:
+            raise RateLimited(retry_after)
+        # Resolved per reading so renames reach the alerts, a registry hit costs no query
+        return ingest_reading(get_device_registry().get(self.device_pk), payload)
+
+    @database_sync_to_async
+    def store_heartbeat(self, payload):
+        store_heartbeat(get_device_registry().get(self.device_pk), payload)
@@ -0,0 +1,124 @@
+"""
+Capped, replayable log of realtime events.
+
+Every event published to WebSocket clients is also appended here and gets a
+monotonically increasing ``event_id``. A client that reconnects passes the
+last ID it saw and only the events it missed are replayed, instead of it
+reloading the whole notification list.
+
+The Redis backend stores events in a capped Redis stream, so every worker
+shares the same history. The memory backend is a local stand-in for
+development and single-process deployments.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+
+def parse_event_id(event_id):
+    """Parse a ``<milliseconds>-<sequence>`` event ID into a comparable tuple"""
+    try:
+        ms, _, seq = str(event_id).partition('-')
+        return int(ms), int(seq or 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class MemoryEventStream:
+    def __init__(self, maxlen=10000):
+        self._events = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._last = (0, 0)
+
+    def append(self, content):
+        with self._lock:
+            ms = int(time.time() * 1000)
+            last_ms, last_seq = self._last
+            self._last = (ms, 0) if ms > last_ms else (last_ms, last_seq + 1)
+            event_id = '%d-%d' % self._last
+            self._events.append((self._last, event_id, json.dumps(content, default=str)))
+        return event_id
+
+    def read_after(self, last_event_id, limit=500):
+        """
+        Return ``(events, complete)`` where ``events`` is a list of
+        ``(event_id, content)`` newer than ``last_event_id``. ``complete`` is
+        False when events were trimmed from the stream or ``limit`` was hit.
+        """
+        after = parse_event_id(last_event_id)
+        if after is None:
+            return [], False
+        with self._lock:
+            snapshot = list(self._events)
+        # Only complete if the client's last event is still retained; this also
+        # catches IDs handed out before the process (and its history) restarted
+        complete = bool(snapshot) and snapshot[0][0] <= after
+        missed = [(event_id, data) for key, event_id, data in snapshot if key > after]
+        if len(missed) > limit:
+            missed, complete = missed[:limit], False
+        return [(event_id, json.loads(data)) for event_id, data in missed], complete
+
+
+class RedisEventStream:
+    def __init__(self, url, key='realtime:events', maxlen=10000):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+        self.maxlen = maxlen
+
+    def append(self, content):
+        event_id = self.client.xadd(
+            self.key,
+            {'data': json.dumps(content, default=str)},
+            maxlen=self.maxlen,
+            approximate=True,
+        )
+        return event_id.decode() if isinstance(event_id, bytes) else event_id
+
+    def read_after(self, last_event_id, limit=500):
+        """See :meth:`MemoryEventStream.read_after`"""
+        if parse_event_id(last_event_id) is None:
+            return [], False
+        # Exclusive range start, everything strictly after the client's last event
+        entries = self.client.xrange(self.key, min=f'({last_event_id}', max='+', count=limit + 1)
+        complete = len(entries) <= limit
+        if complete:
+            # The client's event must still be retained, otherwise some were trimmed
+            oldest = self.client.xrange(self.key, min='-', max='+', count=1)
+            if oldest:
+                oldest_id = oldest[0][0]
+                oldest_id = oldest_id.decode() if isinstance(oldest_id, bytes) else oldest_id
+                complete = parse_event_id(oldest_id) <= parse_event_id(last_event_id)
+        events = []
+        for event_id, fields in entries[:limit]:
+            event_id = event_id.decode() if isinstance(event_id, bytes) else event_id
+            data = fields.get(b'data', fields.get('data'))
+            events.append((event_id, json.loads(data)))
+        return events, complete
+
+
+_stream = None
+_stream_lock = threading.Lock()
+
+
+def get_event_stream():
+    """Return the configured event stream (built lazily, shared per process)"""
+    global _stream
+    if _stream is None:
+        with _stream_lock:
+            if _stream is None:
+                maxlen = getattr(settings, 'EVENT_STREAM_MAXLEN', 10000)
+                backend = getattr(settings, 'EVENT_STREAM_BACKEND', 'memory')
+                if backend == 'redis':
+                    _stream = RedisEventStream(
+                        settings.EVENT_STREAM_REDIS_URL,
+                        key=getattr(settings, 'EVENT_STREAM_KEY', 'realtime:events'),
+                        maxlen=maxlen,
+                    )
+                else:
+                    _stream = MemoryEventStream(maxlen=maxlen)
+    return _stream
@@ -0,0 +1,111 @@
+"""
+Fast path of the single-reading ingest endpoint.
+
+Almost every request to ``device-data/submit/`` is one small uncompressed
+JSON, MessagePack or binary reading, yet going through DRF costs more CPU
+than parsing it: request wrapping, content negotiation, parser selection,
+renderers. ``@fast_ingest`` serves those requests as a plain Django view
+and hands everything else (form bodies, compressed bodies, other methods) to
+the DRF view it decorates.
+
+The view is async: under ASGI a request waiting for the database, Redis or
+the channel layer holds no thread, and push notifications are sent in the
+background (see ``device.ingest.aingest_reading``). Under WSGI Django runs
+it in an event loop of its own that ends with the request, so the AppLog
+entry and pushes are awaited before answering, as the DRF view does.
+
+Both paths answer with the same status codes and bodies. Readings are
+validated by ``device.ingest.parse_reading`` either way.
+"""
+import io
+import json
+import logging
+import math
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from rest_framework.exceptions import ParseError
+
+from .ingest import InvalidReading, aingest_reading
+from .models import Device
+from .parsers import LegacyMessagePackParser, MessagePackParser, ReadingStructParser
+from .rate_limit import aadmit_reading
+from .registry import get_device_registry
+
+logger = logging.getLogger(__name__)
+
+# Compact and unescaped like DRF's JSONRenderer
+_JSON_PARAMS = {'separators': (',', ':'), 'ensure_ascii': False}
+
+
+def _reject_constant(value):
+    raise ValueError('Out of range float values are not JSON compliant')
+
+
+def _parse_json(stream):
+    try:
+        return json.loads(stream.read(), parse_constant=_reject_constant)
+    except ValueError as exc:
+        raise ParseError(f'JSON parse error - {exc}')
+
+
+_BODY_PARSERS = {
+    'application/json': _parse_json,
+    MessagePackParser.media_type: MessagePackParser().parse,
+    LegacyMessagePackParser.media_type: LegacyMessagePackParser().parse,
+    ReadingStructParser.media_type: ReadingStructParser().parse,
+}
+
+
+def _response(content, status):
+    return JsonResponse(content, status=status, json_dumps_params=_JSON_PARAMS)
+
+
+def fast_ingest(view):
+    """
+    Serve plain single-reading requests of the ingest endpoint without DRF.
+    Decorate outermost so the DRF view, and its schema, stay reachable.
+    """
+    fallback = sync_to_async(view)
+
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        parse = _BODY_PARSERS.get(request.content_type)
+        if (
+            parse is None
+            or request.method != 'POST'
+            or request.META.get('HTTP_CONTENT_ENCODING', 'identity') not in ('', 'identity')
+        ):
+            return await fallback(request, *args, **kwargs)
+
+        try:
+            data = parse(io.BytesIO(request.body))
+        except ParseError as exc:
+            return _response({'detail': str(exc.detail)}, 400)
+        if not isinstance(data, dict):
+            return _response({"error": "Expected a single reading"}, 400)
+
+        retry_after = await aadmit_reading(data.get('DID'))
+        if retry_after:
+            response = _response({"error": "Rate limit exceeded", "retry_after": round(retry_after, 1)}, 429)
+            response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+            return response
+
+        try:
+            device = await get_device_registry().aget(data.get('DID'))
+            result = await aingest_reading(
+                device, data, idempotency_key=request.headers.get('Idempotency-Key'),
+                background=isinstance(request, ASGIRequest),
+            )
+        except Device.DoesNotExist:
+            return _response({"error": "Device not found"}, 404)
+        except InvalidReading as e:
+            return _response({"error": str(e)}, 400)
+        except Exception as e:
+            logger.exception(f"Error in receive_device_data: {e}")
+            return _response({"error": str(e)}, 500)
+        return _response(result, 200 if result.get('duplicate') else 201)
+
+    return wrapped
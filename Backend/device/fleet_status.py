@@ -0,0 +1,333 @@
+"""
+Incrementally maintained fleet status counters.
+
+Instead of walking every device to count how many are tampered, empty, low
+on battery and so on, each device's current state is kept in
+``DeviceStatus`` and the number of devices per status bucket is kept in a
+counter store. Ingest and the offline sweeper compute the buckets of a
+device before and after a change and apply only the difference, inside the
+same transaction as the status update, so reading the fleet status is a
+single hash lookup.
+
+Two kinds of buckets exist, mirroring the two dashboard endpoints:
+- ``summary.*``: non-exclusive flags (a device can be both tampered and
+  low on battery), see :func:`summary_buckets`
+- ``distribution.*``: exactly one bucket per device, see
+  :func:`distribution_bucket`
+
+plus ``total`` for the number of registered devices.
+
+The counters live in a Redis hash when ``FLEET_STATUS_BACKEND`` is
+``redis`` and in the ``FleetCounter`` table otherwise. Redis increments run
+on commit; ``rebuild_counters`` recomputes everything from ``DeviceStatus``
+and is used on a cold start and periodically by the sweeper to correct drift.
+
+Going offline and coming back online are also reported as events (see
+``device.presence``), scheduled on commit of the transition.
+"""
+import logging
+import threading
+from collections import Counter
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Device, DeviceStatus, FleetCounter
+from .presence import notify_offline, notify_online
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_BUCKETS = (
+    'active', 'inactive', 'tamper', 'empty', 'low', 'full', 'battery_critical',
+    'battery_low', 'battery_off', 'no_power', 'power_off', 'normal',
+)
+DISTRIBUTION_BUCKETS = (
+    'normal', 'low', 'empty', 'full', 'tamper', 'battery_low', 'battery_critical',
+    'power_off', 'offline',
+)
+TOTAL_KEY = 'total'
+# Only written by a full rebuild; increments applied to a store that was
+# never rebuilt (e.g. a flushed Redis) must not be mistaken for counts
+READY_KEY = 'ready'
+
+
+def summary_buckets(status):
+    """Summary flags of a device, ``status`` being a DeviceStatus or None"""
+    if status is None or status.last_seen is None:
+        return {'inactive'}
+
+    battery = status.battery_percentage
+    power = str(status.power_status or '')
+    buckets = {'active' if status.is_online else 'inactive'}
+    if status.tamper:
+        buckets.add('tamper')
+    if status.alert in ('EMPTY', 'LOW', 'FULL'):
+        buckets.add(status.alert.lower())
+    if battery is not None:
+        if battery <= 10:
+            buckets.add('battery_critical')
+        elif battery <= 20:
+            buckets.add('battery_low')
+        if battery == 0:
+            buckets.add('battery_off')
+    if status.power_status is not None and power.lower() == 'no':
+        buckets.add('no_power')
+    if power.upper() == 'OFF':
+        buckets.add('power_off')
+    if (
+        status.is_online
+        and not status.tamper
+        and status.alert not in ('EMPTY', 'LOW', 'FULL')
+        and (battery is None or battery > 20)
+        and (status.power_status is None or power.upper() not in ('OFF', 'NO'))
+    ):
+        buckets.add('normal')
+    return buckets
+
+
+def distribution_bucket(status):
+    """The single distribution bucket of a device, first matching rule wins"""
+    if status is None or status.last_seen is None or not status.is_online:
+        return 'offline'
+    if status.tamper:
+        return 'tamper'
+    if status.alert in ('EMPTY', 'LOW', 'FULL'):
+        return status.alert.lower()
+    battery = status.battery_percentage
+    if battery is not None:
+        if battery <= 10:
+            return 'battery_critical'
+        if battery <= 20:
+            return 'battery_low'
+        return 'normal'
+    if status.power_status and str(status.power_status).lower() in ('off', 'no', 'none', '0', 'false'):
+        return 'power_off'
+    return 'normal'
+
+
+def status_keys(status):
+    """Every counter key a device contributes to"""
+    keys = {f'summary.{bucket}' for bucket in summary_buckets(status)}
+    keys.add(f'distribution.{distribution_bucket(status)}')
+    return keys
+
+
+def diff_keys(before, after):
+    """Counter increments for a device moving from key set ``before`` to ``after``"""
+    delta = {key: -1 for key in before - after}
+    delta.update({key: 1 for key in after - before})
+    return delta
+
+
+class DatabaseCounterStore:
+    def apply(self, delta):
+        # Runs inside the caller's transaction, rolled back together with it.
+        # Keys are locked in a fixed order so concurrent updates cannot deadlock
+        for key, amount in sorted(delta.items()):
+            if not FleetCounter.objects.filter(key=key).update(value=F('value') + amount):
+                FleetCounter.objects.get_or_create(key=key)
+                FleetCounter.objects.filter(key=key).update(value=F('value') + amount)
+
+    def read(self):
+        return dict(FleetCounter.objects.values_list('key', 'value'))
+
+    def replace(self, counts):
+        with transaction.atomic():
+            FleetCounter.objects.all().delete()
+            FleetCounter.objects.bulk_create([FleetCounter(key=key, value=value) for key, value in counts.items()])
+
+
+class RedisCounterStore:
+    def __init__(self, url, key='fleet:status'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+
+    def apply(self, delta):
+        def increment():
+            try:
+                pipe = self.client.pipeline(transaction=True)
+                for key, amount in delta.items():
+                    pipe.hincrby(self.key, key, amount)
+                pipe.execute()
+            except Exception as e:
+                # The periodic rebuild corrects the counters
+                logger.error(f"Failed to update fleet status counters: {e}")
+
+        # Only count changes that were actually committed
+        transaction.on_commit(increment)
+
+    def read(self):
+        return {key.decode(): int(value) for key, value in self.client.hgetall(self.key).items()}
+
+    def replace(self, counts):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(self.key)
+        if counts:
+            pipe.hset(self.key, mapping=counts)
+        pipe.execute()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_counter_store():
+    """Return the configured counter store (built lazily, shared per process)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if getattr(settings, 'FLEET_STATUS_BACKEND', 'database') == 'redis':
+                    _store = RedisCounterStore(
+                        settings.FLEET_STATUS_REDIS_URL,
+                        key=getattr(settings, 'FLEET_STATUS_REDIS_KEY', 'fleet:status'),
+                    )
+                else:
+                    _store = DatabaseCounterStore()
+    return _store
+
+
+def compute_counts():
+    """Count every bucket from scratch, one pass over DeviceStatus"""
+    counts = Counter({f'summary.{b}': 0 for b in SUMMARY_BUCKETS})
+    counts.update({f'distribution.{b}': 0 for b in DISTRIBUTION_BUCKETS})
+    counts[TOTAL_KEY] = Device.objects.count()
+    seen = 0
+    for status in DeviceStatus.objects.iterator(chunk_size=2000):
+        counts.update(status_keys(status))
+        seen += 1
+    # Devices without a status row yet count as never seen
+    counts.update({key: counts[TOTAL_KEY] - seen for key in status_keys(None)})
+    counts[READY_KEY] = 1
+    return dict(counts)
+
+
+def rebuild_counters():
+    counts = compute_counts()
+    get_counter_store().replace(counts)
+    return counts
+
+
+def fleet_counts():
+    """Current counters; rebuilt once when the store is empty (cold start)"""
+    counts = get_counter_store().read()
+    if READY_KEY not in counts:
+        counts = rebuild_counters()
+    return counts
+
+
+def _mark_online(status):
+    """Set a device online, scheduling the online event if the sweeper had marked it offline"""
+    status.is_online = True
+    offline_since = status.offline_since
+    if offline_since is not None:
+        status.offline_since = None
+        transaction.on_commit(partial(notify_online, status, offline_since))
+
+
+def record_reading(device, alert, tamper, battery_percentage, power_status, seen_at=None):
+    """
+    Update a device's status from a reading and move it between buckets.
+    Must be called inside a transaction; returns ``(status, delta)``.
+    """
+    status, created = DeviceStatus.objects.select_for_update().get_or_create(device=device)
+    # Devices without a status row are counted as never seen
+    before = status_keys(None if created else status)
+
+    status.alert = alert
+    status.tamper = str(tamper).lower() == 'true'
+    status.battery_percentage = battery_percentage
+    status.power_status = power_status
+    status.last_seen = seen_at or timezone.now()
+    _mark_online(status)
+    status.save(update_fields=[
+        'alert', 'tamper', 'battery_percentage', 'power_status', 'last_seen', 'is_online',
+        'offline_since', 'updated_at',
+    ])
+
+    delta = diff_keys(before, status_keys(status))
+    if delta:
+        get_counter_store().apply(delta)
+    return status, delta
+
+
+def record_heartbeat(device, seen_at=None):
+    """
+    Keep a device online without a reading. For an online device this is a
+    single UPDATE of ``last_seen``; a device coming back online goes through
+    the locked path below, which must run inside a transaction.
+    """
+    seen_at = seen_at or timezone.now()
+    if DeviceStatus.objects.filter(pk=device.pk, is_online=True, last_seen__lt=seen_at).update(last_seen=seen_at):
+        return None, {}
+
+    status, created = DeviceStatus.objects.select_for_update().get_or_create(device=device)
+    before = status_keys(None if created else status)
+    if status.last_seen is None or seen_at > status.last_seen:
+        status.last_seen = seen_at
+    if status.is_online:
+        status.save(update_fields=['last_seen', 'updated_at'])
+        return status, {}
+
+    _mark_online(status)
+    status.save(update_fields=['last_seen', 'is_online', 'offline_since', 'updated_at'])
+    delta = diff_keys(before, status_keys(status))
+    if delta:
+        get_counter_store().apply(delta)
+    return status, delta
+
+
+def offline_cutoff(now=None):
+    return (now or timezone.now()) - timedelta(
+        seconds=getattr(settings, 'DEVICE_OFFLINE_AFTER_SECONDS', 300)
+    )
+
+
+def mark_offline(now=None):
+    """
+    Move devices that have not reported since the offline cutoff to offline
+    and schedule their offline events. Only online devices past the cutoff
+    are touched (``last_seen`` is indexed), so a sweep costs O(changed
+    devices). Returns the DeviceStatus rows that changed.
+    """
+    now = now or timezone.now()
+    cutoff = offline_cutoff(now)
+    candidates = list(
+        DeviceStatus.objects.filter(is_online=True, last_seen__lt=cutoff).values_list('pk', flat=True)
+    )
+    changed = []
+    for pk in candidates:
+        with transaction.atomic():
+            status = DeviceStatus.objects.select_for_update().filter(pk=pk).first()
+            # A reading may have arrived since the candidates were listed
+            if status is None or not status.is_online or status.last_seen >= cutoff:
+                continue
+            before = status_keys(status)
+            status.is_online = False
+            status.offline_since = status.last_seen
+            status.save(update_fields=['is_online', 'offline_since', 'updated_at'])
+            delta = diff_keys(before, status_keys(status))
+            if delta:
+                get_counter_store().apply(delta)
+            transaction.on_commit(partial(notify_offline, status, now))
+        changed.append(status)
+    return changed
+
+
+def device_added(device):
+    """Count a newly registered device as never seen"""
+    with transaction.atomic():
+        DeviceStatus.objects.get_or_create(device=device)
+        get_counter_store().apply({TOTAL_KEY: 1, **{key: 1 for key in status_keys(None)}})
+
+
+def device_removed(device):
+    """Remove a device's contribution before it is deleted"""
+    status = DeviceStatus.objects.filter(device=device).first()
+    get_counter_store().apply({TOTAL_KEY: -1, **{key: -1 for key in status_keys(status)}})
@@ -0,0 +1,67 @@
+"""
+Heartbeat handling for ESP32 devices.
+
+A heartbeat is written as narrow UPDATEs: the volatile values (signal
+strength, uptime, free heap) go to ``DeviceHeartbeat``, ``last_seen`` on
+``DeviceStatus`` keeps the device online for the offline sweeper. The device
+row and its ``metadata`` JSON are only rewritten when a value stored there
+(IP address, firmware version) actually changed. The cached device only
+tells whether to look: the change is merged into the row's current metadata,
+read under a row lock, so a concurrent edit of other keys is kept.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .fleet_status import record_heartbeat
+from .models import Device, DeviceHeartbeat
+from .registry import invalidate_device
+
+# Values kept in Device.metadata, rewritten only when they change
+METADATA_FIELDS = ('ip_address', 'firmware_version')
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def metadata_changes(metadata, data):
+    """The metadata values in ``data`` that differ from the stored ones"""
+    metadata = metadata or {}
+    return {
+        field: data[field] for field in METADATA_FIELDS
+        if data.get(field) not in (None, '') and data[field] != metadata.get(field)
+    }
+
+
+def store_heartbeat(device, data, now=None):
+    """
+    Record a heartbeat of ``device`` (as returned by the device registry,
+    shared between threads and never modified here). ``data`` is the
+    heartbeat payload. Returns the metadata fields that changed.
+    """
+    now = now or timezone.now()
+    values = {
+        'last_heartbeat': now,
+        'signal_strength': _int(data.get('signal_strength')),
+        'uptime': _int(data.get('uptime')),
+        'free_heap': _int(data.get('free_heap')),
+    }
+    changes = metadata_changes(device.metadata, data)
+
+    with transaction.atomic():
+        if not DeviceHeartbeat.objects.filter(device_id=device.pk).update(**values):
+            DeviceHeartbeat.objects.update_or_create(device_id=device.pk, defaults=values)
+        if changes:
+            # The cached metadata may be stale, merge into what the row holds now
+            rows = Device.objects.select_for_update().filter(pk=device.pk)
+            metadata = rows.values_list('metadata', flat=True).first() or {}
+            changes = metadata_changes(metadata, data)
+            if changes:
+                rows.update(metadata={**metadata, **changes})
+                # A queryset update sends no signals
+                invalidate_device(device.pk)
+        record_heartbeat(device, seen_at=now)
+    return changes
@@ -0,0 +1,77 @@
+"""
+Duplicate suppression for device readings.
+
+Firmware resends a reading when it does not get an answer in time, so a slow
+ingest used to store the reading (and send its alerts) twice. Each reading
+gets an idempotency key, unique per device:
+
+- the ``Idempotency-Key`` header, or ``IDEMPOTENCY_KEY`` / ``SEQ`` in the
+  payload, when the firmware sends one
+- otherwise the device clock ``TS``, unless ``INGEST_DEDUPE_ON_TIMESTAMP`` is
+  off (the clock of a device without NTP may repeat after a reboot)
+
+Recent keys are claimed in the cache (Redis in production) with an atomic
+add, so a retry is recognised without touching the database. The unique
+constraint on ``DeviceData(device, idempotency_key)`` catches whatever the
+cache misses: a retry after the key expired, or a cache outage.
+"""
+import hashlib
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 64
+
+
+def _normalize(value):
+    key = str(value).strip()
+    if len(key) > MAX_KEY_LENGTH:
+        return hashlib.sha256(key.encode()).hexdigest()
+    return key
+
+
+def reading_key(payload, explicit=None):
+    """The idempotency key of a reading, or None when it cannot be told apart from a retry"""
+    for value in (explicit, payload.get('IDEMPOTENCY_KEY'), payload.get('SEQ')):
+        if value not in (None, ''):
+            return _normalize(f"k:{value}")
+    ts = payload.get('TS')
+    if getattr(settings, 'INGEST_DEDUPE_ON_TIMESTAMP', True) and ts not in (None, '', 0, '0', 'None'):
+        return _normalize(f"ts:{ts}")
+    return None
+
+
+def _cache_key(device_pk, key):
+    return f"ingest:seen:{device_pk}:{key}"
+
+
+def claim(device_pk, key):
+    """
+    Claim ``key`` for a reading of ``device_pk``. False when the key was
+    claimed recently, i.e. the reading is a retry. Without the cache every
+    claim succeeds and the unique constraint decides.
+    """
+    try:
+        return cache.add(
+            _cache_key(device_pk, key), 1, getattr(settings, 'INGEST_IDEMPOTENCY_TTL_SECONDS', 24 * 3600)
+        )
+    except Exception as e:
+        logger.error(f"Idempotency cache unavailable: {e}")
+        return True
+
+
+def release(device_pk, key):
+    """Forget a claim whose reading was not stored, so a retry is accepted"""
+    try:
+        cache.delete(_cache_key(device_pk, key))
+    except Exception as e:
+        logger.error(f"Idempotency cache unavailable: {e}")
+
+
+# For async views, the cache round trip runs off the event loop
+aclaim = sync_to_async(claim, thread_sensitive=False)
+arelease = sync_to_async(release, thread_sensitive=False)
@@ -0,0 +1,628 @@
+"""
+Device reading ingest shared by every transport.
+
+``ingest_reading`` stores one reading, updates the device's status, logs it
+and sends the alerts it triggers. The HTTP endpoint (``receive_device_data``),
+the batch endpoint and the device WebSocket consumer all call it, so
+validation and alerting behave the same whichever way a reading arrives.
+
+Batch uploads are read with :func:`iter_readings`, one reading at a time
+from the (possibly decompressing) request stream.
+
+A reading whose idempotency key was seen before (see device/idempotency.py)
+is acknowledged with ``"duplicate": true`` and neither stored nor alerted
+again.
+
+``aingest_reading`` is the same for async views. It awaits the realtime
+events and runs push notifications and the AppLog entry as background
+tasks, so a request holds no thread while Expo or Redis answer. That needs
+an event loop that outlives the request, as under ASGI: the loop Django
+runs an async view in under WSGI cancels what is still pending when the
+view returns, so there ``background=False`` awaits them instead.
+"""
+import asyncio
+import json
+import logging
+import math
+
+import msgpack
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import APIException, ParseError
+
+from backend.db import db_sync_to_async
+from users.log_policy import get_log_aggregator
+
+from .fleet_status import record_reading
+from .idempotency import aclaim, arelease, claim, reading_key, release
+from .models import Device, DeviceData, ExpoPushToken, Notification
+from .parsers import READING_STRUCT, unpack_readings
+from .rate_limit import admit_reading
+from .realtime import apublish_event, publish_event
+from .registry import get_device_registry
+from .utils import send_push_notification
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidReading(ValueError):
+    pass
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _int(value):
+    return None if value is None else int(value)
+
+
+def _tamper(value):
+    return str(value).lower()
+
+
+def _battery(value):
+    # Firmware sends 'None' and the like when no battery is fitted
+    if value in (None, '', 'None', 'none'):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_sent(value):
+    return value
+
+
+# (payload key, reading field, coercion, required) of every value a reading stores
+READING_FIELDS = (
+    ('ALERT', 'alert', _text, True),
+    ('count', 'count', _int, True),
+    ('REFER_Val', 'refer_val', _int, True),
+    ('TAMPER', 'tamper', _tamper, False),
+    ('TOTAL_USAGE', 'total_usage', _int, False),
+    ('BATTERY_PERCENTAGE', 'battery_percentage', _battery, False),
+    ('PWR_STATUS', 'power_status', _as_sent, False),
+    ('TS', 'device_timestamp', _as_sent, False),
+)
+
+
+def compile_reading_schema(fields):
+    """
+    Build a parser that validates and coerces a payload in one pass over
+    ``fields``. It returns the reading's values by field name and raises
+    ``InvalidReading`` naming the first bad key.
+    """
+    fields = tuple(fields)
+
+    def parse(payload):
+        get = payload.get
+        reading = {}
+        for key, name, coerce, required in fields:
+            value = get(key)
+            if value is None and required:
+                raise InvalidReading(f"{key} is required")
+            try:
+                reading[name] = coerce(value)
+            except (TypeError, ValueError):
+                raise InvalidReading(f"Invalid {key}: {value!r}")
+        return reading
+
+    return parse
+
+
+parse_reading = compile_reading_schema(READING_FIELDS)
+
+
+def _duplicate_response(device):
+    return {
+        "message": "Duplicate reading ignored",
+        "duplicate": True,
+        "notifications_sent": 0,
+        "notification_types": [],
+        "device_info": {
+            "id": device.id,
+            "room": device.room_number,
+            "floor": device.floor_number,
+        }
+    }
+
+
+def ingest_reading(device, payload, skip_notification_types=(), idempotency_key=None):
+    """
+    Record a reading of ``device``. ``payload`` uses the keys the firmware
+    sends (``ALERT``, ``count``, ``REFER_Val``, ``TAMPER``, ...). Alerts of a
+    type in ``skip_notification_types`` are not sent again. ``idempotency_key``
+    is the ``Idempotency-Key`` header, if any. Returns the response body of
+    the ingest endpoint. Raises ``InvalidReading`` for a malformed payload.
+    """
+    reading = parse_reading(payload)
+    key = reading_key(payload, idempotency_key)
+    if key is not None and not claim(device.pk, key):
+        return _duplicate_response(device)
+    try:
+        return _store_reading(device, reading, skip_notification_types, key)
+    except Exception:
+        if key is not None:
+            release(device.pk, key)
+        raise
+
+
+# Enhanced power off logic: treat empty, null, 0 as 'NO'
+def is_power_off_status(val):
+    if val is None:
+        return True
+    val_str = str(val).strip().lower()
+    return val_str in ['off', 'no', 'none', '', '0', 'false']
+
+
+def _save_reading(device, reading, key):
+    """
+    Store the reading and update the device's status, both commit together.
+    Returns the DeviceData row, or None when the reading was stored before.
+    """
+    try:
+        with transaction.atomic():
+            data = DeviceData.objects.create(
+                device=device,
+                alert=reading['alert'],
+                count=reading['count'],
+                refer_val=reading['refer_val'],
+                tamper=reading['tamper'],
+                total_usage=reading['total_usage'],
+                battery_percentage=reading['battery_percentage'],
+                power_status=reading['power_status'],
+                device_timestamp=reading['device_timestamp'],
+                idempotency_key=key,
+            )
+            record_reading(
+                device,
+                alert=data.alert,
+                tamper=reading['tamper'],
+                battery_percentage=reading['battery_percentage'],
+                power_status=reading['power_status'],
+                seen_at=data.timestamp,
+            )
+    except IntegrityError:
+        # A retry the cache did not catch (expired or unavailable)
+        if key is not None and DeviceData.objects.filter(device=device, idempotency_key=key).exists():
+            return None
+        raise
+    return data
+
+
+def _log_reading(device, reading):
+    # --- Log the device alert to AppLog ---
+    # In full when the device state changes, otherwise as a periodic summary
+    try:
+        get_log_aggregator().record(
+            source='device.receive_device_data',
+            key=device.id,
+            state=(reading['alert'], reading['tamper'], is_power_off_status(reading['power_status'])),
+            message=f"Device alert received: {reading['alert']}",
+            summary="{count} readings received from device {key} in the last {seconds}s",
+            device_id=device.id,
+            alert=reading['alert'],
+            tamper=reading['tamper'],
+            battery=reading['battery_percentage'],
+            power_status=reading['power_status'],
+            count=reading['count'],
+            refer_val=reading['refer_val'],
+            total_usage=reading['total_usage'],
+            device_timestamp=reading['device_timestamp']
+        )
+    except Exception as log_exc:
+        print(f"Failed to log device alert to AppLog: {log_exc}")
+
+
+def _notifications_for(device, reading, skip_notification_types=()):
+    """The alerts a reading raises, minus the types in ``skip_notification_types``"""
+    tamper_value = reading['tamper']
+    power_status = reading['power_status']
+    battery_percentage_val = reading['battery_percentage']
+
+    # Check conditions for notifications
+    alert_status = reading['alert']
+    is_low_alert = alert_status == "LOW"
+    is_empty_alert = alert_status == "EMPTY"
+    is_tampered = tamper_value == "true"
+    is_power_off = is_power_off_status(power_status)
+    # Battery notification thresholds
+    battery_low_threshold = 20.0
+    battery_critical_threshold = 10.0
+    is_battery_critical = battery_percentage_val is not None and battery_percentage_val <= battery_critical_threshold
+    is_battery_low = battery_percentage_val is not None and battery_critical_threshold < battery_percentage_val <= battery_low_threshold
+
+    notifications_to_send = []
+    # Combined notification for low/critical battery AND power off
+    if (is_battery_critical or is_battery_low) and is_power_off:
+        notifications_to_send.append({
+            "type": "battery_power_off",
+            "notification_type": "battery_power_off",
+            "title": "Battery & Power Alert",
+            "message": f"Battery is {'CRITICAL' if is_battery_critical else 'LOW'} ({battery_percentage_val}%) and device power is OFF! Immediate action required.",
+            "device_name": device.name,
+            "device_id": device.id,
+            "room": device.room_number,
+            "floor": device.floor_number,
+            "priority": 110
+        })
+    else:
+        if is_tampered:
+            notifications_to_send.append({
+                "type": "tamper",
+                "notification_type": "tamper",
+                "title": "Tamper Alert",
+                "message": "Device tampering detected",
+                "device_name": device.name,
+                "device_id": device.id,
+                "room": device.room_number,
+                "floor": device.floor_number,
+                "priority": 100
+            })
+        if is_empty_alert:
+            notifications_to_send.append({
+                "type": "empty",
+                "notification_type": "empty",
+                "title": "Empty Alert",
+                "message": "Container is empty - needs refill",
+                "device_name": device.name,
+                "device_id": device.id,
+                "room": device.room_number,
+                "floor": device.floor_number,
+                "priority": 90
+            })
+        if is_low_alert:
+            notifications_to_send.append({
+                "type": "low",
+                "notification_type": "low",
+                "title": "Low Tissue Alert",
+                "message": "Low tissue detected - refill soon",
+                "device_name": device.name,
+                "device_id": device.id,
+                "room": device.room_number,
+                "floor": device.floor_number,
+                "priority": 80
+            })
+        if is_battery_critical:
+            notifications_to_send.append({
+                "type": "battery_critical",
+                "notification_type": "battery_critical",
+                "title": "Critical Battery Alert",
+                "message": f"Battery critically low ({battery_percentage_val}%)! Immediate replacement required.",
+                "device_name": device.name,
+                "device_id": device.id,
+                "room": device.room_number,
+                "floor": device.floor_number,
+                "priority": 75
+            })
+        elif is_battery_low:
+            notifications_to_send.append({
+                "type": "battery_low",
+                "notification_type": "battery_low",
+                "title": "Low Battery Alert",
+                "message": f"Battery low ({battery_percentage_val}%). Replace soon.",
+                "device_name": device.name,
+                "device_id": device.id,
+                "room": device.room_number,
+                "floor": device.floor_number,
+                "priority": 74
+            })
+        if is_power_off:
+            notifications_to_send.append({
+                "type": "power_off",
+                "notification_type": "power_off",
+                "title": "Power Off Alert",
+                "message": "Device power is OFF! Check power supply.",
+                "device_name": device.name,
+                "device_id": device.id,
+                "room": device.room_number,
+                "floor": device.floor_number,
+                "priority": 70
+            })
+
+    if skip_notification_types:
+        notifications_to_send = [
+            n for n in notifications_to_send if n["type"] not in skip_notification_types
+        ]
+    return notifications_to_send
+
+
+def _notification_fields(device, reading, notif_data):
+    return dict(
+        device=device,
+        message=notif_data["message"],
+        title=notif_data["title"],
+        notification_type=notif_data["type"],
+        alert=reading['alert'],
+        tamper=reading['tamper'],
+        battery_percentage=reading['battery_percentage'],
+        power_status=reading['power_status'],
+        priority=notif_data["priority"]
+    )
+
+
+def _event_content(device, reading, data, notif_data, notification):
+    return {
+        "id": notification.id,
+        "device_id": device.id,
+        "device": {
+            "id": device.id,
+            "name": device.name if hasattr(device, 'name') else f"Device {device.id}",
+            "device_id": device.id,
+            "room_number": device.room_number,
+            "floor_number": device.floor_number,
+        },
+        "room": device.room_number,
+        "floor": device.floor_number,
+        "timestamp": str(data.timestamp),
+        "alert": reading['alert'],
+        "tamper": reading['tamper'],
+        "battery_percentage": reading['battery_percentage'],
+        "power_status": reading['power_status'],
+        "type": notif_data["type"],
+        "notification_type": notif_data["notification_type"],
+        "title": notif_data["title"],
+        "message": notif_data["message"],
+        "priority": notif_data["priority"],
+        "created_at": str(notification.created_at),
+        "is_read": False,
+    }
+
+
+def _push_tokens(device):
+    # Only send to unique tokens for this device (avoid sending to all tokens in DB)
+    return ExpoPushToken.objects.filter(device=device).distinct('token') if hasattr(ExpoPushToken, 'device') else ExpoPushToken.objects.all().distinct('token')
+
+
+def _send_push(token, device, reading, notif_data, notification):
+    try:
+        send_push_notification(
+            token,
+            title=notif_data["title"],
+            body=notif_data["message"],
+            data={
+                "device_id": device.id,
+                "notification_id": notification.id,
+                "type": notif_data["type"],
+                "notification_type": notif_data["notification_type"],
+                "priority": notif_data["priority"],
+                "room": device.room_number,
+                "floor": device.floor_number,
+                "device_name": device.name if hasattr(device, 'name') else f"Device {device.id}",
+                "battery_percentage": reading['battery_percentage'],
+                "power_status": reading['power_status'],
+            },
+            notification_type=notif_data["type"]
+        )
+    except Exception as e:
+        print(f"Failed to send push notification to {token}: {e}")
+
+
+def _reading_response(device, reading, notifications_to_send):
+    return {
+        "message": "Data recorded successfully",
+        "notifications_sent": len(notifications_to_send),
+        "notification_types": [n["type"] for n in notifications_to_send],
+        "alert_status": reading['alert'],
+        "tamper_status": reading['tamper'],
+        "battery_percentage": reading['battery_percentage'],
+        "power_status": reading['power_status'],
+        "device_info": {
+            "id": device.id,
+            "room": device.room_number,
+            "floor": device.floor_number,
+        }
+    }
+
+
+async def aingest_reading(device, payload, skip_notification_types=(), idempotency_key=None, background=True):
+    """
+    Async version of :func:`ingest_reading`. With ``background`` the AppLog
+    entry and push notifications are left running when it returns, only for
+    event loops that outlive the request.
+    """
+    reading = parse_reading(payload)
+    key = reading_key(payload, idempotency_key)
+    if key is not None and not await aclaim(device.pk, key):
+        return _duplicate_response(device)
+    try:
+        return await _astore_reading(device, reading, skip_notification_types, key, background)
+    except Exception:
+        if key is not None:
+            await arelease(device.pk, key)
+        raise
+
+
+def _store_reading(device, reading, skip_notification_types, key):
+    data = _save_reading(device, reading, key)
+    if data is None:
+        return _duplicate_response(device)
+    _log_reading(device, reading)
+    notifications_to_send = _notifications_for(device, reading, skip_notification_types)
+
+    # Send all applicable notifications to the topics they belong to
+    channel_layer = get_channel_layer()
+    for notif_data in notifications_to_send:
+        notification = Notification.objects.create(**_notification_fields(device, reading, notif_data))
+        publish_event(_event_content(device, reading, data, notif_data, notification), channel_layer)
+        for token_entry in _push_tokens(device):
+            _send_push(token_entry.token, device, reading, notif_data, notification)
+
+    return _reading_response(device, reading, notifications_to_send)
+
+
+# Side effects of async ingest still running; the event loop only keeps weak references
+_background_tasks = set()
+
+
+def _spawn(coroutine):
+    task = asyncio.ensure_future(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _side_effect(coroutine, background):
+    if background:
+        _spawn(coroutine)
+    else:
+        await coroutine
+
+
+async def _astore_reading(device, reading, skip_notification_types, key, background):
+    # The async ORM has no transactions, the reading and status update run as one in a thread
+    data = await sync_to_async(_save_reading)(device, reading, key)
+    if data is None:
+        return _duplicate_response(device)
+    await _side_effect(db_sync_to_async(_log_reading)(device, reading), background)
+    notifications_to_send = _notifications_for(device, reading, skip_notification_types)
+
+    channel_layer = get_channel_layer()
+    for notif_data in notifications_to_send:
+        notification = await Notification.objects.acreate(**_notification_fields(device, reading, notif_data))
+        try:
+            await apublish_event(_event_content(device, reading, data, notif_data, notification), channel_layer)
+        except Exception as e:
+            logger.error(f"Failed to publish realtime event: {e}")
+        async for token_entry in _push_tokens(device):
+            await _side_effect(sync_to_async(_send_push, thread_sensitive=False)(
+                token_entry.token, device, reading, notif_data, notification
+            ), background)
+
+    return _reading_response(device, reading, notifications_to_send)
+
+
+def _iter_chunks(stream, size=64 * 1024):
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_ndjson(stream):
+    buffer = b''
+    for chunk in _iter_chunks(stream):
+        buffer += chunk
+        lines = buffer.split(b'\n')
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+def _iter_msgpack(stream):
+    unpacker = msgpack.Unpacker(stream, raw=False, strict_map_key=False, read_size=64 * 1024)
+    try:
+        # A single array is read item by item
+        for _ in range(unpacker.read_array_header()):
+            yield unpacker.unpack()
+    except ValueError:
+        # Not an array: a stream of maps
+        yield from unpacker
+
+
+def _iter_structs(stream):
+    size = READING_STRUCT.size
+    buffer = b''
+    for chunk in _iter_chunks(stream):
+        buffer += chunk
+        usable = len(buffer) - len(buffer) % size
+        if usable:
+            yield from unpack_readings(buffer[:usable])
+            buffer = buffer[usable:]
+    if buffer:
+        raise ParseError(f"Reading body must be a multiple of {READING_STRUCT.size} bytes")
+
+
+def iter_readings(stream, content_type):
+    """
+    Yield the readings of a batch body one by one. NDJSON, MessagePack and
+    binary records are parsed incrementally; a JSON array (or an object with
+    a ``readings`` array) is parsed in one go.
+    """
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    try:
+        if media_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+            yield from _iter_ndjson(stream)
+        elif media_type in ('application/msgpack', 'application/x-msgpack'):
+            yield from _iter_msgpack(stream)
+        elif media_type == 'application/vnd.dispenser.reading':
+            yield from _iter_structs(stream)
+        elif media_type in ('application/json', ''):
+            data = json.loads(stream.read())
+            if isinstance(data, dict):
+                data = data.get('readings')
+            if not isinstance(data, list):
+                raise ParseError("Expected an array of readings")
+            yield from data
+        else:
+            raise ParseError(f"Unsupported batch content type: {media_type}")
+    except (ValueError, msgpack.ExtraData) as exc:
+        # json.JSONDecodeError and msgpack errors are ValueErrors
+        raise ParseError(f"Batch parse error - {exc}")
+
+
+def ingest_batch(readings, default_device_id=None):
+    """
+    Ingest readings in order, each in its own transaction. Every alert type
+    is sent at most once per device per batch, a backlog of LOW readings
+    raises one LOW alert. Readings stored before (a resent batch) count as
+    accepted and as ``duplicates``. Each reading takes a token of its device's
+    ingest rate limit like a single one does. Stops after
+    ``DEVICE_BATCH_MAX_READINGS``, at the first reading over the rate limit
+    (``retry_after`` then holds the seconds to wait), or at a body that cannot
+    be read any further; ``error`` holds the status and detail. Readings
+    before that point stay stored, ``processed`` tells the device how many it
+    can drop from its buffer.
+    """
+    max_readings = getattr(settings, 'DEVICE_BATCH_MAX_READINGS', 5000)
+    registry = get_device_registry()
+    sent_types = {}
+    result = {'processed': 0, 'accepted': 0, 'duplicates': 0, 'failed': 0, 'notifications_sent': 0, 'errors': []}
+
+    readings = iter(readings)
+    for index in range(max_readings + 1):
+        try:
+            payload = next(readings)
+        except StopIteration:
+            break
+        except APIException as exc:
+            result['error'] = {'status': exc.status_code, 'detail': str(exc.detail)}
+            break
+        if index == max_readings:
+            result['truncated'] = True
+            break
+        did = payload.get('DID', default_device_id) if isinstance(payload, dict) else None
+        retry_after = admit_reading(did)
+        if retry_after:
+            # Not processed, the device keeps it and the rest of its buffer
+            result['error'] = {'status': 429, 'detail': "Rate limit exceeded"}
+            result['retry_after'] = max(1, math.ceil(retry_after))
+            break
+        result['processed'] += 1
+        try:
+            if not isinstance(payload, dict):
+                raise ValueError("Reading must be an object")
+            device = registry.get(did)
+            already_sent = sent_types.setdefault(device.pk, set())
+            outcome = ingest_reading(device, payload, skip_notification_types=already_sent)
+        except Device.DoesNotExist:
+            error = "Device not found"
+        except Exception as e:
+            error = str(e)
+        else:
+            already_sent.update(outcome['notification_types'])
+            result['accepted'] += 1
+            result['duplicates'] += outcome.get('duplicate', False)
+            result['notifications_sent'] += outcome['notifications_sent']
+            continue
+        result['failed'] += 1
+        if len(result['errors']) < 100:
+            result['errors'].append({'index': index, 'error': error})
+    return result
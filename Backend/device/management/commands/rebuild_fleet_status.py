@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from device.fleet_status import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Recount the fleet status counters from the current device statuses"
+
+    def handle(self, *args, **options):
+        counts = rebuild_counters()
+        for key in sorted(counts):
+            self.stdout.write(f"{key}: {counts[key]}")
+        self.stdout.write(self.style.SUCCESS("Fleet status counters rebuilt"))
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from device.fleet_status import mark_offline, rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Move devices that stopped reporting to offline, send offline events and keep the fleet status counters in sync"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single sweep and exit')
+        parser.add_argument('--interval', type=int, help='Seconds between sweeps (default FLEET_SWEEP_INTERVAL_SECONDS)')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or getattr(settings, 'FLEET_SWEEP_INTERVAL_SECONDS', 30)
+        reconcile_every = getattr(settings, 'FLEET_RECONCILE_SECONDS', 3600)
+        last_reconcile = None
+
+        while True:
+            close_old_connections()
+            if last_reconcile is None or time.monotonic() - last_reconcile >= reconcile_every:
+                # Recount every bucket from DeviceStatus to correct any drift
+                rebuild_counters()
+                last_reconcile = time.monotonic()
+
+            # Offline events are sent as each transition commits
+            changed = mark_offline()
+            if changed or options['once']:
+                self.stdout.write(f"{len(changed)} device(s) moved to offline")
+                for status in changed:
+                    self.stdout.write(f"  device {status.device_id}: last seen {status.offline_since}")
+            if options['once']:
+                break
+            time.sleep(interval)
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:51
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+
+def backfill_device_status(apps, schema_editor):
+    # Seed each device's status from its latest reading; the fleet counters
+    # are rebuilt from these rows on first read
+    Device = apps.get_model('device', 'Device')
+    DeviceData = apps.get_model('device', 'DeviceData')
+    DeviceStatus = apps.get_model('device', 'DeviceStatus')
+
+    latest = DeviceData.objects.filter(device=OuterRef('pk')).order_by('-timestamp')
+    pairs = list(Device.objects.annotate(latest_id=Subquery(latest.values('id')[:1])).values_list('id', 'latest_id'))
+    readings = DeviceData.objects.in_bulk([latest_id for _, latest_id in pairs if latest_id])
+    online_since = timezone.now() - timedelta(minutes=5)
+
+    statuses = []
+    for device_id, latest_id in pairs:
+        data = readings.get(latest_id)
+        if data is None:
+            statuses.append(DeviceStatus(device_id=device_id))
+            continue
+        statuses.append(DeviceStatus(
+            device_id=device_id,
+            alert=data.alert,
+            tamper=str(data.tamper).lower() == 'true',
+            battery_percentage=data.battery_percentage,
+            power_status=data.power_status,
+            last_seen=data.timestamp,
+            is_online=data.timestamp >= online_since,
+        ))
+    DeviceStatus.objects.bulk_create(statuses, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0021_alter_device_gender_alter_device_tissue_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceStatus',
+            fields=[
+                ('device', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='status', serialize=False, to='device.device')),
+                ('alert', models.CharField(blank=True, max_length=20, null=True)),
+                ('tamper', models.BooleanField(default=False)),
+                ('battery_percentage', models.FloatField(blank=True, null=True)),
+                ('power_status', models.CharField(blank=True, max_length=10, null=True)),
+                ('last_seen', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('is_online', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'device statuses',
+            },
+        ),
+        migrations.CreateModel(
+            name='FleetCounter',
+            fields=[
+                ('key', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_device_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:55
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_offline_since(apps, schema_editor):
+    # Devices already offline report their return like any swept device
+    DeviceStatus = apps.get_model('device', 'DeviceStatus')
+    DeviceStatus.objects.filter(is_online=False, last_seen__isnull=False).update(offline_since=F('last_seen'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0022_devicestatus_fleetcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicestatus',
+            name='offline_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_offline_since, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('tamper', 'Tamper Alert'), ('empty', 'Empty Alert'), ('low', 'Low Tissue Alert'), ('battery_low', 'Low Battery Alert'), ('battery_critical', 'Critical Battery Alert'), ('power_off', 'Power Off Alert'), ('offline', 'Device Offline'), ('online', 'Device Back Online')], default='low', help_text='Type of alert for frontend styling', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='priority',
+            field=models.IntegerField(default=50, help_text='Priority for sorting (100=tamper, 90=empty, 80=low, 75=battery_critical, 74=battery_low, 70=power_off, 65=offline, 60=full, 55=online)'),
+        ),
+    ]
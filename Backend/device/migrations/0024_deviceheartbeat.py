@@ -0,0 +1,55 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def copy_heartbeats_from_metadata(apps, schema_editor):
+    # Heartbeats used to be stored in Device.metadata
+    Device = apps.get_model('device', 'Device')
+    DeviceHeartbeat = apps.get_model('device', 'DeviceHeartbeat')
+
+    heartbeats = []
+    for device_id, metadata in Device.objects.exclude(metadata=None).values_list('id', 'metadata').iterator():
+        if not isinstance(metadata, dict) or not metadata.get('last_heartbeat'):
+            continue
+        last_heartbeat = parse_datetime(str(metadata['last_heartbeat']))
+        if last_heartbeat is None:
+            continue
+        heartbeats.append(DeviceHeartbeat(
+            device_id=device_id,
+            last_heartbeat=last_heartbeat,
+            signal_strength=_int(metadata.get('signal_strength')),
+            uptime=_int(metadata.get('uptime')),
+            free_heap=_int(metadata.get('free_heap')),
+        ))
+    DeviceHeartbeat.objects.bulk_create(heartbeats, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0023_devicestatus_offline_since'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceHeartbeat',
+            fields=[
+                ('device', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='heartbeat', serialize=False, to='device.device')),
+                ('last_heartbeat', models.DateTimeField()),
+                ('signal_strength', models.IntegerField(blank=True, null=True)),
+                ('uptime', models.BigIntegerField(blank=True, null=True)),
+                ('free_heap', models.IntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(copy_heartbeats_from_metadata, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:04
+
+from django.db import migrations, models
+
+
+CONSTRAINT_NAME = 'devicedata_unique_idempotency_key'
+
+
+CONSTRAINT = models.UniqueConstraint(
+    condition=models.Q(('idempotency_key__isnull', False)),
+    fields=('device', 'idempotency_key'),
+    name=CONSTRAINT_NAME,
+)
+
+
+def create_unique_index(apps, schema_editor):
+    # device_devicedata is large and written constantly, build the index without locking it
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {CONSTRAINT_NAME} "
+            "ON device_devicedata (device_id, idempotency_key) WHERE idempotency_key IS NOT NULL"
+        )
+    else:
+        schema_editor.add_constraint(apps.get_model('device', 'DeviceData'), CONSTRAINT)
+
+
+def drop_unique_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {CONSTRAINT_NAME}")
+    else:
+        schema_editor.remove_constraint(apps.get_model('device', 'DeviceData'), CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('device', '0024_deviceheartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicedata',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(model_name='devicedata', constraint=CONSTRAINT),
+            ],
+            database_operations=[
+                migrations.RunPython(create_unique_index, drop_unique_index),
+            ],
+        ),
+    ]
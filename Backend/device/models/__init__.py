@@ -4,5 +4,6 @@ from .device import Device
 from .device_data import DeviceData
 from .notification import Notification
 from .push_token import ExpoPushToken
+from .device_status import DeviceHeartbeat, DeviceStatus, FleetCounter
 
-__all__ = ['Device', 'DeviceData', 'Notification', 'ExpoPushToken']
+__all__ = ['Device', 'DeviceData', 'Notification', 'ExpoPushToken', 'DeviceStatus', 'DeviceHeartbeat', 'FleetCounter']
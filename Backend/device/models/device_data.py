@@ -15,6 +15,17 @@ class DeviceData(models.Model):
     battery_percentage = models.FloatField(null=True, blank=True)
     power_status = models.CharField(max_length=10, null=True, blank=True, help_text="Power status at time of data (ON/OFF/NONE)")
     device_timestamp = models.CharField(max_length=50, null=True, blank=True)
+    # Tells a firmware retry from a new reading, see device/idempotency.py
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device', 'idempotency_key'],
+                condition=models.Q(idempotency_key__isnull=False),
+                name='devicedata_unique_idempotency_key',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.device.name} @ {self.timestamp}"
\ No newline at end of file
@@ -0,0 +1,50 @@
+from django.db import models
+from .device import Device
+
+
+
+class DeviceStatus(models.Model):
+    """
+    Current state of a device, updated by ingest and by the offline sweeper.
+    The fleet status counters (device/fleet_status.py) are derived from it.
+    """
+    device = models.OneToOneField(Device, on_delete=models.CASCADE, primary_key=True, related_name='status')
+    alert = models.CharField(max_length=20, null=True, blank=True)
+    tamper = models.BooleanField(default=False)
+    battery_percentage = models.FloatField(null=True, blank=True)
+    power_status = models.CharField(max_length=10, null=True, blank=True)
+    last_seen = models.DateTimeField(null=True, blank=True, db_index=True)
+    is_online = models.BooleanField(default=False)
+    # Last reading or heartbeat before the sweeper marked the device offline
+    offline_since = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'device statuses'
+
+    def __str__(self):
+        return f"{self.device_id} - {'online' if self.is_online else 'offline'}"
+
+
+class DeviceHeartbeat(models.Model):
+    """
+    Latest heartbeat of a device. Kept out of ``Device.metadata`` so a
+    heartbeat is a single narrow UPDATE instead of rewriting the device row.
+    """
+    device = models.OneToOneField(Device, on_delete=models.CASCADE, primary_key=True, related_name='heartbeat')
+    last_heartbeat = models.DateTimeField()
+    signal_strength = models.IntegerField(null=True, blank=True)
+    uptime = models.BigIntegerField(null=True, blank=True)
+    free_heap = models.IntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.device_id} - {self.last_heartbeat}"
+
+
+class FleetCounter(models.Model):
+    """Database backend of the fleet status counters, one row per bucket"""
+    key = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
@@ -25,6 +25,8 @@ class Notification(models.Model):
         ('battery_low', 'Low Battery Alert'),
         ('battery_critical', 'Critical Battery Alert'),
         ('power_off', 'Power Off Alert'),
+        ('offline', 'Device Offline'),
+        ('online', 'Device Back Online'),
         # ('full', 'Full Alert'),  # COMMENTED OUT - Full notifications disabled
     ]
     
@@ -43,7 +45,7 @@ class Notification(models.Model):
     power_status = models.CharField(max_length=10, blank=True, default='', help_text="Power status at time of notification (ON/OFF/NONE)")
     priority = models.IntegerField(
         default=50,
-        help_text="Priority for sorting (100=tamper, 90=empty, 80=low, 75=battery_critical, 74=battery_low, 70=power_off, 60=full)"
+        help_text="Priority for sorting (100=tamper, 90=empty, 80=low, 75=battery_critical, 74=battery_low, 70=power_off, 65=offline, 60=full, 55=online)"
     )
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
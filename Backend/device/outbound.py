@@ -0,0 +1,219 @@
+"""
+Per-connection outbound buffering for WebSocket consumers.
+
+Events pushed during a short window are coalesced and flushed together as a
+single JSON array frame, so an alert storm (e.g. a power outage where dozens
+of dispensers report at once) costs one frame per window instead of one per
+event. Frames are capped both in event count and in encoded size.
+
+The buffer is also bounded, so a slow client cannot make server memory grow:
+- once a client falls behind, routine events for the same device and type
+  are coalesced to the latest one
+- when full, the lowest priority events are dropped first, tamper and empty
+  alerts (priority >= ``CRITICAL_PRIORITY``) are kept as long as possible
+- a client whose oldest queued event has waited too long is reported as slow
+  so the consumer can disconnect it
+"""
+import asyncio
+import json
+import logging
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Notification priorities come from ingest (tamper=100, empty=90, low=80, ...)
+CRITICAL_PRIORITY = 90
+
+# Live buffers of this worker process, used to expose lag metrics
+_buffers = weakref.WeakSet()
+
+
+def connection_stats():
+    """Lag metrics of every open connection handled by this worker"""
+    return [buffer.stats() for buffer in list(_buffers)]
+
+
+class _Entry:
+    __slots__ = ('priority', 'key', 'payload', 'enqueued_at')
+
+    def __init__(self, priority, key, payload):
+        self.priority = priority
+        self.key = key
+        self.payload = payload
+        self.enqueued_at = time.monotonic()
+
+
+class OutboundBuffer:
+    def __init__(self, send, window_ms=150, max_frame_bytes=64 * 1024, max_frame_events=100,
+                 max_pending=500, slow_consumer_seconds=30, label=None):
+        """
+        ``send`` is an async callable taking the encoded text frame.
+        A ``window_ms`` of 0 disables coalescing and sends every event as it comes.
+        """
+        self._send = send
+        self.window = max(window_ms, 0) / 1000.0
+        self.max_frame_bytes = max_frame_bytes
+        self.max_frame_events = max(max_frame_events, 1)
+        self.max_pending = max(max_pending, 1)
+        # Coalescing only kicks in once this many events are waiting
+        self.coalesce_threshold = max(self.max_pending // 4, 1)
+        self.slow_consumer_seconds = slow_consumer_seconds
+        self.label = label
+        self._pending = []
+        self._by_key = {}
+        self._flush_task = None
+        self._send_lock = asyncio.Lock()
+        self._closed = False
+        self._metrics = {
+            'enqueued': 0,
+            'sent_events': 0,
+            'sent_frames': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'max_pending': 0,
+            'last_send_ms': 0.0,
+            'max_lag_ms': 0.0,
+        }
+        _buffers.add(self)
+
+    @staticmethod
+    def _classify(message):
+        """Return (priority, coalesce key) for a message"""
+        content = message.get('content') or {}
+        try:
+            priority = int(content.get('priority') or 0)
+        except (TypeError, ValueError):
+            priority = 0
+        key = None
+        if priority < CRITICAL_PRIORITY and content.get('device_id') is not None:
+            # Only the latest routine event per device and type matters
+            key = (content.get('device_id'), content.get('notification_type') or content.get('type'))
+        return priority, key
+
+    def push(self, message):
+        """Queue a message and make sure a flush is scheduled"""
+        if self._closed:
+            return
+        priority, key = self._classify(message)
+        # Encode once, frames are assembled from the encoded parts
+        payload = json.dumps(message, default=str)
+        self._metrics['enqueued'] += 1
+
+        existing = self._by_key.get(key) if key is not None else None
+        if existing is not None and len(self._pending) >= self.coalesce_threshold:
+            existing.payload = payload
+            existing.priority = max(existing.priority, priority)
+            self._metrics['coalesced'] += 1
+        else:
+            if len(self._pending) >= self.max_pending and not self._make_room(priority):
+                self._metrics['dropped'] += 1
+                return
+            entry = _Entry(priority, key, payload)
+            self._pending.append(entry)
+            if key is not None:
+                self._by_key[key] = entry
+
+        self._metrics['max_pending'] = max(self._metrics['max_pending'], len(self._pending))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    def _make_room(self, priority):
+        """Drop the oldest lowest priority entry if it ranks below ``priority``"""
+        victim = min(self._pending, key=lambda e: e.priority)
+        if victim.priority > priority:
+            return False
+        self._pending.remove(victim)
+        if victim.key is not None:
+            self._by_key.pop(victim.key, None)
+        self._metrics['dropped'] += 1
+        return True
+
+    @property
+    def lag(self):
+        """Seconds the oldest queued event has been waiting"""
+        if not self._pending:
+            return 0.0
+        return time.monotonic() - self._pending[0].enqueued_at
+
+    @property
+    def is_slow(self):
+        """True once the client has fallen too far behind"""
+        return self.lag >= self.slow_consumer_seconds
+
+    async def _flush_later(self):
+        if self.window:
+            await asyncio.sleep(self.window)
+        async with self._send_lock:
+            # Messages pushed from here on get a flush of their own, which waits
+            # for this one so frames are never interleaved
+            self._flush_task = None
+            await self._flush_locked()
+
+    async def flush(self):
+        """Send everything pending, split into capped frames"""
+        async with self._send_lock:
+            await self._flush_locked()
+
+    async def _flush_locked(self):
+        pending, self._pending = self._pending, []
+        self._by_key = {}
+        if not pending:
+            return
+        now = time.monotonic()
+        self._metrics['max_lag_ms'] = max(
+            self._metrics['max_lag_ms'], (now - pending[0].enqueued_at) * 1000
+        )
+        for frame, count in self._frames([entry.payload for entry in pending]):
+            started = time.monotonic()
+            try:
+                await self._send(frame)
+            except Exception as e:
+                logger.error(f"Error sending WebSocket frame: {e}")
+                return
+            self._metrics['last_send_ms'] = round((time.monotonic() - started) * 1000, 2)
+            self._metrics['sent_frames'] += 1
+            self._metrics['sent_events'] += count
+
+    def _frames(self, parts):
+        batch = []
+        size = 2
+        for part in parts:
+            part_size = len(part) + 1
+            if batch and (len(batch) >= self.max_frame_events or size + part_size > self.max_frame_bytes):
+                yield self._encode(batch), len(batch)
+                batch, size = [], 2
+            batch.append(part)
+            size += part_size
+        if batch:
+            yield self._encode(batch), len(batch)
+
+    @staticmethod
+    def _encode(batch):
+        # A lone event keeps the plain object frame older clients understand
+        if len(batch) == 1:
+            return batch[0]
+        return '[' + ','.join(batch) + ']'
+
+    def stats(self):
+        """Current lag metrics for this connection"""
+        return {
+            'connection': self.label,
+            'pending': len(self._pending),
+            'lag_ms': round(self.lag * 1000, 2),
+            'slow': self.is_slow,
+            **{k: round(v, 2) if isinstance(v, float) else v for k, v in self._metrics.items()},
+        }
+
+    async def close(self, flush=True):
+        """Stop accepting messages; optionally deliver what is still pending"""
+        self._closed = True
+        _buffers.discard(self)
+        task, self._flush_task = self._flush_task, None
+        if task is not None and not task.done():
+            task.cancel()
+        if flush:
+            await self.flush()
+        else:
+            self._pending = []
+            self._by_key = {}
@@ -0,0 +1,112 @@
+"""
+Compact request body formats for device ingest.
+
+Besides JSON, the ingest endpoints accept:
+
+- MessagePack (``application/msgpack``): the same map the firmware sends as
+  JSON (``DID``, ``ALERT``, ``count``, ...), or an array of such maps
+- a fixed-layout binary reading (``application/vnd.dispenser.reading``):
+  one or more 23 byte records, little-endian::
+
+      version      u8   always 1
+      DID          u32  device primary key
+      TS           u32  device clock, unix seconds (0 = not set)
+      ALERT        u8   see ALERT_CODES
+      count        u32
+      REFER_Val    u16
+      TOTAL_USAGE  u32
+      TAMPER       u8   0 / 1
+      BATTERY      u8   percent, 255 = not reported
+      PWR_STATUS   u8   see POWER_CODES
+
+Both decode to the same keys as JSON, so the views read ``request.data``
+unchanged. A body holding one reading parses to a dict, several to a list.
+"""
+import struct
+
+import msgpack
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, FormParser, JSONParser, MultiPartParser
+
+READING_VERSION = 1
+READING_STRUCT = struct.Struct('<BIIBIHIBBB')
+
+ALERT_CODES = {0: None, 1: 'EMPTY', 2: 'LOW', 3: 'MEDIUM', 4: 'HIGH', 5: 'FULL'}
+POWER_CODES = {0: None, 1: 'ON', 2: 'OFF', 3: 'NO', 4: 'NONE'}
+BATTERY_NOT_REPORTED = 255
+
+_ALERT_VALUES = {value: code for code, value in ALERT_CODES.items()}
+_POWER_VALUES = {value: code for code, value in POWER_CODES.items()}
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            data = msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except Exception as exc:
+            raise ParseError(f"MessagePack parse error - {exc or type(exc).__name__}")
+        if not isinstance(data, (dict, list)):
+            raise ParseError("MessagePack body must be a map or an array of maps")
+        return data
+
+
+class LegacyMessagePackParser(MessagePackParser):
+    """The unregistered type most MessagePack clients still send"""
+    media_type = 'application/x-msgpack'
+
+
+def unpack_readings(body):
+    """Decode fixed-layout reading records into ingest payload dicts"""
+    if not body or len(body) % READING_STRUCT.size:
+        raise ParseError(f"Reading body must be a multiple of {READING_STRUCT.size} bytes")
+    readings = []
+    for (version, did, ts, alert, count, refer_val, total_usage, tamper, battery, power) in (
+        READING_STRUCT.iter_unpack(body)
+    ):
+        if version != READING_VERSION:
+            raise ParseError(f"Unsupported reading version {version}")
+        readings.append({
+            'DID': did,
+            'TS': str(ts) if ts else None,
+            'ALERT': ALERT_CODES.get(alert),
+            'count': count,
+            'REFER_Val': refer_val,
+            'TOTAL_USAGE': total_usage,
+            'TAMPER': 'true' if tamper else 'false',
+            'BATTERY_PERCENTAGE': None if battery == BATTERY_NOT_REPORTED else battery,
+            'PWR_STATUS': POWER_CODES.get(power),
+        })
+    return readings
+
+
+def pack_reading(reading):
+    """Encode an ingest payload dict as one fixed-layout record (the firmware side)"""
+    battery = reading.get('BATTERY_PERCENTAGE')
+    return READING_STRUCT.pack(
+        READING_VERSION,
+        int(reading['DID']),
+        int(reading.get('TS') or 0),
+        _ALERT_VALUES.get(reading.get('ALERT'), 0),
+        int(reading.get('count') or 0),
+        int(reading.get('REFER_Val') or 0),
+        int(reading.get('TOTAL_USAGE') or 0),
+        1 if str(reading.get('TAMPER')).lower() == 'true' else 0,
+        BATTERY_NOT_REPORTED if battery is None else int(battery),
+        _POWER_VALUES.get(reading.get('PWR_STATUS'), 0),
+    )
+
+
+class ReadingStructParser(BaseParser):
+    media_type = 'application/vnd.dispenser.reading'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        readings = unpack_readings(stream.read())
+        return readings[0] if len(readings) == 1 else readings
+
+
+# Parsers of the device ingest endpoints, JSON first as most devices send it
+INGEST_PARSERS = [
+    JSONParser, MessagePackParser, LegacyMessagePackParser, ReadingStructParser, FormParser, MultiPartParser,
+]
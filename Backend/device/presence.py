@@ -0,0 +1,130 @@
+"""
+Offline / online events for devices.
+
+The offline sweeper (``sweep_offline_devices``) marks a device offline once
+neither a reading nor a heartbeat arrived for ``DEVICE_OFFLINE_AFTER_SECONDS``,
+and ingest marks it online again on its next reading or heartbeat. Each
+transition is stored as a Notification and published to WebSocket clients
+like any other alert; going offline also sends a push notification.
+
+These functions run after the transition was committed (see
+``device.fleet_status``), so a rolled back update never produces an event.
+"""
+import logging
+
+from channels.layers import get_channel_layer
+from django.utils import timezone
+
+from .models import ExpoPushToken, Notification
+from .realtime import publish_event
+from .utils import send_push_notification
+
+logger = logging.getLogger(__name__)
+
+OFFLINE_PRIORITY = 65
+ONLINE_PRIORITY = 55
+
+
+def _describe_gap(seconds):
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes} min"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} h {minutes} min" if minutes else f"{hours} h"
+
+
+def _notify(status, notification_type, title, message, priority, push):
+    device = status.device
+    notification = Notification.objects.create(
+        device=device,
+        message=message,
+        title=title,
+        notification_type=notification_type,
+        alert=status.alert or '',
+        tamper='true' if status.tamper else 'false',
+        battery_percentage=status.battery_percentage,
+        power_status=status.power_status or '',
+        priority=priority,
+    )
+    publish_event({
+        "id": notification.id,
+        "device_id": device.id,
+        "device": {
+            "id": device.id,
+            "name": device.name or f"Device {device.id}",
+            "device_id": device.id,
+            "room_number": device.room_number,
+            "floor_number": device.floor_number,
+        },
+        "room": device.room_number,
+        "floor": device.floor_number,
+        "timestamp": str(status.last_seen),
+        "alert": status.alert,
+        "tamper": 'true' if status.tamper else 'false',
+        "battery_percentage": status.battery_percentage,
+        "power_status": status.power_status,
+        "type": notification_type,
+        "notification_type": notification_type,
+        "title": title,
+        "message": message,
+        "priority": priority,
+        "created_at": str(notification.created_at),
+        "is_read": False,
+        "is_online": status.is_online,
+        "last_seen": str(status.last_seen),
+    }, get_channel_layer())
+
+    if push:
+        for token in ExpoPushToken.objects.values_list('token', flat=True).distinct():
+            try:
+                send_push_notification(
+                    token,
+                    title=title,
+                    body=message,
+                    data={
+                        "device_id": device.id,
+                        "notification_id": notification.id,
+                        "type": notification_type,
+                        "notification_type": notification_type,
+                        "priority": priority,
+                        "room": device.room_number,
+                        "floor": device.floor_number,
+                        "device_name": device.name or f"Device {device.id}",
+                    },
+                    notification_type=notification_type,
+                )
+            except Exception as e:
+                logger.error(f"Failed to send push notification to {token}: {e}")
+    return notification
+
+
+def notify_offline(status, now=None):
+    """A device stopped reporting; ``status.offline_since`` is its last contact"""
+    silent_for = ((now or timezone.now()) - status.offline_since).total_seconds()
+    try:
+        return _notify(
+            status,
+            'offline',
+            'Device Offline',
+            f"No data from the device for {_describe_gap(silent_for)}. Check power and WiFi.",
+            OFFLINE_PRIORITY,
+            push=True,
+        )
+    except Exception as e:
+        logger.error(f"Failed to send offline event for device {status.device_id}: {e}")
+
+
+def notify_online(status, offline_since):
+    """A device reported again after having been marked offline"""
+    gap = (status.last_seen - offline_since).total_seconds() if offline_since else 0
+    try:
+        return _notify(
+            status,
+            'online',
+            'Device Back Online',
+            f"Device is reporting again after {_describe_gap(gap)} without contact.",
+            ONLINE_PRIORITY,
+            push=False,
+        )
+    except Exception as e:
+        logger.error(f"Failed to send online event for device {status.device_id}: {e}")
@@ -0,0 +1,239 @@
+"""
+Admission control for device ingest.
+
+The ingest endpoints are public and every accepted reading costs several
+writes and possibly push notifications, so a dispenser stuck in a retry loop
+could slow ingest down for the whole fleet. Each reading has to take a token
+from two buckets before any database work: one of its device
+(``DEVICE_INGEST_RATE`` readings per second, bursts of ``DEVICE_INGEST_BURST``)
+and one shared by all devices (``INGEST_GLOBAL_RATE`` / ``INGEST_GLOBAL_BURST``).
+Tokens are only taken when both buckets have one, so readings a device sends
+over its own limit do not use up the fleet's budget.
+
+A rejected reading is answered with 429 and ``Retry-After``, counted per
+device (see ``rejection_counts``) and logged, summarised per device like
+other repeated device events.
+
+The Redis backend shares the buckets between every worker; the memory
+backend limits each process on its own and is also the fallback while Redis
+is unreachable.
+"""
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+
+from backend.db import db_sync_to_async
+from users.log_policy import get_log_aggregator
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limit exceeded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class MemoryRateLimiter:
+    def __init__(self, max_buckets=100000):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._rejections = Counter()
+        self._lock = threading.Lock()
+
+    def acquire(self, limits):
+        """
+        Take one token from each ``(key, rate, burst)`` bucket in ``limits``,
+        or from none of them. Returns 0 when the tokens were taken, otherwise
+        the seconds until every bucket has one again.
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = []
+            wait = 0
+            for key, rate, burst in limits:
+                bucket = self._buckets.get(key)
+                tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+                available.append(tokens)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+            for tokens, (key, _rate, _burst) in zip(available, limits):
+                self._buckets[key] = (tokens if wait else tokens - 1, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                # A forgotten bucket starts full again, which only errs on the generous side
+                self._buckets.popitem(last=False)
+        return wait
+
+    def record_rejection(self, device_key):
+        with self._lock:
+            # Bounded like the buckets, DIDs are whatever the request claims
+            if device_key in self._rejections or len(self._rejections) < self.max_buckets:
+                self._rejections[device_key] += 1
+
+    def rejections(self):
+        with self._lock:
+            return dict(self._rejections)
+
+
+# Same algorithm as MemoryRateLimiter.acquire, atomic on the Redis server.
+# KEYS are the buckets, ARGV their rate and burst in pairs.
+_ACQUIRE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local available = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+    local tokens = burst
+    if bucket[1] then
+        tokens = math.min(burst, tonumber(bucket[1]) + math.max(0, now - tonumber(bucket[2])) * rate)
+    end
+    available[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+end
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local tokens = available[i]
+    if wait == 0 then
+        tokens = tokens - 1
+    end
+    redis.call('HSET', key, 'tokens', tokens, 'updated', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return tostring(wait)
+"""
+
+
+class RedisRateLimiter:
+    def __init__(self, url, prefix='ingest:ratelimit'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._acquire = self.client.register_script(_ACQUIRE_SCRIPT)
+        self._fallback = MemoryRateLimiter()
+
+    def acquire(self, limits):
+        """See :meth:`MemoryRateLimiter.acquire`"""
+        args = []
+        for _key, rate, burst in limits:
+            args += [rate, burst]
+        try:
+            return float(self._acquire(keys=[f'{self.prefix}:{key}' for key, _rate, _burst in limits], args=args))
+        except Exception as e:
+            logger.error(f"Ingest rate limiter falling back to local buckets: {e}")
+            return self._fallback.acquire(limits)
+
+    def record_rejection(self, device_key):
+        try:
+            self.client.hincrby(f'{self.prefix}:rejected', device_key, 1)
+        except Exception:
+            self._fallback.record_rejection(device_key)
+
+    def rejections(self):
+        counts = Counter(self._fallback.rejections())
+        try:
+            for key, count in self.client.hgetall(f'{self.prefix}:rejected').items():
+                counts[key.decode() if isinstance(key, bytes) else key] += int(count)
+        except Exception as e:
+            logger.error(f"Failed to read ingest rejection counters: {e}")
+        return dict(counts)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the configured limiter (built lazily, shared per process)"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                if getattr(settings, 'INGEST_RATE_LIMIT_BACKEND', 'memory') == 'redis':
+                    _limiter = RedisRateLimiter(settings.INGEST_RATE_LIMIT_REDIS_URL)
+                else:
+                    _limiter = MemoryRateLimiter()
+    return _limiter
+
+
+def device_key(did):
+    """The bucket key of a reading's ``DID``, as sent"""
+    try:
+        return str(int(did))
+    except (TypeError, ValueError):
+        return str(did)[:64]
+
+
+def _device_id(did):
+    """The ``device_id`` logged for ``did``: the primary key like ingest logs, or the DID as sent"""
+    try:
+        return int(did)
+    except (TypeError, ValueError):
+        return device_key(did)
+
+
+def admit_reading(did=None):
+    """
+    Admit one reading of device ``did`` (its primary key, as sent), or one
+    request of unknown devices when None. Returns 0 when admitted, otherwise
+    the seconds the device should wait before sending again.
+    """
+    wait, key = _acquire(did)
+    if wait and key is not None:
+        _record_rejection(did, key)
+    return wait
+
+
+def _acquire(did):
+    """Take the tokens of a reading of ``did``, returns the seconds to wait and the device's bucket key"""
+    limits = []
+    rate, burst = getattr(settings, 'DEVICE_INGEST_RATE', 1), getattr(settings, 'DEVICE_INGEST_BURST', 10)
+    key = device_key(did) if did is not None else None
+    if key is not None and rate > 0:
+        limits.append((f'device:{key}', rate, max(burst, 1)))
+    rate, burst = getattr(settings, 'INGEST_GLOBAL_RATE', 500), getattr(settings, 'INGEST_GLOBAL_BURST', 1000)
+    if rate > 0:
+        limits.append(('global', rate, max(burst, 1)))
+    if not limits:
+        return 0, key
+    return get_rate_limiter().acquire(limits), key
+
+
+def _record_rejection(did, key):
+    get_rate_limiter().record_rejection(key)
+    get_log_aggregator().record(
+        source='device.rate_limit',
+        key=key,
+        state='rejected',
+        message=f"Device {key} exceeded the ingest rate limit",
+        summary="{count} readings of device {key} rejected by the ingest rate limit in the last {seconds}s",
+        level='WARNING',
+        device_id=_device_id(did),
+    )
+
+
+async def aadmit_reading(did=None):
+    """
+    :func:`admit_reading` for async views. A Redis round trip runs off the
+    event loop, and so does the AppLog entry of a rejection, which may be
+    written inline (``APPLOG_ASYNC`` off).
+    """
+    if not isinstance(get_rate_limiter(), MemoryRateLimiter):
+        return await db_sync_to_async(admit_reading)(did)
+    wait, key = _acquire(did)
+    if wait and key is not None:
+        await db_sync_to_async(_record_rejection)(did, key)
+    return wait
+
+
+def rejection_counts():
+    """Readings rejected per device key (since the process started with the memory backend)"""
+    return get_rate_limiter().rejections()
@@ -0,0 +1,123 @@
+"""
+Topic-scoped realtime fan-out for WebSocket clients.
+
+Every realtime event is published to one channel-layer group per topic it
+belongs to (device, floor, room and alert type, plus the catch-all ``all``
+topic).  Clients subscribe only to the topics they care about, so a team
+watching a single floor never receives traffic for the rest of the campus.
+
+Events are also appended to the replayable event stream first, which stamps
+them with the ``event_id`` clients use to resume after a reconnect.
+"""
+import re
+import logging
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+
+from .event_stream import get_event_stream
+
+logger = logging.getLogger(__name__)
+
+ALL_TOPIC = 'all'
+TOPIC_KINDS = ('device', 'floor', 'room', 'alert')
+
+# Channel-layer group names only allow ASCII alphanumerics, hyphens,
+# underscores and periods, and must be shorter than 100 characters.
+_GROUP_PREFIX = 'topic.'
+_UNSAFE_CHARS = re.compile(r'[^0-9A-Za-z_-]')
+_MAX_VALUE_LENGTH = 64
+
+
+def normalize_topic(raw):
+    """
+    Validate a client supplied topic such as ``floor:2`` or ``alert:tamper``.
+    Returns the canonical ``kind:value`` string, or None if it is invalid.
+    """
+    if not isinstance(raw, str):
+        return None
+    raw = raw.strip()
+    if raw.lower() == ALL_TOPIC:
+        return ALL_TOPIC
+
+    kind, sep, value = raw.partition(':')
+    kind = kind.strip().lower()
+    value = value.strip()
+    if not sep or kind not in TOPIC_KINDS or not value:
+        return None
+    if kind == 'alert':
+        value = value.lower()
+    value = _UNSAFE_CHARS.sub('_', value)[:_MAX_VALUE_LENGTH]
+    return f"{kind}:{value}"
+
+
+def topic_group(topic):
+    """Map a canonical topic to its channel-layer group name."""
+    return _GROUP_PREFIX + topic.replace(':', '.')
+
+
+def topics_for_event(device_id=None, floor=None, room=None, alert_type=None):
+    """Return every topic an event about the given device belongs to."""
+    candidates = [ALL_TOPIC]
+    if device_id is not None:
+        candidates.append(f"device:{device_id}")
+    if floor is not None and floor != '':
+        candidates.append(f"floor:{floor}")
+    if room:
+        candidates.append(f"room:{room}")
+    if alert_type:
+        candidates.append(f"alert:{alert_type}")
+
+    topics = []
+    for candidate in candidates:
+        topic = normalize_topic(candidate)
+        if topic and topic not in topics:
+            topics.append(topic)
+    return topics
+
+
+def topics_for_content(content):
+    device = content.get('device') or {}
+    return topics_for_event(
+        device_id=content.get('device_id', device.get('id')),
+        floor=content.get('floor', device.get('floor_number')),
+        room=content.get('room', device.get('room_number')),
+        alert_type=content.get('notification_type') or content.get('type'),
+    )
+
+
+def record_event(content):
+    """Append an event to the replayable stream and stamp it with its ID."""
+    try:
+        content['event_id'] = get_event_stream().append(content)
+    except Exception as e:
+        # Live delivery still works, the event just cannot be replayed
+        logger.error(f"Failed to record realtime event: {e}")
+    return content
+
+
+async def _send_to_topics(content, channel_layer=None):
+    channel_layer = channel_layer or get_channel_layer()
+    if channel_layer is None:
+        return
+    message = {
+        'type': 'notification.message',
+        'content': content,
+    }
+    for topic in topics_for_content(content):
+        await channel_layer.group_send(topic_group(topic), message)
+
+
+async def apublish_event(content, channel_layer=None):
+    """Publish a realtime event to the groups of every topic it belongs to."""
+    await sync_to_async(record_event, thread_sensitive=False)(content)
+    await _send_to_topics(content, channel_layer)
+
+
+def publish_event(content, channel_layer=None):
+    """Synchronous version of :func:`apublish_event` for regular views."""
+    record_event(content)
+    try:
+        async_to_sync(_send_to_topics)(content, channel_layer)
+    except Exception as e:
+        logger.error(f"Failed to publish realtime event: {e}")
@@ -0,0 +1,253 @@
+"""
+In-process cache of registered devices for the ingest and heartbeat paths.
+
+Devices are looked up on every reading (by primary key) and every heartbeat
+(by normalized MAC ``device_id``), yet they almost never change. The registry
+keeps the few fields those paths need in an LRU map, so a known device is
+resolved without a database round trip.
+
+Entries are stored by primary key; the MAC index only maps a ``device_id`` to
+a key and is checked against the entry, so invalidating a key is enough even
+when a device's MAC changed. ``post_save``/``post_delete`` (device/signals.py)
+invalidate the key locally and, on commit, publish it on a Redis channel that
+every process subscribes to. Without Redis, or while the subscription is down,
+entries also expire after ``DEVICE_REGISTRY_TTL_SECONDS``.
+
+Lookups return ``Device`` instances with only the cached fields loaded; other
+fields are fetched from the database on first access as usual.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+
+from .models import Device
+
+logger = logging.getLogger(__name__)
+
+FIELDS = (
+    'id', 'device_id', 'name', 'room_number', 'floor_number', 'meter_capacity', 'refer_value',
+    'tissue_type', 'gender', 'metadata',
+)
+
+
+def normalize_device_id(raw):
+    """Normalize a MAC style device ID the way registration stores it"""
+    return str(raw).upper().replace(':', '').replace('-', '')
+
+
+def _to_pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class DeviceRegistry:
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max(max_entries, 1)
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_device_id = {}
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, a load that raced with one is not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pk):
+        """The device with primary key ``pk``; raises ``Device.DoesNotExist``"""
+        pk = _to_pk(pk)
+        if pk is None:
+            raise Device.DoesNotExist("Invalid device id")
+        values = self._lookup(pk)
+        if values is None:
+            values = self._load(pk=pk)
+        return self._instance(values)
+
+    async def aget(self, pk):
+        """Async :meth:`get`, a miss is loaded with the async ORM"""
+        pk = _to_pk(pk)
+        if pk is None:
+            raise Device.DoesNotExist("Invalid device id")
+        values = self._lookup(pk)
+        if values is None:
+            generation = self._generation
+            values = await Device.objects.filter(pk=pk).values_list(*FIELDS).afirst()
+            values = self._store(generation, values)
+        return self._instance(values)
+
+    def get_by_device_id(self, device_id):
+        """The device with the given MAC ``device_id`` (normalized here); raises ``Device.DoesNotExist``"""
+        device_id = normalize_device_id(device_id)
+        with self._lock:
+            pk = self._by_device_id.get(device_id)
+        values = self._lookup(pk, device_id) if pk is not None else None
+        if values is None:
+            values = self._load(device_id=device_id)
+        return self._instance(values)
+
+    def invalidate(self, pk):
+        with self._lock:
+            self._generation += 1
+            entry = self._entries.pop(_to_pk(pk), None)
+            if entry is not None:
+                self._by_device_id.pop(entry[0][1], None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_device_id.clear()
+
+    def warm(self, limit=None):
+        """Load the most recently seen devices, as many as fit. Returns how many were loaded."""
+        generation = self._generation
+        rows = Device.objects.order_by(F('status__last_seen').desc(nulls_last=True)).values_list(*FIELDS)
+        count = 0
+        for values in rows[:limit or self.max_entries].iterator():
+            self._store(generation, values)
+            count += 1
+        return count
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def _lookup(self, pk, device_id=None):
+        with self._lock:
+            entry = self._entries.get(pk)
+            if entry is None:
+                self.misses += 1
+                return None
+            values, expires = entry
+            if (self.ttl and expires < time.monotonic()) or (device_id is not None and values[1] != device_id):
+                self._entries.pop(pk, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(pk)
+            self.hits += 1
+            return values
+
+    def _load(self, **lookup):
+        generation = self._generation
+        return self._store(generation, Device.objects.filter(**lookup).values_list(*FIELDS).first())
+
+    def _store(self, generation, values):
+        """Cache loaded ``values`` unless an invalidation happened since ``generation``"""
+        if values is None:
+            raise Device.DoesNotExist("Device matching query does not exist.")
+        with self._lock:
+            if generation != self._generation:
+                return values
+            self._entries[values[0]] = (values, time.monotonic() + self.ttl)
+            self._entries.move_to_end(values[0])
+            if values[1]:
+                self._by_device_id[values[1]] = values[0]
+            while len(self._entries) > self.max_entries:
+                _pk, (old, _expires) = self._entries.popitem(last=False)
+                if old[1] and self._by_device_id.get(old[1]) == old[0]:
+                    del self._by_device_id[old[1]]
+        return values
+
+    @staticmethod
+    def _instance(values):
+        # A fresh instance per lookup, callers may modify it
+        row = dict(zip(FIELDS, values))
+        if isinstance(row['metadata'], dict):
+            row['metadata'] = dict(row['metadata'])
+        # from_db() expects the values in model field order
+        ordered = [row[field.attname] for field in Device._meta.concrete_fields if field.attname in row]
+        return Device.from_db(DEFAULT_DB_ALIAS, list(row), ordered)
+
+
+class _InvalidationListener(threading.Thread):
+    """Applies invalidations published by other processes"""
+
+    def __init__(self, registry, url, channel):
+        super().__init__(name='device-registry-invalidation', daemon=True)
+        self.registry = registry
+        self.url = url
+        self.channel = channel
+
+    def run(self):
+        import redis
+
+        backoff = 1
+        while True:
+            try:
+                pubsub = redis.Redis.from_url(self.url).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Invalidations may have been missed while not subscribed
+                self.registry.clear()
+                backoff = 1
+                for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        self.registry.invalidate(message['data'])
+            except Exception as e:
+                logger.error(f"Device registry invalidation listener failed: {e}")
+            self.registry.clear()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+_publisher = None
+
+
+def _channel():
+    return getattr(settings, 'DEVICE_REGISTRY_CHANNEL', 'device:registry:invalidate')
+
+
+def _get_publisher():
+    global _publisher
+    url = getattr(settings, 'DEVICE_REGISTRY_REDIS_URL', None)
+    if _publisher is None and url:
+        import redis
+
+        _publisher = redis.Redis.from_url(url)
+    return _publisher
+
+
+def get_device_registry():
+    """Return the process-wide registry, subscribing to invalidations on first use"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = DeviceRegistry(
+                    max_entries=getattr(settings, 'DEVICE_REGISTRY_MAX_ENTRIES', 10000),
+                    ttl=getattr(settings, 'DEVICE_REGISTRY_TTL_SECONDS', 300),
+                )
+                url = getattr(settings, 'DEVICE_REGISTRY_REDIS_URL', None)
+                if url:
+                    _InvalidationListener(registry, url, _channel()).start()
+                _registry = registry
+    return _registry
+
+
+def invalidate_device(pk):
+    """
+    Drop a device from this process's registry, now and again on commit (a
+    concurrent lookup may reload the old row meanwhile), and publish the
+    invalidation to every other process on commit.
+    """
+    if _registry is not None:
+        _registry.invalidate(pk)
+
+    def after_commit():
+        if _registry is not None:
+            _registry.invalidate(pk)
+        try:
+            publisher = _get_publisher()
+            if publisher is not None:
+                publisher.publish(_channel(), pk)
+        except Exception as e:
+            # Other processes fall back to the TTL
+            logger.error(f"Failed to publish device registry invalidation: {e}")
+
+    transaction.on_commit(after_commit)
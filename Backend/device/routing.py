@@ -3,5 +3,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/notifications/$', consumers.NotificationConsumer.as_asgi()),
+    re_path(r'ws/device/(?P<device_id>[0-9A-Za-z:_-]+)/$', consumers.DeviceIngestConsumer.as_asgi()),
     # re_path(r'^ws/notifications/?$', consumers.NotificationConsumer.as_asgi()),
 ]
@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .fleet_status import device_added, device_removed
+from .models import Device
+from .registry import invalidate_device
+
+
+@receiver(post_save, sender=Device)
+def count_new_device(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        device_added(instance)
+
+
+@receiver(pre_delete, sender=Device)
+def uncount_deleted_device(sender, instance, **kwargs):
+    device_removed(instance)
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def invalidate_cached_device(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_device(instance.pk)
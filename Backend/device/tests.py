@@ -1,3 +1,513 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import time
+import zlib
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import QuerySet
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+
+from .compression import DecompressedBody, RequestBodyTooLarge
+from .fleet_status import fleet_counts, get_counter_store, mark_offline, record_heartbeat, record_reading
+from .ingest import iter_readings
+from .models import Device, DeviceData, ExpoPushToken, Notification
+from .outbound import OutboundBuffer
+from .parsers import READING_STRUCT, MessagePackParser, ReadingStructParser, pack_reading
+from .rate_limit import MemoryRateLimiter
+from .registry import DeviceRegistry
+from .views.data_views import receive_device_data, receive_device_data_batch
+
+READING = {
+    'DID': 12,
+    'TS': '1735689600',
+    'ALERT': 'LOW',
+    'count': 7,
+    'REFER_Val': 300,
+    'TOTAL_USAGE': 4096,
+    'TAMPER': 'true',
+    'BATTERY_PERCENTAGE': 64,
+    'PWR_STATUS': 'ON',
+}
+
+
+def parse(parser, body):
+    return parser.parse(io.BytesIO(body))
+
+
+def quiet_reading(device, **fields):
+    """A reading of ``device`` that raises no alert, so no notification or push token is involved"""
+    return {**READING, 'DID': device.pk, 'ALERT': 'MEDIUM', 'TAMPER': 'false', 'PWR_STATUS': 'ON', **fields}
+
+
+def submit(body, content_type='application/json', **headers):
+    request = RequestFactory().post('/api/device/device-data/submit/', body, content_type=content_type, **headers)
+    # As Django's WSGI handler runs an async view: the loop ends with the request
+    return async_to_sync(receive_device_data)(request)
+
+
+def submit_batch(body, content_type='application/x-ndjson', **headers):
+    request = RequestFactory().post('/api/device/device-data/batch/', body, content_type=content_type, **headers)
+    response = receive_device_data_batch(request)
+    if hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+class ReadingStructParserTests(SimpleTestCase):
+    def test_round_trip(self):
+        body = pack_reading(READING)
+        self.assertEqual(len(body), READING_STRUCT.size)
+        self.assertEqual(parse(ReadingStructParser(), body), READING)
+
+    def test_unset_values(self):
+        reading = {**READING, 'TS': None, 'ALERT': None, 'TAMPER': 'false', 'BATTERY_PERCENTAGE': None, 'PWR_STATUS': None}
+        self.assertEqual(parse(ReadingStructParser(), pack_reading(reading)), reading)
+
+    def test_several_records_parse_to_a_list(self):
+        second = {**READING, 'DID': 13, 'ALERT': 'FULL'}
+        body = pack_reading(READING) + pack_reading(second)
+        self.assertEqual(parse(ReadingStructParser(), body), [READING, second])
+
+    def test_truncated_frame(self):
+        body = pack_reading(READING) + pack_reading(READING)[:-1]
+        with self.assertRaises(ParseError):
+            parse(ReadingStructParser(), body)
+
+    def test_empty_body(self):
+        with self.assertRaises(ParseError):
+            parse(ReadingStructParser(), b'')
+
+    def test_unsupported_version(self):
+        body = b'\x02' + pack_reading(READING)[1:]
+        with self.assertRaises(ParseError):
+            parse(ReadingStructParser(), body)
+
+
+class MessagePackParserTests(SimpleTestCase):
+    def test_map(self):
+        self.assertEqual(parse(MessagePackParser(), msgpack.packb(READING)), READING)
+
+    def test_array_of_maps(self):
+        body = msgpack.packb([READING, READING])
+        self.assertEqual(parse(MessagePackParser(), body), [READING, READING])
+
+    def test_scalar_is_rejected(self):
+        with self.assertRaises(ParseError):
+            parse(MessagePackParser(), msgpack.packb(12))
+
+    def test_invalid_body(self):
+        with self.assertRaises(ParseError):
+            parse(MessagePackParser(), b'\xc1')
+
+
+class DecompressedBodyTests(SimpleTestCase):
+    def test_gzip_round_trip(self):
+        data = b'{"DID": 12}\n' * 10000
+        body = DecompressedBody(io.BytesIO(gzip.compress(data)), 'gzip', limit=len(data))
+        self.assertEqual(body.read(), data)
+
+    def test_deflate_read_in_small_pieces(self):
+        data = bytes(range(256)) * 100
+        body = DecompressedBody(io.BytesIO(zlib.compress(data)), 'deflate', limit=len(data))
+        pieces = iter(lambda: body.read(1000), b'')
+        self.assertTrue(all(len(piece) <= 1000 for piece in pieces))
+
+    def test_bomb_over_the_cap(self):
+        # 10 MB of zeros compresses to about 10 KB
+        body = DecompressedBody(io.BytesIO(gzip.compress(bytes(10 * 1024 * 1024))), 'gzip', limit=1024 * 1024)
+        with self.assertRaises(RequestBodyTooLarge) as raised:
+            body.read()
+        self.assertEqual(raised.exception.status_code, 413)
+
+    def test_truncated_body(self):
+        compressed = gzip.compress(b'x' * 1000)
+        body = DecompressedBody(io.BytesIO(compressed[:len(compressed) // 2]), 'gzip', limit=10000)
+        with self.assertRaises(ParseError):
+            body.read()
+
+
+@override_settings(DEVICE_UPLOAD_MAX_DECOMPRESSED_BYTES=64 * 1024, DEVICE_INGEST_RATE=0, INGEST_GLOBAL_RATE=0)
+class CompressedBatchUploadTests(SimpleTestCase):
+    def post(self, body, encoding):
+        return submit_batch(body, HTTP_CONTENT_ENCODING=encoding)
+
+    def test_bomb_is_answered_413(self):
+        # Blank NDJSON lines, skipped without touching the database
+        response = self.post(gzip.compress(b'\n' * (10 * 1024 * 1024)), 'gzip')
+        self.assertEqual(response.status_code, 413)
+
+    def test_unsupported_encoding(self):
+        response = self.post(b'\n', 'br')
+        self.assertEqual(response.status_code, 415)
+
+
+class IterReadingsTests(SimpleTestCase):
+    def readings(self, body, content_type):
+        return list(iter_readings(io.BytesIO(body), content_type))
+
+    def test_msgpack_array_and_stream_of_maps(self):
+        second = {**READING, 'DID': 13}
+        array = msgpack.packb([READING, second])
+        stream = msgpack.packb(READING) + msgpack.packb(second)
+        self.assertEqual(self.readings(array, 'application/msgpack'), [READING, second])
+        self.assertEqual(self.readings(stream, 'application/x-msgpack'), [READING, second])
+
+    def test_struct_records(self):
+        body = pack_reading(READING) * 3
+        self.assertEqual(self.readings(body, 'application/vnd.dispenser.reading'), [READING] * 3)
+
+    def test_truncated_struct_frame(self):
+        body = pack_reading(READING) * 2 + pack_reading(READING)[:5]
+        readings = iter_readings(io.BytesIO(body), 'application/vnd.dispenser.reading')
+        # Complete records are read before the partial one is noticed
+        self.assertEqual([next(readings), next(readings)], [READING, READING])
+        with self.assertRaises(ParseError):
+            next(readings)
+
+
+class IngestTestCase(TransactionTestCase):
+    """
+    A device to send readings for, without idempotency keys or rate limit
+    buckets of earlier tests. Committed, as the AppLog entry of a reading is
+    written from another thread.
+    """
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('device.rate_limit._limiter', MemoryRateLimiter())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.device = Device.objects.create(name='Dispenser', floor_number=1, room_number='101')
+
+
+@override_settings(DEVICE_INGEST_RATE=0, INGEST_GLOBAL_RATE=0)
+class FastIngestTests(IngestTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reading = quiet_reading(self.device)
+
+    def test_wsgi_request_awaits_the_applog_entry(self):
+        logged = []
+
+        def log_reading(device, reading):
+            time.sleep(0.05)
+            logged.append(device.pk)
+
+        with mock.patch('device.ingest._log_reading', log_reading):
+            response = submit(json.dumps(self.reading))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(logged, [self.device.pk])
+        self.assertEqual(DeviceData.objects.filter(device=self.device).count(), 1)
+
+
+@override_settings(DEVICE_INGEST_RATE=1, DEVICE_INGEST_BURST=2, INGEST_GLOBAL_RATE=0, APPLOG_ASYNC=False)
+class RateLimitTests(IngestTestCase):
+    def test_submit_over_the_limit(self):
+        statuses = [submit(json.dumps(quiet_reading(self.device, TS=str(ts)))).status_code for ts in range(1, 4)]
+        self.assertEqual(statuses, [201, 201, 429])
+        response = submit(json.dumps(quiet_reading(self.device, TS='4')))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(DeviceData.objects.filter(device=self.device).count(), 2)
+
+    def test_batch_takes_a_token_per_reading(self):
+        body = ''.join(json.dumps(quiet_reading(self.device, TS=str(ts))) + '\n' for ts in range(1, 6))
+        response = submit_batch(body)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(response.data['processed'], 2)
+        self.assertEqual(response.data['accepted'], 2)
+        self.assertEqual(DeviceData.objects.filter(device=self.device).count(), 2)
+
+    def test_batch_readings_share_the_bucket_of_single_ones(self):
+        submit(json.dumps(quiet_reading(self.device, TS='1')))
+        body = ''.join(json.dumps(quiet_reading(self.device, TS=str(ts))) + '\n' for ts in range(2, 4))
+        response = submit_batch(body)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.data['processed'], 1)
+
+
+@override_settings(DEVICE_INGEST_RATE=0, INGEST_GLOBAL_RATE=0, APPLOG_ASYNC=False)
+class DuplicateReadingTests(IngestTestCase):
+    def setUp(self):
+        super().setUp()
+        # The push token query is PostgreSQL only (DISTINCT ON), nobody is subscribed here
+        patcher = mock.patch('device.ingest._push_tokens', return_value=ExpoPushToken.objects.none())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # A LOW reading, so a second copy would raise a second alert
+        self.reading = {**READING, 'DID': self.device.pk, 'TAMPER': 'false'}
+
+    def assertStoredOnce(self):
+        self.assertEqual(DeviceData.objects.filter(device=self.device).count(), 1)
+        self.assertEqual(Notification.objects.filter(device=self.device).count(), 1)
+
+    def assertRetryAcknowledged(self, first, retry):
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(json.loads(first.content)['notifications_sent'], 1)
+        self.assertEqual(retry.status_code, 200)
+        self.assertIs(json.loads(retry.content)['duplicate'], True)
+        self.assertEqual(json.loads(retry.content)['notifications_sent'], 0)
+        self.assertStoredOnce()
+
+    def test_retry_with_the_same_seq(self):
+        body = json.dumps({**self.reading, 'SEQ': 'boot-3-17', 'TS': None})
+        self.assertRetryAcknowledged(submit(body), submit(body))
+
+    def test_retry_with_the_same_idempotency_key(self):
+        body = json.dumps({**self.reading, 'TS': None})
+        first = submit(body, HTTP_IDEMPOTENCY_KEY='boot-3-17')
+        self.assertRetryAcknowledged(first, submit(body, HTTP_IDEMPOTENCY_KEY='boot-3-17'))
+
+    def test_retry_with_the_same_timestamp(self):
+        body = json.dumps(self.reading)
+        self.assertRetryAcknowledged(submit(body), submit(body))
+
+    def test_readings_without_a_key_are_all_stored(self):
+        body = json.dumps({**self.reading, 'TS': None})
+        self.assertEqual([submit(body).status_code, submit(body).status_code], [201, 201])
+        self.assertEqual(DeviceData.objects.filter(device=self.device).count(), 2)
+
+    def test_unique_constraint_catches_a_retry_the_cache_forgot(self):
+        body = json.dumps({**self.reading, 'SEQ': 'boot-3-17'})
+        first = submit(body)
+        cache.clear()
+        self.assertRetryAcknowledged(first, submit(body))
+
+    def test_resent_batch_counts_duplicates(self):
+        body = json.dumps(self.reading) + '\n'
+        submit_batch(body)
+        cache.clear()
+        response = submit_batch(body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertEqual(response.data['duplicates'], 1)
+        self.assertEqual(response.data['notifications_sent'], 0)
+        self.assertStoredOnce()
+
+
+class DeviceRegistryTests(TestCase):
+    def setUp(self):
+        self.device = Device.objects.create(
+            name='Dispenser', floor_number=1, room_number='101', device_id='AABBCCDDEE01',
+        )
+        self.registry = DeviceRegistry(ttl=60)
+        # The registry post_save and post_delete invalidate
+        patcher = mock.patch('device.registry._registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_known_device_is_resolved_without_a_query(self):
+        self.registry.get(self.device.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.registry.get(str(self.device.pk)).name, 'Dispenser')
+            self.assertEqual(self.registry.get_by_device_id('aa:bb:cc:dd:ee:01').pk, self.device.pk)
+
+    def test_save_invalidates(self):
+        self.registry.get(self.device.pk)
+        self.device.name = 'Renamed'
+        self.device.save()
+        self.assertEqual(self.registry.get(self.device.pk).name, 'Renamed')
+
+    def test_load_racing_an_invalidation_is_not_cached(self):
+        first = QuerySet.first
+
+        def first_then_renamed(queryset):
+            values = first(queryset)
+            # Saved by another request while this lookup was loading
+            Device.objects.filter(pk=self.device.pk).update(name='Renamed')
+            self.registry.invalidate(self.device.pk)
+            return values
+
+        with mock.patch.object(QuerySet, 'first', first_then_renamed):
+            self.assertEqual(self.registry.get(self.device.pk).name, 'Dispenser')
+        self.assertEqual(self.registry.get(self.device.pk).name, 'Renamed')
+
+    def test_entries_expire(self):
+        self.registry.get(self.device.pk)
+        # Changed without the signal, like an invalidation that never arrived
+        Device.objects.filter(pk=self.device.pk).update(name='Renamed')
+        self.assertEqual(self.registry.get(self.device.pk).name, 'Dispenser')
+        expired = time.monotonic() + 61
+        with mock.patch('device.registry.time.monotonic', return_value=expired):
+            self.assertEqual(self.registry.get(self.device.pk).name, 'Renamed')
+
+    def test_mac_index_follows_a_mac_change(self):
+        self.registry.get_by_device_id('AABBCCDDEE01')
+        self.device.device_id = 'AABBCCDDEE02'
+        self.device.save()
+        with self.assertRaises(Device.DoesNotExist):
+            self.registry.get_by_device_id('AABBCCDDEE01')
+        self.assertEqual(self.registry.get_by_device_id('AA-BB-CC-DD-EE-02').pk, self.device.pk)
+
+    def test_mac_index_is_checked_against_the_entry(self):
+        self.registry.get_by_device_id('AABBCCDDEE01')
+        # Changed without the signal, then the entry expires and is reloaded by key
+        Device.objects.filter(pk=self.device.pk).update(device_id='AABBCCDDEE02')
+        with mock.patch('device.registry.time.monotonic', return_value=time.monotonic() + 61):
+            self.registry.get(self.device.pk)
+            with self.assertRaises(Device.DoesNotExist):
+                self.registry.get_by_device_id('AABBCCDDEE01')
+
+    def test_unknown_device(self):
+        with self.assertRaises(Device.DoesNotExist):
+            self.registry.get(self.device.pk + 1)
+        with self.assertRaises(Device.DoesNotExist):
+            self.registry.get('not a key')
+
+
+def event(device_id, notification_type='low', priority=80, **content):
+    return {'type': 'notification', 'content': {
+        'device_id': device_id, 'notification_type': notification_type, 'priority': priority, **content,
+    }}
+
+
+class OutboundBufferTests(SimpleTestCase):
+    def buffer(self, **options):
+        self.frames = []
+
+        async def send(frame):
+            self.frames.append(json.loads(frame))
+
+        return OutboundBuffer(send, **{'window_ms': 10000, **options})
+
+    def sent(self):
+        """The events sent, frames unpacked"""
+        return [event for frame in self.frames for event in (frame if isinstance(frame, list) else [frame])]
+
+    async def test_window_coalesces_into_one_frame(self):
+        buffer = self.buffer(window_ms=10)
+        for device_id in (1, 2, 3):
+            buffer.push(event(device_id))
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.frames, [[event(1), event(2), event(3)]])
+
+    async def test_lone_event_is_a_plain_object(self):
+        buffer = self.buffer(window_ms=10)
+        buffer.push(event(1))
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.frames, [event(1)])
+
+    async def test_frames_are_capped(self):
+        buffer = self.buffer(max_frame_events=2)
+        for device_id in range(5):
+            buffer.push(event(device_id))
+        await buffer.close()
+        self.assertEqual([len(frame) if isinstance(frame, list) else 1 for frame in self.frames], [2, 2, 1])
+        self.assertEqual(self.sent(), [event(device_id) for device_id in range(5)])
+
+    async def test_routine_events_coalesce_once_behind(self):
+        # Coalescing starts at a quarter of max_pending, 2 events here
+        buffer = self.buffer(max_pending=8)
+        buffer.push(event(1, count=1))
+        buffer.push(event(1, count=2))
+        buffer.push(event(2, count=1))
+        buffer.push(event(1, count=3))
+        buffer.push(event(1, 'tamper', priority=100))
+        buffer.push(event(1, 'tamper', priority=100))
+        await buffer.close()
+        self.assertEqual(self.sent(), [
+            event(1, count=1), event(1, count=3), event(2, count=1),
+            event(1, 'tamper', priority=100), event(1, 'tamper', priority=100),
+        ])
+        self.assertEqual(buffer.stats()['coalesced'], 1)
+
+    async def test_lowest_priority_is_dropped_when_full(self):
+        buffer = self.buffer(max_pending=2)
+        buffer.push(event(1, 'battery_low', priority=50))
+        buffer.push(event(2, 'low', priority=80))
+        buffer.push(event(3, 'tamper', priority=100))
+        buffer.push(event(4, 'battery_low', priority=50))
+        await buffer.close()
+        self.assertEqual(self.sent(), [event(2, 'low', priority=80), event(3, 'tamper', priority=100)])
+        self.assertEqual(buffer.stats()['dropped'], 2)
+
+    async def test_slow_consumer(self):
+        buffer = self.buffer(slow_consumer_seconds=0.05)
+        buffer.push(event(1))
+        self.assertFalse(buffer.is_slow)
+        await asyncio.sleep(0.06)
+        self.assertTrue(buffer.is_slow)
+        self.assertTrue(buffer.stats()['slow'])
+        # Disconnected without delivering what it fell behind on
+        await buffer.close(flush=False)
+        self.assertEqual(self.frames, [])
+        self.assertFalse(buffer.is_slow)
+
+
+class FleetCounterTests(TestCase):
+    def setUp(self):
+        fleet_counts()
+        self.devices = [
+            Device.objects.create(name=f'Dispenser {n}', floor_number=1, room_number=str(100 + n)) for n in range(3)
+        ]
+
+    def assertMatchesRebuild(self):
+        """The incrementally kept counters equal what rebuild_fleet_status counts"""
+        counted = {key: value for key, value in get_counter_store().read().items() if value}
+        call_command('rebuild_fleet_status', stdout=io.StringIO())
+        self.assertEqual(counted, {key: value for key, value in get_counter_store().read().items() if value})
+        return counted
+
+    def reading(self, device, alert='MEDIUM', tamper='false', battery=80, power='ON', seen_at=None):
+        with transaction.atomic():
+            record_reading(device, alert, tamper, battery, power, seen_at=seen_at)
+
+    def heartbeat(self, device, seen_at=None):
+        with transaction.atomic():
+            record_heartbeat(device, seen_at=seen_at)
+
+    def test_counters_follow_every_change(self):
+        counts = self.assertMatchesRebuild()
+        self.assertEqual(counts['total'], 3)
+        self.assertEqual(counts['distribution.offline'], 3)
+
+        first, second, third = self.devices
+        self.reading(first, alert='LOW', tamper='true')
+        self.reading(second, battery=15)
+        self.reading(second, battery=5)
+        counts = self.assertMatchesRebuild()
+        self.assertEqual(counts['summary.tamper'], 1)
+        self.assertEqual(counts['summary.battery_critical'], 1)
+        self.assertNotIn('summary.battery_low', counts)
+
+        # A device seen for the first time by its heartbeat
+        self.heartbeat(third)
+        self.assertEqual(self.assertMatchesRebuild()['summary.active'], 3)
+        # An online device's heartbeat changes no bucket
+        self.heartbeat(third)
+        self.assertMatchesRebuild()
+
+        later = timezone.now() + timedelta(hours=1)
+        self.assertEqual(len(mark_offline(now=later)), 3)
+        counts = self.assertMatchesRebuild()
+        self.assertEqual(counts['distribution.offline'], 3)
+        self.assertNotIn('summary.active', counts)
+
+        self.heartbeat(first, seen_at=later)
+        self.reading(second, seen_at=later)
+        counts = self.assertMatchesRebuild()
+        self.assertEqual(counts['summary.active'], 2)
+        self.assertEqual(counts['distribution.tamper'], 1)
+        self.assertEqual(counts['distribution.normal'], 1)
+
+        first.delete()
+        counts = self.assertMatchesRebuild()
+        self.assertEqual(counts['total'], 2)
+        self.assertNotIn('summary.tamper', counts)
+
+    def test_rolled_back_reading_is_not_counted(self):
+        before = self.assertMatchesRebuild()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            record_reading(self.devices[0], 'EMPTY', 'false', 80, 'ON')
+            raise RuntimeError
+        self.assertEqual(self.assertMatchesRebuild(), before)
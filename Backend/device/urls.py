@@ -9,7 +9,9 @@ from .views.device_views import (
     check_device_status,
     update_device_status
 )
-from .views.data_views import receive_device_data, all_device_data, device_data_by_id
+from .views.data_views import (
+    receive_device_data, receive_device_data_batch, ingest_rate_limit_stats, all_device_data, device_data_by_id
+)
 from .views.notification_views import (
     get_notifications, 
     register_push_token,
@@ -34,14 +36,20 @@ from .views.analytics_views import (
     battery_usage_analytics,
     battery_usage_trends,
 )
+from .views.realtime_views import realtime_connection_stats
 
 urlpatterns = [    # Device endpoints
     path('devices/', get_devices, name='get_devices'),
     path('devices/add/', add_device, name='add_device'),
+    # Fixed paths must come before devices/<str:device_id>/ or they are never reached
+    path('devices/check-status/', check_device_status, name='check_device_status'),
+    path('devices/update-status/', update_device_status, name='update_device_status'),
     path('devices/<int:pk>/', device_detail, name='device_detail'),
     path('devices/<str:device_id>/', device_detail, name='device_detail_by_device_id'),    # Device data endpoints
     path('device-data/submit/', receive_device_data, name='receive_device_data'),
+    path('device-data/batch/', receive_device_data_batch, name='receive_device_data_batch'),
     path('device-data/all/', all_device_data, name='all_device_data'),
+    path('device-data/rate-limits/', ingest_rate_limit_stats, name='ingest_rate_limit_stats'),
     path('device-data/<int:device_id>/', device_data_by_id, name='device_data_by_id'),
     path('device-data/<str:device_id>/', device_data_by_id, name='device_data_by_device_id'),# Notification endpoints
     path('notifications/', get_notifications, name='get_notifications'),
@@ -50,6 +58,9 @@ urlpatterns = [    # Device endpoints
     path('notifications/clear-all/', clear_all_notifications, name='clear_all_notifications'),    path('notifications/unread-count/', get_unread_count, name='get_unread_count'),
     path('notifications/test/', send_test_notification, name='send_test_notification'),
     path('expo-token/register/', register_push_token, name='register_push_token'),
+
+    # Realtime (WebSocket) endpoints
+    path('realtime/connections/', realtime_connection_stats, name='realtime_connection_stats'),
     
     # Analytics endpoints
     path('device-analytics/', advanced_analytics, name='advanced_analytics'),
@@ -64,10 +75,6 @@ urlpatterns = [    # Device endpoints
     path('device/register/', register_device, name='register_device'),
     path('wifi/', register_device_via_wifi, name='register_device_via_wifi'),
     
-    # New WiFi-related endpoints
-    path('devices/check-status/', check_device_status, name='check_device_status'),
-    path('devices/update-status/', update_device_status, name='update_device_status'),
-    
     # Download Analytics
     path('device-analytics/download/csv/', download_csv_analytics, name='download_csv_analytics'),
     path('device-analytics/download/json/', download_json_analytics, name='download_json_analytics'),    path('device-analytics/download/pdf/', download_pdf_analytics, name='download_pdf_analytics'),
@@ -14,6 +14,8 @@ import json
 
 from django.db import models
 from device.models import Device, DeviceData
+from device.fleet_status import DISTRIBUTION_BUCKETS, fleet_counts
+from backend.routers import reads_from_replica
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -169,7 +171,7 @@ def device_realtime_status(request):
     Returns the current status of each device based on the latest data entry.
     This data changes as new data comes in from devices.
     """
-    devices = Device.objects.all()
+    devices = Device.objects.select_related('status')
     realtime_data = []
     
     for device in devices:
@@ -204,7 +206,9 @@ def device_realtime_status(request):
         if latest_data:
             time_since_update = timezone.now() - latest_data.timestamp
             minutes_since_update = int(time_since_update.total_seconds() / 60)
-            is_active = minutes_since_update <= 5
+            # Online/offline is maintained by ingest, heartbeats and the offline sweeper
+            device_status = getattr(device, 'status', None)
+            is_active = device_status.is_online if device_status is not None else minutes_since_update <= 5
             current_status = "normal"
             status_priority = 0
             
@@ -309,51 +313,29 @@ def device_realtime_status(request):
 @permission_classes([IsAuthenticated])
 def device_status_summary(request):
     """
-    Returns a summary of device statuses for dashboard display
+    Returns a summary of device statuses for dashboard display.
+    Counts come from the incrementally maintained fleet status counters.
     """
-    total_devices = Device.objects.count()
     now = timezone.now()
-    
-    # Get latest status for each device
-    device_statuses = []
-    for device in Device.objects.all():
-        latest_data = DeviceData.objects.filter(device=device).order_by('-timestamp').first()
-        if latest_data:
-            time_since = now - latest_data.timestamp
-            is_active = time_since.total_seconds() <= 300  # 5 minutes
-            device_statuses.append({
-                'device_id': device.id,
-                'is_active': is_active,
-                'alert': latest_data.alert,
-                'tamper': latest_data.tamper == "true",
-                'battery_percentage': latest_data.battery_percentage,
-                'power_status': latest_data.power_status,
-                'timestamp': latest_data.timestamp
-            })
-        else:
-            device_statuses.append({
-                'device_id': device.id,
-                'is_active': False,
-                'alert': None,
-                'tamper': False,
-                'battery_percentage': None,
-                'power_status': None,
-                'timestamp': None
-            })
-      # Calculate summaries with new status system
-    active_count = sum(1 for d in device_statuses if d['is_active'])
-    tamper_count = sum(1 for d in device_statuses if d['tamper'])
-    empty_count = sum(1 for d in device_statuses if d['alert'] == 'EMPTY')
-    low_count = sum(1 for d in device_statuses if d['alert'] == 'LOW')
-    full_count = sum(1 for d in device_statuses if d['alert'] == 'FULL')
-    battery_critical_count = sum(1 for d in device_statuses if d['battery_percentage'] is not None and d['battery_percentage'] <= 10)
-    battery_low_count = sum(1 for d in device_statuses if d['battery_percentage'] is not None and 10 < d['battery_percentage'] <= 20)
-    battery_off_count = sum(1 for d in device_statuses if d['battery_percentage'] is not None and d['battery_percentage'] == 0)  # Only exactly 0
-    no_power_count = sum(1 for d in device_statuses if d['power_status'] is not None and str(d['power_status']).lower() == 'no')  # Only pwr_sts = "no"
+    counts = fleet_counts()
+    total_devices = counts.get('total', 0)
+
+    def summary(bucket):
+        return counts.get(f'summary.{bucket}', 0)
+
+    active_count = summary('active')
+    tamper_count = summary('tamper')
+    empty_count = summary('empty')
+    low_count = summary('low')
+    full_count = summary('full')
+    battery_critical_count = summary('battery_critical')
+    battery_low_count = summary('battery_low')
+    battery_off_count = summary('battery_off')  # Only exactly 0
+    no_power_count = summary('no_power')  # Only pwr_sts = "no"
     battery_alert_count = battery_critical_count + battery_low_count + battery_off_count
-    power_off_count = sum(1 for d in device_statuses if (d['power_status'] or '').upper() == 'OFF')
-    normal_count = sum(1 for d in device_statuses if d['is_active'] and not d['tamper'] and d['alert'] not in ['EMPTY', 'LOW', 'FULL'] and (d['battery_percentage'] is None or d['battery_percentage'] > 20) and (d['power_status'] is None or (d['power_status'] or '').upper() not in ['OFF', 'NO']))
-    inactive_count = sum(1 for d in device_statuses if not d['is_active'])
+    power_off_count = summary('power_off')
+    normal_count = summary('normal')
+    inactive_count = summary('inactive')
 
     return Response({
         'summary': {
@@ -410,6 +392,7 @@ def device_status_summary(request):
 
 #?  summary code start
 
+@reads_from_replica
 @swagger_auto_schema(
     method='get',
     responses={200: openapi.Response('Summary analytics for dashboard')},
@@ -723,6 +706,7 @@ def get_time_based_analytics_data(period, device_id=None, start_date=None, end_d
     }
 
 # Add this new function to your views.py
+@reads_from_replica
 @swagger_auto_schema(
     method='get',
     manual_parameters=[
@@ -781,12 +765,14 @@ def download_pdf_analytics(request):
         try:
             from users.models import AppLog
             user = request.user if request.user.is_authenticated else None
-            AppLog.objects.create(
-                user=user,
-                level='INFO',
+            AppLog.log_info(
                 message='Analytics report downloaded',
                 source='analytics_views.download_pdf_analytics',
-                details=f"period={period}, device_id={device_id}, start_date={start_date}, end_date={end_date}"
+                user=user,
+                period=period,
+                device_id=int(device_id) if str(device_id or '').isdigit() else device_id,
+                start_date=start_date,
+                end_date=end_date
             )
         except Exception as log_exc:
             logger.warning(f"Failed to log analytics download to AppLog: {log_exc}")
@@ -1311,6 +1297,7 @@ def test_data_check(request):
         logger.exception(f"Test data check failed: {str(e)}")
         return Response({'error': f'Test failed: {str(e)}'}, status=500)
 
+@reads_from_replica
 @swagger_auto_schema(
     method='get',
     manual_parameters=[
@@ -1336,6 +1323,7 @@ def time_based_analytics(request):
     
     return Response(analytics_data)
 
+@reads_from_replica
 @swagger_auto_schema(
     method='get',
     manual_parameters=[
@@ -1465,6 +1453,7 @@ def download_csv_analytics(request):
         return Response({'error': f'CSV report generation failed: {str(e)}'}, status=500)
 
 
+@reads_from_replica
 @swagger_auto_schema(
     method='get',
     manual_parameters=[
@@ -1553,51 +1542,12 @@ def download_json_analytics(request):
 def device_status_distribution(request):
     """Get distribution of device statuses"""
     try:
-        devices = Device.objects.all()
+        # Maintained by ingest and the offline sweeper, see device/fleet_status.py
+        counts = fleet_counts()
         status_counts = {
-            'normal': 0,
-            'low': 0,
-            'empty': 0,
-            'full': 0,
-            'tamper': 0,
-            'battery_low': 0,
-            'battery_critical': 0,
-            'power_off': 0,
-            'offline': 0
+            bucket: counts.get(f'distribution.{bucket}', 0) for bucket in DISTRIBUTION_BUCKETS
         }
         
-        for device in devices:
-            latest_data = DeviceData.objects.filter(device=device).order_by('-timestamp').first()
-            
-            if not latest_data:
-                status_counts['offline'] += 1
-                continue
-                
-            time_since_update = timezone.now() - latest_data.timestamp
-            minutes_since_update = int(time_since_update.total_seconds() / 60)
-            
-            if minutes_since_update > 5:
-                status_counts['offline'] += 1
-            elif latest_data.tamper == "true":
-                status_counts['tamper'] += 1
-            elif latest_data.alert == "EMPTY":
-                status_counts['empty'] += 1
-            elif latest_data.alert == "LOW":
-                status_counts['low'] += 1
-            elif latest_data.alert == "FULL":
-                status_counts['full'] += 1
-            elif latest_data.battery_percentage is not None:
-                if latest_data.battery_percentage <= 10:
-                    status_counts['battery_critical'] += 1
-                elif latest_data.battery_percentage <= 20:
-                    status_counts['battery_low'] += 1
-                else:
-                    status_counts['normal'] += 1
-            elif latest_data.power_status and str(latest_data.power_status).lower() in ['off', 'no', 'none', '0', 'false']:
-                status_counts['power_off'] += 1
-            else:
-                status_counts['normal'] += 1
-        
         total_devices = sum(status_counts.values())
         
         return Response({
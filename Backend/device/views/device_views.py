@@ -10,6 +10,8 @@ from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 import logging
 
+from device.heartbeats import store_heartbeat
+from device.registry import get_device_registry
 from device.models import Device
 from device.serializers import DeviceSerializer
 from device.permissions import IsCustomAdmin
@@ -346,6 +348,7 @@ def check_device_status(request):
             'signal_strength': openapi.Schema(type=openapi.TYPE_INTEGER, description='WiFi signal'),
             'uptime': openapi.Schema(type=openapi.TYPE_INTEGER, description='Uptime in seconds'),
             'free_heap': openapi.Schema(type=openapi.TYPE_INTEGER, description='Free memory'),
+            'firmware_version': openapi.Schema(type=openapi.TYPE_STRING, description='Firmware version'),
         },
         required=['device_id']
     ),
@@ -368,20 +371,10 @@ def update_device_status(request):
     device_id = device_id.upper().replace(':', '').replace('-', '')
     
     try:
-        device = Device.objects.get(device_id=device_id)
-        
-        # Update metadata if field exists
-        if hasattr(Device, 'metadata'):
-            metadata = device.metadata or {}
-            metadata.update({
-                'last_heartbeat': timezone.now().isoformat(),
-                'ip_address': request.data.get('ip_address', metadata.get('ip_address')),
-                'signal_strength': request.data.get('signal_strength', metadata.get('signal_strength')),
-                'uptime': request.data.get('uptime'),
-                'free_heap': request.data.get('free_heap'),
-            })
-            device.metadata = metadata
-            device.save()
+        device = get_device_registry().get_by_device_id(device_id)
+
+        # Narrow updates only; metadata is rewritten when the IP or firmware changed
+        store_heartbeat(device, request.data)
         
         logger.info(f"Device {device_id} status updated")
         
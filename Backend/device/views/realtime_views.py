@@ -0,0 +1,27 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
+from django.utils import timezone
+
+from device.outbound import connection_stats
+from device.permissions import IsCustomAdmin
+
+
+@swagger_auto_schema(
+    method='get',
+    responses={200: openapi.Response('Per-connection WebSocket lag metrics')},
+    operation_description="Outbound queue and lag metrics of the WebSocket connections served by this worker (admin only)"
+)
+@api_view(['GET'])
+@permission_classes([IsCustomAdmin])
+def realtime_connection_stats(request):
+    connections = connection_stats()
+    connections.sort(key=lambda c: c['lag_ms'], reverse=True)
+    return Response({
+        'connections': connections,
+        'total_connections': len(connections),
+        'slow_connections': sum(1 for c in connections if c['slow']),
+        'pending_events': sum(c['pending'] for c in connections),
+        'timestamp': timezone.now(),
+    })
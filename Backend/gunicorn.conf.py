@@ -0,0 +1,39 @@
+"""
+Production server settings, used by the Dockerfile:
+
+    gunicorn backend.asgi:application
+
+Gunicorn supervises the worker processes, each serving HTTP and WebSocket
+through Uvicorn (backend/asgi_worker.py). ``kill -HUP`` on the master
+starts new workers with new code and stops the old ones once their
+requests finished (up to ``graceful_timeout``). Every setting can be
+overridden from the environment.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = "backend.asgi_worker.Worker"
+
+# Worker processes; one async worker uses a core, so default to one per core
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+# Connections (HTTP and WebSocket) per worker before new ones get 503
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "4000"))
+# Threads for blocking work handed off the event loop are set by ASGI_THREADS (backend/settings.py)
+
+# Restart a worker after this many requests, jittered so they do not restart together
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "20000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "2000"))
+# A worker that did not check in for this long is restarted
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+# Time a stopping worker gets to finish its requests and close its WebSockets
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+backlog = int(os.getenv("GUNICORN_BACKLOG", "2048"))
+# Behind the platform's proxy, trust its X-Forwarded-* headers
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "*")
+
+# Off unless set ("-" logs to stdout), a line per device reading adds up
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
@@ -0,0 +1,164 @@
+"""
+Load test of a running server (see gunicorn.conf.py): many keep-alive
+clients posting readings to device-data/submit/ while device WebSockets are
+held open, as the fleet does.
+
+    python loadtest_server.py --device PK [--url http://127.0.0.1:8000]
+        [--connections 200] [--websockets 1000] [--duration 20]
+
+Every reading is stored, so point it at a test database. Start the server
+with DEVICE_INGEST_RATE=0 and INGEST_GLOBAL_RATE=0, or most readings are
+answered 429 by the ingest rate limit. Only needs the standard library and
+``websockets``, not Django.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import websockets
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.websockets_open = 0
+        self.max_websockets_open = 0
+
+
+async def http_client(host, port, device, client, deadline, stats):
+    reader = writer = None
+    sent = 0
+    while time.monotonic() < deadline:
+        if writer is None:
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+            except OSError as e:
+                stats.errors[type(e).__name__] += 1
+                await asyncio.sleep(0.5)
+                continue
+        sent += 1
+        body = json.dumps({
+            'DID': device, 'ALERT': 'MEDIUM', 'count': 5, 'REFER_Val': 10, 'TAMPER': 'false',
+            'BATTERY_PERCENTAGE': 80, 'PWR_STATUS': 'ON',
+            # Unique, or every reading after the first is a duplicate
+            'SEQ': f'load-{int(deadline)}-{client}-{sent}',
+        }).encode()
+        request = (
+            f"POST /api/device/device-data/submit/ HTTP/1.1\r\nHost: {host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        ).encode() + body
+
+        started = time.monotonic()
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            writer.write(request)
+            status = int((await reader.readline()).split()[1])
+            length, close = 0, False
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+                elif name.lower() == 'connection' and value.strip().lower() == 'close':
+                    close = True
+            await reader.readexactly(length)
+        except (OSError, IndexError, ValueError, asyncio.IncompleteReadError) as e:
+            stats.errors[type(e).__name__] += 1
+            writer.close()
+            writer = None
+            continue
+        finally:
+            stats.in_flight -= 1
+        stats.latencies.append(time.monotonic() - started)
+        stats.statuses[status] += 1
+        if close:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def device_socket(url, deadline, stats):
+    """Hold a device WebSocket open until the deadline, like an idle dispenser"""
+    try:
+        async with websockets.connect(url, open_timeout=30) as socket:
+            await socket.recv()
+            stats.websockets_open += 1
+            stats.max_websockets_open = max(stats.max_websockets_open, stats.websockets_open)
+            try:
+                await asyncio.wait_for(socket.wait_closed(), max(0, deadline - time.monotonic()))
+                stats.errors['WebSocket closed by server'] += 1
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                stats.websockets_open -= 1
+    except Exception as e:
+        stats.errors[f'WebSocket {type(e).__name__}'] += 1
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--device', type=int, required=True, help="Device primary key to send readings for")
+    parser.add_argument('--connections', type=int, default=200, help="Concurrent keep-alive HTTP clients")
+    parser.add_argument('--websockets', type=int, default=0, help="Device WebSockets held open meanwhile")
+    parser.add_argument('--duration', type=float, default=20, help="Seconds of load")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    ws_url = f"ws://{host}:{port}/ws/device/{args.device}/"
+    stats = Stats()
+
+    # Sockets open first, at a steady pace, then the HTTP load starts
+    deadline = time.monotonic() + args.duration + args.websockets / 500 + 5
+    sockets = []
+    for _ in range(args.websockets):
+        sockets.append(asyncio.create_task(device_socket(ws_url, deadline, stats)))
+        await asyncio.sleep(1 / 500)
+    while args.websockets and stats.websockets_open + sum(stats.errors.values()) < args.websockets \
+            and time.monotonic() < deadline - args.duration:
+        await asyncio.sleep(0.1)
+
+    started = time.monotonic()
+    http_deadline = started + args.duration
+    await asyncio.gather(*(
+        http_client(host, port, args.device, client, http_deadline, stats) for client in range(args.connections)
+    ))
+    elapsed = time.monotonic() - started
+    websockets_held = stats.websockets_open
+    for task in sockets:
+        task.cancel()
+    await asyncio.gather(*sockets, return_exceptions=True)
+
+    print(f"📊 {args.connections} HTTP clients for {elapsed:.1f}s, {args.websockets} device WebSockets")
+    if stats.latencies:
+        latencies = sorted(stats.latencies)
+        print(f"   - {len(latencies)} requests, {len(latencies) / elapsed:.0f} req/s")
+        print(f"   - latency ms: p50 {percentile(latencies, 0.5) * 1000:.1f}, "
+              f"p95 {percentile(latencies, 0.95) * 1000:.1f}, p99 {percentile(latencies, 0.99) * 1000:.1f}, "
+              f"max {latencies[-1] * 1000:.1f}, mean {statistics.mean(latencies) * 1000:.1f}")
+    print(f"   - status codes: {dict(stats.statuses)}")
+    print(f"   - requests in flight at once: {stats.max_in_flight}")
+    print(f"   - WebSockets open: {stats.max_websockets_open} at most, {websockets_held} through the whole run")
+    if stats.errors:
+        print(f"   - errors: {dict(stats.errors)}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(sender, using='default', **kwargs):
+    from .log_search import ensure_sqlite_search_index
+
+    ensure_sqlite_search_index(using)
 
 
 class AuthConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        post_migrate.connect(install_search_index, sender=self)
@@ -0,0 +1,201 @@
+"""
+Streaming AppLog exports.
+
+CSV, JSON and NDJSON exports are generated row by row from a server-side
+cursor (``QuerySet.iterator``) and streamed, so memory stays flat no matter
+how many logs are exported and the first bytes leave before the query has
+been read to the end.
+
+A PDF cannot be streamed the same way, reportlab assembles the document
+before writing it. PDF exports are therefore capped at
+``LOG_EXPORT_PDF_MAX_ROWS`` rows; when more logs match, the last page says
+so and the response carries an ``X-Next-Cursor`` header to request the
+next part with ``?cursor=``.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import router
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from .log_filters import filter_by_context
+from .models import AppLog
+from .pagination import AppLogKeysetPagination
+
+CHUNK_ROWS = 500
+
+COLUMNS = ['id', 'timestamp', 'level', 'message', 'source', 'details', 'user_id', 'user_email', 'context']
+
+
+def export_queryset(params):
+    """Logs matching the export filters (level, date range, context), newest first"""
+    queryset = AppLog.objects.select_related('user')
+    level = params.get('level')
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    if level:
+        queryset = queryset.filter(level=level.upper())
+    if start_date:
+        queryset = queryset.filter(timestamp__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(timestamp__lte=end_date)
+    queryset = filter_by_context(queryset, params)
+    # Pinned now, a streamed export is read after the view returned (see backend/routers.py)
+    return queryset.using(router.db_for_read(AppLog)).order_by('-timestamp', '-id')
+
+
+def _row(log):
+    return {
+        'id': str(log.id),
+        'timestamp': log.timestamp.strftime('%Y-%m-%d %H:%M:%S') if log.timestamp else '',
+        'level': log.level,
+        'message': log.message,
+        'source': log.source,
+        'details': log.details,
+        'user_id': log.user.id if log.user else None,
+        'user_email': log.user.email if log.user else None,
+        'context': log.context,
+    }
+
+
+def _logs(queryset):
+    return queryset.iterator(chunk_size=CHUNK_ROWS)
+
+
+def csv_chunks(queryset):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for index, log in enumerate(_logs(queryset), start=1):
+        row = _row(log)
+        row['context'] = json.dumps(row['context'], default=str) if row['context'] else ''
+        writer.writerow(['' if row[column] is None else row[column] for column in COLUMNS])
+        if index % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def json_chunks(queryset):
+    """A JSON array, written element by element"""
+    yield '['
+    separator = ''
+    for log in _logs(queryset):
+        yield separator + json.dumps(_row(log), default=str)
+        separator = ','
+    yield ']'
+
+
+def ndjson_chunks(queryset):
+    """One JSON object per line"""
+    for log in _logs(queryset):
+        yield json.dumps(_row(log), default=str) + '\n'
+
+
+def _batched(chunks, batch=50):
+    while True:
+        data = ''.join(islice(chunks, batch))
+        if not data:
+            break
+        yield data
+
+
+async def _async_batched(chunks, batch=50):
+    # Under ASGI a synchronous iterator would be read into memory first, so
+    # pull it in batches from the thread that owns the database connection
+    take = sync_to_async(lambda: ''.join(islice(chunks, batch)))
+    while True:
+        data = await take()
+        if not data:
+            break
+        yield data
+
+
+def streaming_response(request, chunks, content_type, filename):
+    """Stream ``chunks`` (an iterator of str) as a file download"""
+    chunks = iter(chunks)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = _async_batched(chunks)
+    else:
+        chunks = _batched(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _draw_header(p, y, title):
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(40, y, title)
+    y -= 25
+    p.setFont("Helvetica", 10)
+    p.drawString(40, y, f"Exported: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    y -= 20
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(40, y, "ID")
+    p.drawString(80, y, "Timestamp")
+    p.drawString(170, y, "Level")
+    p.drawString(220, y, "Message")
+    p.drawString(400, y, "Source")
+    p.drawString(500, y, "User Email")
+    p.setFont("Helvetica", 9)
+    return y - 16
+
+
+def pdf_response(queryset, cursor=None):
+    """
+    Render up to ``LOG_EXPORT_PDF_MAX_ROWS`` logs, continuing after ``cursor``
+    when given. Pages are drawn as rows arrive from the database cursor.
+    """
+    max_rows = getattr(settings, 'LOG_EXPORT_PDF_MAX_ROWS', 5000)
+    if cursor:
+        timestamp, pk = AppLogKeysetPagination.decode_cursor(cursor)
+        queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter, pageCompression=1)
+    width, height = letter
+    y = _draw_header(p, height - 40, "Application Logs Export (contd)" if cursor else "Application Logs Export")
+
+    last = None
+    next_cursor = None
+    for index, log in enumerate(_logs(queryset[:max_rows + 1])):
+        if index == max_rows:
+            next_cursor = AppLogKeysetPagination.encode_cursor(last.timestamp, last.pk)
+            break
+        if y < 40:
+            p.showPage()
+            y = _draw_header(p, height - 40, "Application Logs Export (contd)")
+        p.drawString(40, y, str(log.id))
+        p.drawString(80, y, log.timestamp.strftime('%Y-%m-%d %H:%M:%S') if log.timestamp else '')
+        p.drawString(170, y, log.level)
+        p.drawString(220, y, (log.message or '')[:28])
+        p.drawString(400, y, (log.source or '')[:18])
+        p.drawString(500, y, (log.user.email if log.user else '')[:20])
+        y -= 14
+        last = log
+
+    if next_cursor:
+        if y < 60:
+            p.showPage()
+            y = height - 40
+        p.setFont("Helvetica-Oblique", 9)
+        p.drawString(40, y - 10, f"Export capped at {max_rows} rows. More logs match these filters,")
+        p.drawString(40, y - 22, "request the next part with the cursor from the X-Next-Cursor header.")
+    p.save()
+
+    response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
+    buffer.close()
+    response['Content-Disposition'] = 'attachment; filename="logs.pdf"'
+    if next_cursor:
+        response['X-Next-Cursor'] = next_cursor
+    return response
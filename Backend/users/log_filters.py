@@ -0,0 +1,44 @@
+"""
+Filters on the structured ``AppLog.context`` keys.
+
+On PostgreSQL every filter is a ``context @> {...}`` containment test,
+which the GIN index from migration 0011 answers without scanning the table.
+Other databases compare the extracted key instead.
+"""
+from django.db import connection
+from django.db.models import Q
+
+# Query parameters that filter on a context key of the same name
+CONTEXT_FILTER_KEYS = ('device_id', 'user_id', 'alert')
+
+
+def _coerce(value):
+    """Query parameters are strings, context values keep their JSON type"""
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def context_q(key, value):
+    """Condition matching logs whose context has ``key`` equal to ``value``"""
+    if connection.vendor == 'postgresql':
+        return Q(context__contains={key: value})
+    return Q(**{f'context__{key}': value})
+
+
+def filter_by_context(queryset, params):
+    """Apply every context filter present in ``params`` (e.g. request.query_params)"""
+    for key in CONTEXT_FILTER_KEYS:
+        raw = params.get(key)
+        if not raw:
+            continue
+        value = _coerce(raw.strip())
+        condition = context_q(key, value)
+        if key == 'user_id' and isinstance(value, int) and not isinstance(value, bool):
+            # Also match logs written on behalf of the user (the user column)
+            condition |= Q(user_id=value)
+        queryset = queryset.filter(condition)
+    return queryset
@@ -0,0 +1,155 @@
+"""
+Log policy for high-volume, repetitive events.
+
+Some sources (device readings) would write one AppLog row per event while
+almost every row says the same thing. ``LogAggregator.record`` logs such an
+event in full only when its state differs from the previous event with the
+same key, e.g. a dispenser going from FULL to LOW or being tampered with.
+Repeats are counted and written as one summary per key per
+``APPLOG_AGGREGATE_INTERVAL_SECONDS``:
+
+    "58 readings received from device 12 in the last 60s"
+
+Errors are not routed through here and are always logged in full. Neither
+are warnings, except ones a single misbehaving device repeats many times a
+second (ingest rate limit rejections): the first of a run is logged in full
+at WARNING, the repeats as a WARNING summary. Counts are kept per worker
+process, so with several workers each one writes its own summary.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .log_sink import get_log_sink
+
+logger = logging.getLogger(__name__)
+
+
+class _Window:
+    __slots__ = ('state', 'count', 'started', 'level', 'summary', 'context')
+
+    def __init__(self, state, started, level, summary):
+        self.state = state
+        self.count = 0
+        self.started = started
+        self.level = level
+        self.summary = summary
+        self.context = {}
+
+
+class LogAggregator:
+    def __init__(self, interval=60, max_keys=50000):
+        self.interval = interval
+        self.max_keys = max(max_keys, 1)
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def record(self, source, key, state, message, summary, level='INFO', **context):
+        """
+        Log an event, or count it towards the next summary of ``key``.
+
+        ``state`` is any comparable value; the event is logged in full when it
+        differs from the previous one. ``summary`` is a format string for the
+        summary message and may use ``{count}``, ``{key}`` and ``{seconds}``.
+        """
+        if not self.interval:
+            self._write(level, message, source, context)
+            return
+
+        now = time.monotonic()
+        pending = []
+        with self._lock:
+            window = self._windows.get((source, key))
+            if window is None or window.state != state:
+                if window is not None and window.count:
+                    pending.append(self._summary(source, key, window, now))
+                pending.append((level, message, source, dict(
+                    context, previous_state=_describe(window.state) if window else None
+                )))
+                self._windows[(source, key)] = _Window(state, now, level, summary)
+                self._windows.move_to_end((source, key))
+                while len(self._windows) > self.max_keys:
+                    # Forgetting a key only means its next event is logged in full
+                    (old_source, old_key), old = self._windows.popitem(last=False)
+                    if old.count:
+                        pending.append(self._summary(old_source, old_key, old, now))
+            else:
+                window.count += 1
+                window.context = context
+                if now - window.started >= self.interval:
+                    pending.append(self._summary(source, key, window, now))
+
+            if now - self._last_sweep >= self.interval:
+                # Keys that went quiet still get their summary written
+                self._last_sweep = now
+                for (other_source, other_key), other in self._windows.items():
+                    if other.count and now - other.started >= self.interval:
+                        pending.append(self._summary(other_source, other_key, other, now))
+
+        for entry in pending:
+            self._write(*entry)
+
+    def _summary(self, source, key, window, now):
+        """Build the summary entry of a window and start a new one; call with the lock held"""
+        seconds = max(int(round(now - window.started)), 1)
+        entry = (
+            window.level,
+            window.summary.format(count=window.count, key=key, seconds=seconds),
+            source,
+            dict(window.context, aggregated=window.count, interval_seconds=seconds),
+        )
+        window.count = 0
+        window.started = now
+        return entry
+
+    def flush(self):
+        """Write the summaries of every window that has counted events"""
+        now = time.monotonic()
+        with self._lock:
+            pending = [
+                self._summary(source, key, window, now)
+                for (source, key), window in self._windows.items() if window.count
+            ]
+        for entry in pending:
+            self._write(*entry)
+
+    @staticmethod
+    def _write(level, message, source, context):
+        from users.models import AppLog
+
+        try:
+            getattr(AppLog, f'log_{level.lower()}')(message=message, source=source, **context)
+        except Exception as e:
+            logger.error(f"Failed to write AppLog entry: {e}")
+
+
+def _describe(state):
+    if isinstance(state, (tuple, list)):
+        return ', '.join(str(part) for part in state)
+    return state
+
+
+_aggregator = None
+_aggregator_lock = threading.Lock()
+
+
+def get_log_aggregator():
+    """Return the process-wide aggregator"""
+    global _aggregator
+    if _aggregator is None:
+        with _aggregator_lock:
+            if _aggregator is None:
+                # atexit handlers run in reverse order: create the sink first
+                # so its final flush runs after the last summaries were queued
+                get_log_sink()
+                _aggregator = LogAggregator(
+                    interval=getattr(settings, 'APPLOG_AGGREGATE_INTERVAL_SECONDS', 60),
+                    max_keys=getattr(settings, 'APPLOG_AGGREGATE_MAX_KEYS', 50000),
+                )
+                atexit.register(_aggregator.flush)
+    return _aggregator
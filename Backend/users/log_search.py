@@ -0,0 +1,191 @@
+"""
+Indexed full-text search over AppLog message, details and source.
+
+PostgreSQL uses a GIN index on a ``to_tsvector('simple', ...)`` expression
+(migration 0010), SQLite an FTS5 external-content table kept in sync by
+triggers (:func:`ensure_sqlite_search_index`, run after every migrate). Any
+other database, or a SQLite build without FTS5, falls back to ``icontains``
+matching.
+
+Query syntax:
+- bare words match as prefixes, ``disp`` finds ``dispenser``
+- ``"quoted words"`` match as an exact phrase
+- ``word*`` is accepted too, for people used to search engines
+- all terms must match
+
+Matching rows are annotated with ``search_rank`` (higher is better).
+"""
+import re
+
+from django.db import DatabaseError, connection, connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'users_applog_fts'
+
+# Must match the index expression in migration 0010 exactly, or the planner
+# will not use the index
+PG_SEARCH_VECTOR = (
+    "to_tsvector('simple', coalesce(users_applog.message, '') || ' ' || "
+    "coalesce(users_applog.details, '') || ' ' || coalesce(users_applog.source, ''))"
+)
+
+# Each side of a search must split text into words the way its index did.
+# FTS5's unicode61 tokenizer splits on anything that is not a letter or digit,
+# like _WORD. PostgreSQL's parser does not: it keeps emails, host and dotted
+# names, paths and decimals (foo@bar.com, device.rate_limit, 64.5) as single
+# lexemes, so search terms are handed to to_tsquery as text for the same
+# parser to split (see to_tsquery).
+_WORD = re.compile(r'[^\W_]+')
+_TERM = re.compile(r'"([^"]*)"?|(\S+)')
+_MAX_TERMS = 16
+
+_FTS_TRIGGERS = {
+    f'{FTS_TABLE}_ai': (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON users_applog BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, message, details, source) "
+        "VALUES (new.rowid, new.message, new.details, new.source); END"
+    ),
+    f'{FTS_TABLE}_ad': (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON users_applog BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message, details, source) "
+        "VALUES ('delete', old.rowid, old.message, old.details, old.source); END"
+    ),
+    f'{FTS_TABLE}_au': (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON users_applog BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message, details, source) "
+        "VALUES ('delete', old.rowid, old.message, old.details, old.source); "
+        f"INSERT INTO {FTS_TABLE}(rowid, message, details, source) "
+        "VALUES (new.rowid, new.message, new.details, new.source); END"
+    ),
+}
+
+_fts5_available = None
+
+
+def parse_query(text):
+    """
+    Split a search string into ``(text, words, prefix)`` terms. Each term is
+    a phrase of one or more words, ``text`` as typed; ``prefix`` means its
+    last word is a prefix.
+    """
+    terms = []
+    for phrase, bare in _TERM.findall(text or ''):
+        term = phrase or bare.rstrip('*')
+        words = [word.lower() for word in _WORD.findall(term)]
+        if words:
+            terms.append((term, words, not phrase))
+    return terms[:_MAX_TERMS]
+
+
+def _tsquery_quote(text):
+    # Inside a quoted tsquery operand quotes are doubled and backslashes escape
+    return "'%s'" % text.replace('\\', '\\\\').replace("'", "''")
+
+
+def to_tsquery(terms):
+    """
+    Build a raw ``to_tsquery`` string. Each term is passed quoted, so
+    PostgreSQL's parser splits it exactly as it split the indexed text; a
+    term of several words becomes a phrase. Bare terms are prefixes, which
+    to_tsquery applies to each of their lexemes.
+    """
+    parts = []
+    for term, _words, prefix in terms:
+        parts.append(_tsquery_quote(term) + (':*' if prefix else ''))
+    return ' & '.join(parts)
+
+
+def to_fts5_query(terms):
+    """Build an FTS5 MATCH expression (implicit AND between phrases)"""
+    parts = []
+    for _term, words, prefix in terms:
+        parts.append('"%s"%s' % (' '.join(words), '*' if prefix else ''))
+    return ' '.join(parts)
+
+
+def fts5_available():
+    """Whether the FTS5 table exists on this SQLite database"""
+    global _fts5_available
+    if _fts5_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+            )
+            _fts5_available = cursor.fetchone() is not None
+    return _fts5_available
+
+
+def ensure_sqlite_search_index(using='default'):
+    """
+    Create the FTS5 table and its triggers on SQLite if they are missing.
+    SQLite drops triggers whenever a migration remakes ``users_applog``, so
+    this runs after every migrate and rebuilds the index when it had to
+    repair anything. Does nothing on other databases.
+    """
+    global _fts5_available
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE name = 'users_applog'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name LIKE %s", [FTS_TABLE + '%']
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if FTS_TABLE in existing and all(name in existing for name in _FTS_TRIGGERS):
+            return
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "message, details, source, content='users_applog', content_rowid='rowid')"
+            )
+        except DatabaseError:
+            # SQLite compiled without FTS5, search falls back to icontains
+            return
+        for sql in _FTS_TRIGGERS.values():
+            cursor.execute(sql)
+        # Re-index from the table, rowids change when SQLite remakes it
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _fts5_available = None
+
+
+def search_logs(queryset, text):
+    """Filter an AppLog queryset by ``text`` and annotate ``search_rank``"""
+    terms = parse_query(text)
+    if not terms:
+        return queryset
+
+    if connection.vendor == 'postgresql':
+        tsquery = to_tsquery(terms)
+        return queryset.extra(
+            where=[f"{PG_SEARCH_VECTOR} @@ to_tsquery('simple', %s)"],
+            params=[tsquery],
+        ).annotate(search_rank=RawSQL(
+            f"ts_rank({PG_SEARCH_VECTOR}, to_tsquery('simple', %s))",
+            [tsquery],
+            output_field=FloatField(),
+        ))
+
+    if connection.vendor == 'sqlite' and fts5_available():
+        match = to_fts5_query(terms)
+        return queryset.extra(
+            where=[f"users_applog.rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)"],
+            params=[match],
+        ).annotate(search_rank=RawSQL(
+            # bm25() is lower for better matches, negate it so higher is better
+            f"(SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = users_applog.rowid)",
+            [match],
+            output_field=FloatField(),
+        ))
+
+    # No index available, substring match every word
+    for _term, words, _prefix in terms:
+        for word in words:
+            queryset = queryset.filter(
+                Q(message__icontains=word) | Q(details__icontains=word) | Q(source__icontains=word)
+            )
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
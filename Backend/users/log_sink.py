@@ -0,0 +1,161 @@
+"""
+Non-blocking, batched writer for AppLog rows.
+
+``AppLog.log_*`` hands records to the sink instead of running an INSERT on
+the request path. A background thread writes them with ``bulk_create`` every
+``APPLOG_BATCH_SIZE`` records or every ``APPLOG_FLUSH_INTERVAL_MS``, whichever
+comes first, and once more when the process shuts down.
+
+The queue is bounded by ``APPLOG_MAX_QUEUE``. Once it is half full, DEBUG
+records are dropped and INFO/SUCCESS records are sampled (1 in
+``APPLOG_SAMPLE_RATE`` kept). When it is full, only errors are accepted,
+until a hard limit of 125% of the queue size.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, deque
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_ALWAYS_KEEP = ('WARNING', 'ERROR')
+
+
+class AppLogSink:
+    def __init__(self, batch_size=100, flush_interval_ms=1000, max_queue=10000, sample_rate=10):
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = max(flush_interval_ms, 10) / 1000.0
+        self.max_queue = max(max_queue, 1)
+        self.sample_rate = max(sample_rate, 1)
+        self.dropped = Counter()
+        self._queue = deque()
+        self._sampled = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._pid = None
+
+    def submit(self, record):
+        """Queue an unsaved AppLog instance; returns False if it was dropped"""
+        self._ensure_started()
+        with self._lock:
+            if not self._admit(record.level, len(self._queue)):
+                self.dropped[record.level] += 1
+                return False
+            self._queue.append(record)
+            size = len(self._queue)
+        if size >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _admit(self, level, size):
+        if size < self.max_queue // 2:
+            return True
+        if size < self.max_queue:
+            if level in _ALWAYS_KEEP:
+                return True
+            if level == 'DEBUG':
+                return False
+            self._sampled += 1
+            return self._sampled % self.sample_rate == 0
+        return level == 'ERROR' and size < self.max_queue + self.max_queue // 4
+
+    def _ensure_started(self):
+        # (Re)start the writer lazily, also in worker processes forked after import
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Records inherited from the parent process are its to write
+                self._queue.clear()
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='applog-sink', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _take(self):
+        with self._lock:
+            count = min(len(self._queue), self.batch_size)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def flush(self):
+        """Write everything queued so far"""
+        with self._flush_lock:
+            batch = self._take()
+            if not batch:
+                return
+            close_old_connections()
+            try:
+                while batch:
+                    self._write(batch)
+                    batch = self._take()
+            finally:
+                # Between flushes the writer holds no connection (a pooled one goes back)
+                close_old_connections()
+            self._report_drops()
+
+    def _write(self, batch):
+        from users.models import AppLog
+
+        try:
+            AppLog.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception as e:
+            # One bad record must not lose the whole batch, retry one by one
+            logger.error(f"AppLog bulk write failed, retrying individually: {e}")
+            close_old_connections()
+            for record in batch:
+                try:
+                    record.save(force_insert=True)
+                except Exception as record_exc:
+                    logger.error(f"Failed to write AppLog record: {record_exc}")
+
+    def _report_drops(self):
+        with self._lock:
+            dropped, self.dropped = self.dropped, Counter()
+        if dropped:
+            logger.warning(f"AppLog sink under pressure, dropped records: {dict(dropped)}")
+
+    def stop(self):
+        """Stop the writer thread and flush whatever is still queued"""
+        self._stopping = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self.flush()
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_log_sink():
+    """Return the process-wide sink, or None when logs are written synchronously"""
+    global _sink
+    if not getattr(settings, 'APPLOG_ASYNC', True):
+        return None
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = AppLogSink(
+                    batch_size=getattr(settings, 'APPLOG_BATCH_SIZE', 100),
+                    flush_interval_ms=getattr(settings, 'APPLOG_FLUSH_INTERVAL_MS', 1000),
+                    max_queue=getattr(settings, 'APPLOG_MAX_QUEUE', 10000),
+                    sample_rate=getattr(settings, 'APPLOG_SAMPLE_RATE', 10),
+                )
+                atexit.register(_sink.stop)
+    return _sink
@@ -0,0 +1,224 @@
+"""
+AppLog statistics from daily rollups plus one grouped query.
+
+Completed days are read from ``AppLogDailyRollup``. The table is kept up by
+``roll_up_days``, which the ``rollup_app_logs`` command runs on a schedule
+and ``prune_app_logs`` runs before deleting anything, so a day is rolled up
+while all of its logs still exist. Reading stats never writes rollups: a
+final day that has none yet is counted live with the recent window (the last
+24 hours, and yesterday until it is final), in a single query grouped by day
+and source with one conditional count per level.
+
+Stats filtered on context keys (device_id, alert, ...) cannot use the
+rollups, those are computed live over the whole range in one query.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .log_filters import CONTEXT_FILTER_KEYS, filter_by_context
+from .models import AppLog, AppLogDailyRollup
+
+# A day is final once this long has passed since midnight, so logs still
+# queued in the batched writer are not left out of its rollup
+FINALIZE_GRACE = timedelta(minutes=15)
+
+LEVELS = [level for level, _label in AppLog.LOG_LEVELS]
+
+
+def _empty_day():
+    return {'total': 0, 'by_level': Counter(), 'by_source': Counter()}
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _grouped_counts(queryset, recent_since=None):
+    """
+    One query grouped by day and source, with a conditional count per level.
+    Returns ``(days, recent)`` where ``days`` maps date -> day totals and
+    ``recent`` counts the rows at or after ``recent_since``.
+    """
+    aggregates = {
+        f'level_{level}': Count('id', filter=Q(level=level)) for level in LEVELS
+    }
+    aggregates['total'] = Count('id')
+    if recent_since is not None:
+        aggregates['recent'] = Count('id', filter=Q(timestamp__gte=recent_since))
+
+    rows = (
+        queryset.annotate(day=TruncDate('timestamp'))
+        .values('day', 'source')
+        .annotate(**aggregates)
+        .order_by()
+    )
+    days = {}
+    recent = 0
+    for row in rows:
+        day = days.setdefault(row['day'], _empty_day())
+        day['total'] += row['total']
+        day['by_source'][row['source']] += row['total']
+        for level in LEVELS:
+            if row[f'level_{level}']:
+                day['by_level'][level] += row[f'level_{level}']
+        recent += row.get('recent', 0)
+    return days, recent
+
+
+def last_final_day(now=None):
+    """The latest day whose logs are all written, and can be rolled up"""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    return today - timedelta(days=1 if now - _day_start(today) >= FINALIZE_GRACE else 2)
+
+
+def final_until(now=None):
+    """Start of the first day that is not final yet, logs before it can be rolled up"""
+    return _day_start(last_final_day(now) + timedelta(days=1))
+
+
+def _days_between(first_day, last_day):
+    return [first_day + timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+
+
+def _count_days(days):
+    """Totals of each of ``days`` (in order), counted with one grouped query"""
+    computed, _recent = _grouped_counts(AppLog.objects.filter(
+        timestamp__gte=_day_start(days[0]),
+        timestamp__lt=_day_start(days[-1] + timedelta(days=1)),
+    ))
+    return {day: computed.get(day) or _empty_day() for day in days}
+
+
+def roll_up_days(through=None, batch_days=31):
+    """
+    Store the rollup of every final day up to ``through`` (default: the last
+    final day) that has none, from the oldest log on. Existing rollups are
+    left alone, their logs may be pruned since. Returns how many were stored.
+    """
+    last_day = min(through or last_final_day(), last_final_day())
+    oldest = AppLog.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+    if oldest is None:
+        return 0
+    first_day = timezone.localdate(oldest)
+    if first_day > last_day:
+        return 0
+
+    existing = set(
+        AppLogDailyRollup.objects.filter(date__range=(first_day, last_day)).values_list('date', flat=True)
+    )
+    missing = [day for day in _days_between(first_day, last_day) if day not in existing]
+    stored = 0
+    for start in range(0, len(missing), batch_days):
+        batch = missing[start:start + batch_days]
+        counted = _count_days(batch)
+        # ignore_conflicts: a concurrent run may have stored the same days
+        AppLogDailyRollup.objects.bulk_create([
+            AppLogDailyRollup(
+                date=day,
+                total=totals['total'],
+                by_level=dict(totals['by_level']),
+                by_source=dict(totals['by_source']),
+            )
+            for day, totals in counted.items()
+        ], ignore_conflicts=True)
+        stored += len(batch)
+    return stored
+
+
+def _rollups(first_day, last_day):
+    """Totals for completed days, counting the ones not rolled up yet live"""
+    days = {
+        rollup.date: {
+            'total': rollup.total,
+            'by_level': Counter(rollup.by_level),
+            'by_source': Counter(rollup.by_source),
+        }
+        for rollup in AppLogDailyRollup.objects.filter(date__range=(first_day, last_day))
+    }
+    missing = [day for day in _days_between(first_day, last_day) if day not in days]
+    if missing:
+        # Not stored: only roll_up_days knows the day's logs are still complete
+        days.update(_count_days(missing))
+    return days
+
+
+def log_statistics(days=30, params=None):
+    """Build the payload of AdminLogsStatsView for the last ``days`` calendar days"""
+    params = params or {}
+    days = max(int(days), 1)
+    now = timezone.now()
+    today = timezone.localdate(now)
+    first_day = today - timedelta(days=days - 1)
+    last_24h = now - timedelta(hours=24)
+
+    if any(params.get(key) for key in CONTEXT_FILTER_KEYS):
+        queryset = filter_by_context(
+            AppLog.objects.filter(timestamp__gte=min(_day_start(first_day), last_24h)),
+            params,
+        )
+        per_day, recent = _grouped_counts(queryset, recent_since=last_24h)
+        per_day = {day: totals for day, totals in per_day.items() if day >= first_day}
+    else:
+        # Days up to here are final and served from rollups
+        last_final = last_final_day(now)
+        live_since = min(last_24h, _day_start(last_final + timedelta(days=1)))
+        per_day, recent = _grouped_counts(
+            AppLog.objects.filter(timestamp__gte=live_since), recent_since=last_24h
+        )
+        per_day = {
+            day: totals for day, totals in per_day.items() if day > last_final and day >= first_day
+        }
+        if first_day <= last_final:
+            per_day.update(_rollups(first_day, last_final))
+
+    by_level = Counter()
+    by_source = Counter()
+    total_logs = 0
+    for totals in per_day.values():
+        total_logs += totals['total']
+        by_level.update(totals['by_level'])
+        by_source.update(totals['by_source'])
+
+    error_count = by_level.get('ERROR', 0)
+    warning_count = by_level.get('WARNING', 0)
+    error_rate = (error_count / total_logs * 100) if total_logs > 0 else 0
+    warning_rate = (warning_count / total_logs * 100) if total_logs > 0 else 0
+
+    daily_trend = []
+    for offset in range(6, -1, -1):
+        day = today - timedelta(days=offset)
+        totals = per_day.get(day)
+        daily_trend.append({
+            'date': day.strftime('%Y-%m-%d'),
+            'count': totals['total'] if totals else 0,
+        })
+
+    top_sources = [
+        {'source': source, 'count': count} for source, count in by_source.most_common(10)
+    ]
+    return {
+        'summary': {
+            'total_logs': total_logs,
+            'error_count': error_count,
+            'warning_count': warning_count,
+            'error_rate': round(error_rate, 2),
+            'warning_rate': round(warning_rate, 2),
+            'recent_activity_24h': recent,
+        },
+        'by_level': [
+            {'level': level, 'count': by_level[level]} for level in sorted(by_level) if by_level[level]
+        ],
+        'by_source': top_sources,
+        'daily_trend': daily_trend,
+        'top_sources': top_sources[:5],
+        'date_range': {
+            'start_date': first_day.strftime('%Y-%m-%d'),
+            'end_date': today.strftime('%Y-%m-%d'),
+            'days': days,
+        },
+    }
@@ -0,0 +1,69 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from users.log_stats import final_until, roll_up_days
+from users.models import AppLog
+
+
+class Command(BaseCommand):
+    help = "Delete application logs older than the retention configured per level (APPLOG_RETENTION_DAYS), in bounded chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--level', action='append', help='Only prune this level (repeatable)')
+        parser.add_argument('--days', type=int, help='Override the retention in days for the selected levels')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows deleted per statement')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between chunks')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be deleted')
+
+    def handle(self, *args, **options):
+        retention = dict(getattr(settings, 'APPLOG_RETENTION_DAYS', {}))
+        levels = [level.upper() for level in (options['level'] or retention.keys())]
+        valid_levels = dict(AppLog.LOG_LEVELS)
+        unknown = [level for level in levels if level not in valid_levels]
+        if unknown:
+            raise CommandError(f"Unknown log level(s): {', '.join(unknown)}")
+
+        chunk_size = max(options['chunk_size'], 1)
+        now = timezone.now()
+        total = 0
+
+        if not options['dry_run']:
+            # Roll days up while their logs are complete, the stats read pruned days from rollups
+            rolled_up = roll_up_days()
+            self.stdout.write(f"{rolled_up} day(s) rolled up before pruning")
+
+        for level in levels:
+            days = options['days'] if options['days'] is not None else retention.get(level)
+            if days is None:
+                self.stdout.write(f"{level}: no retention configured, skipping")
+                continue
+            # Never into a day that is not final, it could not have been rolled up
+            cutoff = min(now - timedelta(days=days), final_until(now))
+            expired = AppLog.objects.filter(level=level, timestamp__lt=cutoff)
+
+            if options['dry_run']:
+                count = expired.count()
+                self.stdout.write(f"{level}: {count} logs older than {days} days would be deleted")
+                total += count
+                continue
+
+            deleted = 0
+            while True:
+                # Oldest first, each chunk is a short index range scan + delete
+                ids = list(
+                    expired.order_by('timestamp', 'id').values_list('id', flat=True)[:chunk_size]
+                )
+                if not ids:
+                    break
+                deleted += AppLog.objects.filter(id__in=ids).delete()[0]
+                if options['pause']:
+                    time.sleep(options['pause'])
+            self.stdout.write(f"{level}: deleted {deleted} logs older than {days} days")
+            total += deleted
+
+        verb = 'would be deleted' if options['dry_run'] else 'deleted'
+        self.stdout.write(self.style.SUCCESS(f"{total} logs {verb}"))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from users.log_stats import roll_up_days
+
+
+class Command(BaseCommand):
+    help = "Store the daily AppLog rollups of completed days that have none yet, read by the log statistics"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, help='Keep running, rolling up every this many seconds')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            close_old_connections()
+            stored = roll_up_days()
+            if stored or not interval:
+                self.stdout.write(self.style.SUCCESS(f"{stored} day(s) rolled up"))
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_applog'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='applog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
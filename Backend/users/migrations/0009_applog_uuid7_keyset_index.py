@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:41
+
+import users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Switch new AppLog rows to time-ordered UUIDv7 keys.
+
+    The column type does not change, so existing uuid4 rows stay as they are
+    and no table rewrite is needed; they age out through prune_app_logs.
+    The (timestamp, id) index is built before the plain timestamp index is
+    dropped, so queries never run without an index on timestamp.
+    """
+
+    dependencies = [
+        ('users', '0008_applog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='applog',
+            options={'ordering': ['-timestamp', '-id']},
+        ),
+        migrations.AlterField(
+            model_name='applog',
+            name='id',
+            field=models.UUIDField(default=users.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AddIndex(
+            model_name='applog',
+            index=models.Index(fields=['timestamp', 'id'], name='users_applog_ts_id_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='applog',
+            name='users_applo_timesta_b7d36e_idx',
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+PG_INDEX = 'users_applog_search_idx'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        # CONCURRENTLY so a large log table stays writable while it builds
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {PG_INDEX} ON users_applog USING gin ("
+            "to_tsvector('simple', coalesce(message, '') || ' ' || "
+            "coalesce(details, '') || ' ' || coalesce(source, '')))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {PG_INDEX}")
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text search index for AppLog, see users/log_search.py.
+
+    PostgreSQL gets a GIN index on a tsvector expression. The SQLite FTS5
+    table is not created here but by a post_migrate hook (users/apps.py),
+    because SQLite drops its triggers whenever a later migration remakes
+    the table.
+    """
+
+    atomic = False
+
+    dependencies = [
+        ('users', '0009_applog_uuid7_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:45
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+CONTEXT_INDEX = 'users_applog_context_gin'
+
+
+def create_context_index(apps, schema_editor):
+    # jsonb_path_ops serves the @> containment filters in users/log_filters.py
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {CONTEXT_INDEX} "
+            "ON users_applog USING gin (context jsonb_path_ops)"
+        )
+
+
+def drop_context_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {CONTEXT_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('users', '0010_applog_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='applog',
+            name='context',
+            field=models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder),
+        ),
+        migrations.RunPython(create_context_index, drop_context_index),
+    ]
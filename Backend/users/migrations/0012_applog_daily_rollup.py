@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_applog_context'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppLogDailyRollup',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('by_level', models.JSONField(default=dict)),
+                ('by_source', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+    ]
@@ -5,8 +5,40 @@ from datetime import timedelta
 import random
 import string
 from django.core.validators import RegexValidator
+from django.core.serializers.json import DjangoJSONEncoder
+import os
+import threading
+import time
 import uuid
 
+from .log_sink import get_log_sink
+
+_uuid7_lock = threading.Lock()
+_uuid7_last = [0, 0]
+
+
+def uuid7():
+    """
+    Time-ordered UUID (version 7): 48-bit Unix milliseconds, then a 12-bit
+    counter that keeps IDs generated in the same millisecond increasing, then
+    random bits. New rows land at the right edge of the primary key index
+    instead of at random pages.
+    """
+    with _uuid7_lock:
+        ms = time.time_ns() // 1_000_000
+        last_ms, counter = _uuid7_last
+        if ms <= last_ms:
+            ms, counter = last_ms, counter + 1
+            if counter > 0xFFF:
+                ms, counter = ms + 1, 0
+        else:
+            counter = int.from_bytes(os.urandom(2), 'big') & 0x3FF
+        _uuid7_last[:] = [ms, counter]
+    rand_b = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    value = (ms & ((1 << 48) - 1)) << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | rand_b
+    return uuid.UUID(int=value)
+
+
 def default_profile_image():
     return 'https://media.istockphoto.com/id/2212478710/vector/faceless-male-avatar-in-hoodie-illustration.jpg?s=612x612&w=0&k=20&c=Wlwpp5BUnzbzXxaCT0a7WqP_JvknA-JtOhBoKDpQMHE='
 
@@ -105,20 +137,24 @@ class AppLog(models.Model):
         ('DEBUG', 'Debug'),
     ]
     
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    # Set when the event happens, not when the batched writer flushes it
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     level = models.CharField(max_length=10, choices=LOG_LEVELS, default='INFO')
     message = models.CharField(max_length=255)
     source = models.CharField(max_length=50, default='System')
     details = models.TextField(blank=True, null=True)
+    # Structured key/values (device_id, alert, ...), GIN indexed on PostgreSQL
+    context = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
     user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True, null=True)
     
     class Meta:
-        ordering = ['-timestamp']
+        ordering = ['-timestamp', '-id']
         indexes = [
-            models.Index(fields=['timestamp']),
+            # Keyset pagination walks (timestamp, id), see users/pagination.py
+            models.Index(fields=['timestamp', 'id'], name='users_applog_ts_id_idx'),
             models.Index(fields=['level']),
             models.Index(fields=['source']),
         ]
@@ -127,38 +163,49 @@ class AppLog(models.Model):
         return f"{self.timestamp.strftime('%Y-%m-%d %H:%M:%S')} - {self.level} - {self.message}"
     
     @classmethod
-    def log_info(cls, message, source='System', details=None, user=None, request=None):
+    def log_info(cls, message, source='System', details=None, user=None, request=None, **context):
         """Log an info message"""
-        return cls._create_log('INFO', message, source, details, user, request)
+        return cls._create_log('INFO', message, source, details, user, request, context)
     
     @classmethod
-    def log_success(cls, message, source='System', details=None, user=None, request=None):
+    def log_success(cls, message, source='System', details=None, user=None, request=None, **context):
         """Log a success message"""
-        return cls._create_log('SUCCESS', message, source, details, user, request)
+        return cls._create_log('SUCCESS', message, source, details, user, request, context)
     
     @classmethod
-    def log_warning(cls, message, source='System', details=None, user=None, request=None):
+    def log_warning(cls, message, source='System', details=None, user=None, request=None, **context):
         """Log a warning message"""
-        return cls._create_log('WARNING', message, source, details, user, request)
+        return cls._create_log('WARNING', message, source, details, user, request, context)
     
     @classmethod
-    def log_error(cls, message, source='System', details=None, user=None, request=None):
+    def log_error(cls, message, source='System', details=None, user=None, request=None, **context):
         """Log an error message"""
-        return cls._create_log('ERROR', message, source, details, user, request)
+        return cls._create_log('ERROR', message, source, details, user, request, context)
     
     @classmethod
-    def log_debug(cls, message, source='System', details=None, user=None, request=None):
+    def log_debug(cls, message, source='System', details=None, user=None, request=None, **context):
         """Log a debug message"""
-        return cls._create_log('DEBUG', message, source, details, user, request)
+        return cls._create_log('DEBUG', message, source, details, user, request, context)
     
     @classmethod
-    def _create_log(cls, level, message, source, details, user, request):
-        """Create a log entry with optional request information"""
+    def _create_log(cls, level, message, source, details, user, request, context=None):
+        """
+        Create a log entry with optional request information.
+        Keyword context (``device_id=...``, ``alert=...``) is stored in the
+        indexed ``context`` field; when no details are given they are derived
+        from it, so the entry still reads well and stays full-text searchable.
+        The entry is handed to the batched log sink and written in the
+        background; it is only saved inline when APPLOG_ASYNC is off.
+        """
+        context = {key: value for key, value in (context or {}).items() if value is not None}
+        if details is None and context:
+            details = ', '.join(f"{key}={value}" for key, value in context.items())
         log_data = {
             'level': level,
             'message': message,
             'source': source,
             'details': details,
+            'context': context,
             'user': user,
         }
         
@@ -167,7 +214,13 @@ class AppLog(models.Model):
             log_data['ip_address'] = cls._get_client_ip(request)
             log_data['user_agent'] = request.META.get('HTTP_USER_AGENT', '')
         
-        return cls.objects.create(**log_data)
+        log = cls(**log_data)
+        sink = get_log_sink()
+        if sink is None:
+            log.save(force_insert=True)
+        else:
+            sink.submit(log)
+        return log
     
     @staticmethod
     def _get_client_ip(request):
@@ -177,4 +230,25 @@ class AppLog(models.Model):
             ip = x_forwarded_for.split(',')[0]
         else:
             ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+        return ip
+
+
+class AppLogDailyRollup(models.Model):
+    """
+    AppLog counts for one completed day, stored by the rollup_app_logs and
+    prune_app_logs commands (users/log_stats.py) while the day's logs are
+    complete. Rows outlive the logs they summarize, so stats for pruned days
+    stay available.
+    """
+    
+    date = models.DateField(primary_key=True)
+    total = models.PositiveIntegerField(default=0)
+    by_level = models.JSONField(default=dict)
+    by_source = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"{self.date} - {self.total} logs"
@@ -0,0 +1,119 @@
+import base64
+import json
+import uuid
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class AppLogKeysetPagination(BasePagination):
+    """
+    Keyset pagination over (timestamp, id), newest first.
+
+    Each page continues strictly after the last row of the previous one
+    through an opaque ``cursor``, so fetching page N costs the same as page 1
+    no matter how many logs exist. Page size comes from ``limit`` (default
+    100, max 1000). Search results can be ordered by relevance instead,
+    see :meth:`ranked`.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    ordering_query_param = 'ordering'
+    page_size = 100
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    @staticmethod
+    def encode_cursor(timestamp, pk):
+        raw = json.dumps([timestamp.isoformat(), str(pk)]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            timestamp, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            parsed = parse_datetime(timestamp)
+            if parsed is None:
+                raise ValueError(timestamp)
+            return parsed, uuid.UUID(pk)
+        except (TypeError, ValueError, json.JSONDecodeError):
+            raise ValidationError({'cursor': 'Invalid cursor'})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.base_queryset = queryset
+
+        if self.ranked(queryset, request):
+            # Relevance order has no stable key to continue from, so only the
+            # best matches are returned, as a single page
+            page = list(queryset.order_by('-search_rank', '-timestamp', '-id')[:self.page_size_value])
+            self.has_next, self.next_cursor = False, None
+            return page
+
+        queryset = queryset.order_by('-timestamp', '-id')
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            timestamp, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+
+        rows = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(rows) > self.page_size_value
+        page = rows[:self.page_size_value]
+        self.next_cursor = self.encode_cursor(page[-1].timestamp, page[-1].pk) if self.has_next else None
+        return page
+
+    def ranked(self, queryset, request):
+        return (
+            request.query_params.get(self.ordering_query_param) == 'relevance'
+            and 'search_rank' in queryset.query.annotations
+        )
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_first_link(self):
+        return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+    def estimated_total(self):
+        """
+        Approximate number of logs. An exact COUNT(*) scans the whole table, so
+        on PostgreSQL the planner's row estimate is used instead.
+        """
+        model = self.base_queryset.model
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return row[0]
+        return model.objects.count()
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'count': len(data),
+            'total_count': self.estimated_total(),
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'first': self.get_first_link(),
+        })
@@ -149,10 +149,10 @@ class AppLogSerializer(serializers.ModelSerializer):
         model = AppLog
         fields = [
             'id', 'timestamp', 'formatted_timestamp', 'level', 'message', 
-            'source', 'details', 'user_email', 'user_username', 
+            'source', 'details', 'context', 'user_email', 'user_username', 
             'ip_address', 'user_agent'
         ]
-        read_only_fields = ['id', 'timestamp', 'user_email', 'user_username', 'ip_address', 'user_agent']
+        read_only_fields = ['id', 'timestamp', 'context', 'user_email', 'user_username', 'ip_address', 'user_agent']
     
     def get_formatted_timestamp(self, obj):
         """Format timestamp for display"""
@@ -1,3 +1,53 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
-# Create your tests here.
+from .log_search import parse_query, search_logs, to_tsquery
+from .models import AppLog
+
+
+class SearchQueryTests(SimpleTestCase):
+    def test_terms_reach_postgres_as_typed(self):
+        # PostgreSQL's parser keeps these as single lexemes, as it did when indexing
+        self.assertEqual(to_tsquery(parse_query('foo@bar.com')), "'foo@bar.com':*")
+        self.assertEqual(
+            to_tsquery(parse_query('device.rate_limit 64.5')), "'device.rate_limit':* & '64.5':*"
+        )
+
+    def test_phrases_are_not_prefixes(self):
+        self.assertEqual(to_tsquery(parse_query('"Data recorded" disp*')), "'Data recorded' & 'disp':*")
+
+    def test_quotes_are_escaped(self):
+        self.assertEqual(to_tsquery(parse_query("o'brien")), "'o''brien':*")
+
+    def test_punctuation_only(self):
+        self.assertEqual(parse_query('@@ - *'), [])
+
+
+class SearchLogsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.email = AppLog.objects.create(
+            level='INFO', message='Password reset link sent to foo@bar.com', source='auth.password_reset'
+        )
+        cls.rate_limit = AppLog.objects.create(
+            level='WARNING', message='Device 12 exceeded the ingest rate limit', source='device.rate_limit'
+        )
+        cls.battery = AppLog.objects.create(
+            level='INFO', message='Battery at 64.5 percent', source='device.receive_device_data'
+        )
+
+    def search(self, text):
+        return set(search_logs(AppLog.objects.all(), text))
+
+    def test_email(self):
+        self.assertEqual(self.search('foo@bar.com'), {self.email})
+        self.assertEqual(self.search('foo@baz.com'), set())
+
+    def test_dotted_source(self):
+        self.assertEqual(self.search('device.rate_limit'), {self.rate_limit})
+
+    def test_decimal(self):
+        self.assertEqual(self.search('64.5'), {self.battery})
+        self.assertEqual(self.search('64.7'), set())
+
+    def test_prefix(self):
+        self.assertEqual(self.search('passw'), {self.email})
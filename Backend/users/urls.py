@@ -26,12 +26,14 @@ from users.views import (
     AdminLogsStatsView,
     export_logs_csv,
     export_logs_json,
+    export_logs_ndjson,
     export_logs_pdf,
 )
 
 urlpatterns = [
     path('admin/logs/export/csv/', export_logs_csv, name='admin_logs_export_csv'),
     path('admin/logs/export/json/', export_logs_json, name='admin_logs_export_json'),
+    path('admin/logs/export/ndjson/', export_logs_ndjson, name='admin_logs_export_ndjson'),
     path('admin/logs/export/pdf/', export_logs_pdf, name='admin_logs_export_pdf'),
     path('register/', RegisterView.as_view(), name='register'),
     path('user/', UserDetailView.as_view(), name='user_detail'),
@@ -28,6 +28,7 @@ from .logs import (
     AdminLogsStatsView,
     export_logs_csv,
     export_logs_json,
+    export_logs_ndjson,
     export_logs_pdf,
 )
 
@@ -57,5 +58,6 @@ __all__ = [
     'AdminLogsStatsView',
     'export_logs_csv',
     'export_logs_json',
+    'export_logs_ndjson',
     'export_logs_pdf',
 ]
\ No newline at end of file
@@ -15,6 +15,8 @@ export function useWebSocket() {
   const maxReconnectAttempts = 5;
   const isConnecting = useRef(false);
   const isMounted = useRef(true);
+  // Last realtime event seen, lets a reconnect replay only what was missed
+  const lastEventId = useRef(null);
 
   const { user, accessToken } = useAuth();
 
@@ -110,7 +112,10 @@ export function useWebSocket() {
 
       
 
-      ws.current = new WebSocket(`${WS_URL}?token=${accessToken}`);
+      const resumeFrom = lastEventId.current
+        ? `&last_event_id=${encodeURIComponent(lastEventId.current)}`
+        : '';
+      ws.current = new WebSocket(`${WS_URL}?token=${accessToken}${resumeFrom}`);
       setWebSocket(ws.current);
 
       ws.current.onopen = () => {
@@ -126,26 +131,45 @@ export function useWebSocket() {
           reconnectTimeoutRef.current = null;
         }
 
-        fetchNotifications(accessToken);
+        // When resuming, the server replays missed events instead
+        if (!lastEventId.current) {
+          fetchNotifications(accessToken);
+        }
       };
 
       ws.current.onmessage = (e) => {
         if (!isMounted.current) return;
         
         try {
-          const data = JSON.parse(e.data);
-          
+          const parsed = JSON.parse(e.data);
+          // The server coalesces bursts of events into a single array frame
+          const messages = Array.isArray(parsed) ? parsed : [parsed];
 
-          if (data.type === 'connection' || data.type === 'pong') {
-            return;
-          }
+          messages.forEach((data) => {
+            if (data.type === 'connection' || data.type === 'pong') {
+              return;
+            }
+
+            if (data.type === 'replay') {
+              lastEventId.current = data.last_event_id || lastEventId.current;
+              // Too much was missed to replay, reload the full list
+              if (data.status !== 'complete') {
+                fetchNotifications(accessToken);
+              }
+              return;
+            }
 
-          const notificationData = data.content || data;
+            const notificationData = data.content || data;
 
-          if (notificationData.id) {
-            addNotification(notificationData);
-            showLocalNotification(notificationData);
-          }
+            if (notificationData.event_id) {
+              lastEventId.current = notificationData.event_id;
+            }
+
+            if (notificationData.id) {
+              addNotification(notificationData);
+              showLocalNotification(notificationData);
+            }
+          });
         } catch (error) {
           
         }
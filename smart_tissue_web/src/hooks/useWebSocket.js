@@ -11,6 +11,8 @@ export function useWebSocket() {
   const maxReconnectAttempts = 5;
   const isConnecting = useRef(false);
   const isMounted = useRef(true);
+  // Last realtime event seen, lets a reconnect replay only what was missed
+  const lastEventId = useRef(null);
 
   const { user, accessToken } = useAuth();
 
@@ -83,7 +85,10 @@ export function useWebSocket() {
     try {
       // Always use trailing slash to match backend route
       const WS_URL = `${ws_web}/ws/notifications/`;
-      ws.current = new WebSocket(`${WS_URL}?token=${accessToken}`);
+      const resumeFrom = lastEventId.current
+        ? `&last_event_id=${encodeURIComponent(lastEventId.current)}`
+        : "";
+      ws.current = new WebSocket(`${WS_URL}?token=${accessToken}${resumeFrom}`);
       setWebSocket(ws.current);
 
       ws.current.onopen = () => {
@@ -98,25 +103,45 @@ export function useWebSocket() {
           reconnectTimeoutRef.current = null;
         }
 
-        fetchNotifications(accessToken);
+        // When resuming, the server replays missed events instead
+        if (!lastEventId.current) {
+          fetchNotifications(accessToken);
+        }
       };
 
       ws.current.onmessage = (e) => {
         if (!isMounted.current) return;
 
         try {
-          const data = JSON.parse(e.data);
+          const parsed = JSON.parse(e.data);
+          // The server coalesces bursts of events into a single array frame
+          const messages = Array.isArray(parsed) ? parsed : [parsed];
 
-          if (data.type === "connection" || data.type === "pong") {
-            return;
-          }
+          messages.forEach((data) => {
+            if (data.type === "connection" || data.type === "pong") {
+              return;
+            }
 
-          const notificationData = data.content || data;
+            if (data.type === "replay") {
+              lastEventId.current = data.last_event_id || lastEventId.current;
+              // Too much was missed to replay, reload the full list
+              if (data.status !== "complete") {
+                fetchNotifications(accessToken);
+              }
+              return;
+            }
 
-          if (notificationData.id) {
-            addNotification(notificationData);
-            // No push notification for web
-          }
+            const notificationData = data.content || data;
+
+            if (notificationData.event_id) {
+              lastEventId.current = notificationData.event_id;
+            }
+
+            if (notificationData.id) {
+              addNotification(notificationData);
+              // No push notification for web
+            }
+          });
         } catch (error) {
           console.error("WebSocket message parse error:", error);
         }